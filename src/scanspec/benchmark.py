@@ -0,0 +1,279 @@
+"""Load testing for the REST service.
+
+Replays a corpus of representative specs against each endpoint and format of
+the service and reports throughput, latency percentiles and peak RSS. Requests
+are either made in-process through the ASGI app, or against a running server.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import suppress
+from typing import Any, Dict, Iterable, List, Optional, cast
+
+import numpy as np
+from pydantic import Field
+from pydantic.dataclasses import dataclass
+
+from .regions import Circle
+from .specs import Line, Spec, Spiral
+
+__all__ = [
+    "BENCHMARK_SPECS",
+    "BenchmarkCase",
+    "BenchmarkResult",
+    "benchmark_cases",
+    "format_results",
+    "run_benchmark",
+]
+
+#: Representative specs, named by the kind of scan they make
+BENCHMARK_SPECS: Dict[str, Spec] = {
+    "line": Line("x", 0, 10, 100),
+    "grid": Line("y", 0, 10, 100) * ~Line("x", 0, 10, 100),
+    "masked grid": Line("y", 0, 10, 200) * ~Line("x", 0, 10, 200)
+    & Circle("x", "y", 5, 5, 4),
+    "spiral": Spiral.spaced("x", "y", 5, 5, 5, 0.05),
+    "tomography": Line("theta", 0, 180, 181) * ~Line("x", 0, 10, 50),
+}
+
+
+@dataclass
+class BenchmarkCase:
+    """A request to repeat against the service."""
+
+    name: str = Field(description="Spec, endpoint and format, to label results")
+    path: str = Field(description="The path of the endpoint, including any query")
+    body: Any = Field(description="The JSON body to post")
+    accept: str = Field(
+        description="The media type to accept", default="application/json"
+    )
+
+
+@dataclass
+class BenchmarkResult:
+    """How the service performed for one BenchmarkCase."""
+
+    name: str = Field(description="The name of the BenchmarkCase")
+    requests: int = Field(description="The number of requests made")
+    errors: int = Field(description="The number of requests that did not give 200")
+    seconds: float = Field(description="Wall clock time to make all the requests")
+    p50: float = Field(description="Median latency in seconds")
+    p90: float = Field(description="90th percentile latency in seconds")
+    p99: float = Field(description="99th percentile latency in seconds")
+    peak_rss: Optional[int] = Field(
+        description="Peak resident set size in bytes of the service while making "
+        "the requests, if known"
+    )
+
+    @property
+    def throughput(self) -> float:
+        """Requests per second."""
+        return self.requests / self.seconds
+
+
+def benchmark_cases(
+    specs: Optional[Dict[str, Spec]] = None, max_frames: int = 100000
+) -> List[BenchmarkCase]:
+    """Make a BenchmarkCase for each spec with each endpoint and format.
+
+    Args:
+        specs: Specs to make requests with, by default BENCHMARK_SPECS
+        max_frames: The max_frames to ask for points with
+
+    Returns:
+        The cases, in the order they should be run
+
+    >>> [case.name for case in benchmark_cases({"line": Line("x", 0, 1, 5)})]
+    ... # doctest: +NORMALIZE_WHITESPACE
+    ['line /valid', 'line /midpoints FLOAT_LIST', 'line /midpoints BASE64_ENCODED',
+     'line /midpoints binary', 'line /bounds BASE64_ENCODED', 'line /gap RUN_LENGTH',
+     'line /smalleststep']
+    """
+    from .service import BINARY_MEDIA_TYPE
+
+    cases = []
+    for name, spec in (BENCHMARK_SPECS if specs is None else specs).items():
+        serialized = spec.serialize()
+
+        points = {
+            format: {"spec": serialized, "max_frames": max_frames, "format": format}
+            for format in ("FLOAT_LIST", "BASE64_ENCODED")
+        }
+        cases += [
+            BenchmarkCase(f"{name} /valid", "/valid", serialized),
+            BenchmarkCase(
+                f"{name} /midpoints FLOAT_LIST", "/midpoints", points["FLOAT_LIST"]
+            ),
+            BenchmarkCase(
+                f"{name} /midpoints BASE64_ENCODED",
+                "/midpoints",
+                points["BASE64_ENCODED"],
+            ),
+            BenchmarkCase(
+                f"{name} /midpoints binary",
+                "/midpoints",
+                points["FLOAT_LIST"],
+                BINARY_MEDIA_TYPE,
+            ),
+            BenchmarkCase(
+                f"{name} /bounds BASE64_ENCODED", "/bounds", points["BASE64_ENCODED"]
+            ),
+            BenchmarkCase(
+                f"{name} /gap RUN_LENGTH", "/gap?format=RUN_LENGTH", serialized
+            ),
+            BenchmarkCase(f"{name} /smalleststep", "/smalleststep", serialized),
+        ]
+    return cases
+
+
+def run_benchmark(
+    cases: Iterable[BenchmarkCase],
+    url: Optional[str] = None,
+    requests: int = 100,
+    concurrency: int = 4,
+    warmup: int = 5,
+    pid: Optional[int] = None,
+) -> List[BenchmarkResult]:
+    """Make requests for each case, and measure how the service performs.
+
+    Each case is run in turn, so the results are per endpoint and format.
+    Repeating a case means later requests may be served from the caches of
+    the service, like a UI that asks for the same spec several times.
+
+    Args:
+        cases: What requests to make
+        url: The URL of a running service, if None then the requests are made
+            in-process to the service app
+        requests: The number of requests to make for each case
+        concurrency: The number of requests to have in flight at once
+        warmup: The number of requests to make for each case before measuring
+        pid: The process ID of the running service to measure the RSS of,
+            defaults to this process if url is None
+
+    Returns:
+        A result for each case
+    """
+    return asyncio.run(
+        _run_benchmark(list(cases), url, requests, concurrency, warmup, pid)
+    )
+
+
+async def _run_benchmark(
+    cases: List[BenchmarkCase],
+    url: Optional[str],
+    requests: int,
+    concurrency: int,
+    warmup: int,
+    pid: Optional[int],
+) -> List[BenchmarkResult]:
+    import httpx
+
+    # Don't log every request
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if url is None:
+        from .service import app
+
+        client = httpx.AsyncClient(
+            # Count exceptions from the app as errors rather than stopping
+            transport=httpx.ASGITransport(
+                app=cast(Any, app), raise_app_exceptions=False
+            ),
+            base_url="http://scanspec",
+        )
+        pid = os.getpid() if pid is None else pid
+    else:
+        client = httpx.AsyncClient(base_url=url, timeout=None)
+    results = []
+    async with client:
+        for case in cases:
+            await _make_requests(client, case, warmup, concurrency)
+            _reset_peak_rss(pid)
+            start = time.perf_counter()
+            latencies = await _make_requests(client, case, requests, concurrency)
+            seconds = time.perf_counter() - start
+            p50, p90, p99 = np.percentile(
+                [latency for latency, _ in latencies], [50, 90, 99]
+            )
+            results.append(
+                BenchmarkResult(
+                    case.name,
+                    requests,
+                    sum(status != 200 for _, status in latencies),
+                    seconds,
+                    p50,
+                    p90,
+                    p99,
+                    _peak_rss(pid),
+                )
+            )
+    return results
+
+
+async def _make_requests(
+    client: Any, case: BenchmarkCase, requests: int, concurrency: int
+) -> List[Any]:
+    # Each worker takes the next request until they are all made
+    remaining = iter(range(requests))
+    latencies = []
+
+    async def worker() -> None:
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await client.post(
+                case.path, json=case.body, headers={"Accept": case.accept}
+            )
+            latencies.append((time.perf_counter() - start, response.status_code))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+def _reset_peak_rss(pid: Optional[int]) -> None:
+    # Linux resets the peak RSS of a process when 5 is written to clear_refs
+    if pid is not None:
+        with suppress(OSError), open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+
+
+def _peak_rss(pid: Optional[int]) -> Optional[int]:
+    if pid is not None:
+        with suppress(OSError), open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    return None
+
+
+def format_results(results: List[BenchmarkResult]) -> str:
+    """Format results as a table, with latencies in ms and RSS in MiB.
+
+    >>> print(format_results([BenchmarkResult("grid /valid", 100, 0, 0.5,
+    ...     0.004, 0.006, 0.01, 100 * 1024 * 1024)]))
+    case         requests  errors  req/s  p50 ms  p90 ms  p99 ms  rss MiB
+    grid /valid       100       0  200.0    4.00    6.00   10.00    100.0
+    """
+    header = ["case", "requests", "errors", "req/s", "p50 ms", "p90 ms", "p99 ms"]
+    rows = [header + ["rss MiB"]]
+    for result in results:
+        rss = "-" if result.peak_rss is None else f"{result.peak_rss / 2**20:.1f}"
+        rows.append(
+            [
+                result.name,
+                str(result.requests),
+                str(result.errors),
+                f"{result.throughput:.1f}",
+                f"{result.p50 * 1000:.2f}",
+                f"{result.p90 * 1000:.2f}",
+                f"{result.p99 * 1000:.2f}",
+                rss,
+            ]
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header) + 1)]
+    lines = []
+    for row in rows:
+        cells = [row[0].ljust(widths[0])]
+        cells += [cell.rjust(width) for cell, width in zip(row[1:], widths[1:])]
+        lines.append("  ".join(cells))
+    return "\n".join(lines)
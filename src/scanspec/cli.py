@@ -45,11 +45,148 @@ def plot(spec: str):
 @click.option(
     "--port", default=8080, help="The port that the scanspec service will be hosted on."
 )
-def service(cors, port):
+@click.option(
+    "--workers",
+    default=1,
+    type=click.IntRange(1),
+    help="The number of processes to serve requests from.",
+)
+@click.option(
+    "--threads", default=4, help="The number of worker threads for calculating scans."
+)
+@click.option(
+    "--max-queued",
+    default=16,
+    help="The number of requests that can wait for a worker thread before the "
+    "service responds 503.",
+)
+@click.option(
+    "--timeout",
+    type=float,
+    help="The seconds a request can take before it is cancelled with a 504.",
+)
+@click.option(
+    "--frame-budget",
+    type=int,
+    help="The frames a request can generate before it is rejected with a 413.",
+)
+@click.option(
+    "--calculate-budget-mb",
+    type=int,
+    help="The MiB a spec is estimated to need to calculate before it is rejected "
+    "with a 413.",
+)
+@click.option(
+    "--dims-cache-mb",
+    default=512,
+    help="The MiB of calculated scans to keep for requests for the same spec.",
+)
+@click.option(
+    "--response-cache-mb",
+    default=256,
+    help="The MiB of responses to keep for repeated requests.",
+)
+@click.option(
+    "--compress/--no-compress",
+    default=True,
+    help="Whether to compress responses for clients that accept gzip or zstd.",
+)
+@click.option(
+    "--compress-min-bytes",
+    default=1024,
+    help="The size in bytes of the smallest response to compress.",
+)
+@click.option(
+    "--compress-level",
+    default=1,
+    type=click.IntRange(1, 9),
+    help="The gzip or zstd level to compress with.",
+)
+@click.option(
+    "--dims-store",
+    type=click.Path(file_okay=False),
+    help="A directory to share calculated scans between processes in, by "
+    "default a temporary one if there is more than one worker.",
+)
+@click.option(
+    "--dims-store-mb",
+    default=2048,
+    help="The MiB of calculated scans to keep in the dims store.",
+)
+def service(
+    cors,
+    port,
+    workers,
+    threads,
+    max_queued,
+    timeout,
+    frame_budget,
+    calculate_budget_mb,
+    dims_cache_mb,
+    response_cache_mb,
+    compress,
+    compress_min_bytes,
+    compress_level,
+    dims_store,
+    dims_store_mb,
+):
     """Run up a REST service."""
-    from scanspec.service import run_app
+    from scanspec.service import ServiceSettings, run_app
+
+    settings = ServiceSettings(
+        workers=threads,
+        max_queued=max_queued,
+        timeout=timeout,
+        frame_budget=frame_budget,
+        calculate_budget=calculate_budget_mb and calculate_budget_mb * 1024 * 1024,
+        dims_cache_bytes=dims_cache_mb * 1024 * 1024,
+        response_cache_bytes=response_cache_mb * 1024 * 1024,
+        compress_min_bytes=compress_min_bytes if compress else None,
+        compress_level=compress_level,
+        dims_store=dims_store,
+        dims_store_bytes=dims_store_mb * 1024 * 1024,
+    )
+    run_app(cors, port, settings, workers)
+
+
+@cli.command()
+@click.option(
+    "--url",
+    help="The URL of a running service, by default requests are made in-process.",
+)
+@click.option("--requests", default=100, help="The requests to make for each case.")
+@click.option(
+    "--concurrency", default=4, help="The requests to have in flight at once."
+)
+@click.option(
+    "--warmup", default=5, help="The requests to make before measuring each case."
+)
+@click.option(
+    "--max-frames", default=100000, help="The max_frames to ask for points with."
+)
+@click.option(
+    "--pid",
+    type=int,
+    help="The process ID of the service at --url, to measure its peak RSS.",
+)
+@click.option(
+    "--spec",
+    "specs",
+    multiple=True,
+    help="A spec to benchmark instead of the built in corpus, can be repeated.",
+)
+def benchmark(url, requests, concurrency, warmup, max_frames, pid, specs):
+    """Measure throughput and latency of the REST service."""
+    from scanspec.benchmark import benchmark_cases, format_results, run_benchmark
 
-    run_app(cors, port)
+    for letter in string.ascii_lowercase:
+        locals()[letter] = letter
+    corpus = {}
+    for spec in specs:
+        corpus[spec] = eval(spec)
+    cases = benchmark_cases(corpus or None, max_frames)
+    results = run_benchmark(cases, url, requests, concurrency, warmup, pid)
+    click.echo(format_results(results))
 
 
 @cli.command()
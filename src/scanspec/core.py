@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from dataclasses import field
+from functools import partial
 from typing import (
     Any,
     Callable,
@@ -11,6 +12,7 @@ from typing import (
     List,
     Optional,
     Sequence,
+    Tuple,
     Type,
     TypeVar,
     Union,
@@ -19,6 +21,7 @@ from typing import (
 import numpy as np
 from pydantic import BaseConfig, Extra, Field, ValidationError, create_model
 from pydantic.error_wrappers import ErrorWrapper
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON, ModelField
 from typing_extensions import Literal
 
 __all__ = [
@@ -54,6 +57,9 @@ def discriminated_union_of_subclasses(
     the type. Raw JSON should look like {"type": <type name>, params for
     <type name>...}.
     Add validation methods to super_cls so it can be parsed by pydantic.parse_obj_as.
+    Dicts whose fields already have the right types are parsed by dispatching
+    directly on the discriminator, anything else is left to a pydantic model of
+    the union so that it makes the same errors.
 
     Example::
 
@@ -136,6 +142,8 @@ def _discriminated_union_of_subclasses(
 ) -> Union[Type, Callable[[Type], Type]]:
     super_cls._ref_classes = set()
     super_cls._model = None
+    super_cls._discriminator = discriminator
+    super_cls._parsers = None
 
     def __init_subclass__(cls) -> None:
         # Keep track of inherting classes in super class
@@ -153,6 +161,12 @@ def _discriminated_union_of_subclasses(
         yield cls.__validate__
 
     def __validate__(cls, v: Any) -> Any:
+        try:
+            return _parse_fast(cls, v)
+        except _SlowPath:
+            # Let pydantic parse it, or make the error
+            pass
+
         # Lazily initialize model on first use because this
         # needs to be done once, after all subclasses have been
         # declared
@@ -185,6 +199,140 @@ def _discriminated_union_of_subclasses(
     return super_cls
 
 
+class _SlowPath(Exception):
+    """Raised when only the pydantic model can parse the input."""
+
+
+#: Parses the value of a field like pydantic, or raises _SlowPath
+_FieldParser = Callable[[Any], Any]
+
+
+def _make_parsers(
+    ref_classes: Iterable[Type], discriminator: str
+) -> Dict[str, Optional[Tuple[Type, List[Tuple[ModelField, _FieldParser]]]]]:
+    # For each discriminator value, the class and parsers for its fields
+    parsers: Dict[str, Any] = {}
+    for cls in ref_classes:
+        fields = _field_parsers(cls, discriminator)
+        parsers[cls.__name__] = None if fields is None else (cls, fields)
+    return parsers
+
+
+def _field_parsers(
+    cls: Type, discriminator: str
+) -> Optional[List[Tuple[ModelField, _FieldParser]]]:
+    # None if any of the fields can't be parsed without pydantic
+    model = getattr(cls, "__pydantic_model__", None)
+    if (
+        model is None
+        or hasattr(cls, "__post_init__")
+        or model.__pre_root_validators__
+        or model.__post_root_validators__
+    ):
+        return None
+    fields = []
+    for model_field in model.__fields__.values():
+        parser = _field_parser(model_field, discriminator)
+        if parser is None:
+            return None
+        fields.append((model_field, parser))
+    return fields
+
+
+def _field_parser(field: ModelField, discriminator: str) -> Optional[_FieldParser]:
+    if field.class_validators:
+        return None
+    elif field.name == discriminator:
+        # Already matched by the dispatch on the discriminator
+        return _parse_any
+    elif field.shape == SHAPE_LIST and field.type_ is float:
+        return _parse_float_list
+    elif field.type_ is Any:
+        # Like an Axis, which can be anything
+        return _parse_any
+    elif "_ref_classes" in getattr(field.type_, "__dict__", {}):
+        # The superclass of another discriminated union
+        return partial(_parse_fast, field.type_)
+    elif field.shape != SHAPE_SINGLETON:
+        return None
+    return _LEAF_PARSERS.get(field.outer_type_)
+
+
+def _parse_fast(union_cls: Type, v: Any) -> Any:
+    # Dispatch on the discriminator, and construct without revalidating fields
+    if type(v) is not dict:
+        raise _SlowPath()
+    if union_cls._parsers is None:
+        # Lazily initialize on first use, after all subclasses have been declared
+        union_cls._parsers = _make_parsers(
+            union_cls._ref_classes, union_cls._discriminator
+        )
+    discriminator = v.get(union_cls._discriminator)
+    # Only str can match, and others like lists can't be looked up
+    parser = type(discriminator) is str and union_cls._parsers.get(discriminator)
+    if not parser:
+        raise _SlowPath()
+    cls, fields = parser
+    values = {}
+    found = 0
+    for model_field, parse in fields:
+        name = model_field.name
+        if name in v:
+            values[name] = parse(v[name])
+            found += 1
+        elif model_field.required:
+            raise _SlowPath()
+        else:
+            values[name] = model_field.get_default()
+    if found != len(v):
+        # Extra fields are forbidden
+        raise _SlowPath()
+    obj = object.__new__(cls)
+    obj.__dict__.update(values)
+    object.__setattr__(obj, "__pydantic_initialised__", True)
+    if hasattr(obj, "__post_init_post_parse__"):
+        try:
+            obj.__post_init_post_parse__()
+        except (ValueError, TypeError, AssertionError) as e:
+            raise _SlowPath() from e
+    return obj
+
+
+def _parse_any(v: Any) -> Any:
+    return v
+
+
+def _parse_float(v: Any) -> float:
+    if type(v) is float:
+        return v
+    elif type(v) is int:
+        return float(v)
+    raise _SlowPath()
+
+
+def _parse_float_list(v: Any) -> List[float]:
+    if type(v) is not list:
+        raise _SlowPath()
+    return [_parse_float(x) for x in v]
+
+
+def _parse_exact(tp: Type) -> _FieldParser:
+    def parse(v: Any) -> Any:
+        if type(v) is not tp:
+            raise _SlowPath()
+        return v
+
+    return parse
+
+
+_LEAF_PARSERS: Dict[Any, _FieldParser] = {
+    float: _parse_float,
+    int: _parse_exact(int),
+    bool: _parse_exact(bool),
+    str: _parse_exact(str),
+}
+
+
 def if_instance_do(x: Any, cls: Type, func: Callable):
     """If x is of type cls then return func(x), otherwise return NotImplemented.
 
@@ -0,0 +1,314 @@
+"""A compact binary encoding of serialized specs.
+
+Much smaller than JSON for large polygons and long concats, and faster to
+decode. An encoded spec is::
+
+    b"SCSP" | version: u8 | number of strings: varint | strings | root value
+
+Strings are referred to by a varint index. The first indexes are the names of
+the types and fields of specs and regions, and common axes, in a table built
+in to each version of the encoding. The strings that follow are each written
+once as their varint length and UTF-8 bytes, however many times they are used.
+Each value is a 1 byte tag followed by:
+
+- None, False, True: nothing
+- int: a zigzag varint
+- float: a zigzag varint if it is a whole number, otherwise a little-endian
+  float64
+- str: the varint index of the string
+- list: a varint length followed by that many values
+- float list: a varint length followed by that many little-endian float64
+- dict: a varint length followed by that many pairs of string index and value
+
+Versioning: types and fields are referred to by name rather than by a fixed
+tag, so decoding gives the same dictionary JSON would, which is then validated
+by `Spec.deserialize`. Adding new specs, regions or fields does not change the
+encoding, their names are just written in the strings rather than being in the
+built in table. The version byte is only increased if the encoding or built in
+table change, and decoding a version newer than `ENCODING_VERSION` raises a
+ValueError rather than guessing.
+"""
+
+import math
+import struct
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+__all__ = ["ENCODING_VERSION", "decode", "encode"]
+
+#: The first bytes of every encoded spec
+MAGIC = b"SCSP"
+
+#: The version of the encoding written by `encode`
+ENCODING_VERSION = 1
+
+# The tag before each value
+_NONE = 0
+_FALSE = 1
+_TRUE = 2
+_INT = 3
+_FLOAT = 4
+_WHOLE_FLOAT = 5
+_STR = 6
+_LIST = 7
+_FLOATS = 8
+_DICT = 9
+
+_DOUBLE = struct.Struct("<d")
+
+# The strings built in to version 1, never change them without a new version
+_BUILTIN_STRINGS = (
+    # Types
+    "Concat",
+    "Line",
+    "Mask",
+    "Product",
+    "Repeat",
+    "Snake",
+    "Spiral",
+    "Squash",
+    "Static",
+    "Zip",
+    "Circle",
+    "CombinationOf",
+    "DifferenceOf",
+    "Ellipse",
+    "EncodedPolygon",
+    "IntersectionOf",
+    "Polygon",
+    "Range",
+    "Rectangle",
+    "SymmetricDifferenceOf",
+    "UnionOf",
+    # Fields
+    "left",
+    "right",
+    "gap",
+    "check_path_changes",
+    "type",
+    "axis",
+    "start",
+    "stop",
+    "num",
+    "spec",
+    "region",
+    "outer",
+    "inner",
+    "x_axis",
+    "y_axis",
+    "x_start",
+    "y_start",
+    "x_range",
+    "y_range",
+    "rotate",
+    "value",
+    "x_middle",
+    "y_middle",
+    "radius",
+    "x_radius",
+    "y_radius",
+    "angle",
+    "x_verts",
+    "y_verts",
+    "min",
+    "max",
+    "x_min",
+    "y_min",
+    "x_max",
+    "y_max",
+    # Axes
+    "x",
+    "y",
+    "z",
+    "DURATION",
+)
+_BUILTIN_INDEXES = {string: i for i, string in enumerate(_BUILTIN_STRINGS)}
+
+
+def encode(obj: Any) -> bytes:
+    """Encode a serialized spec, or any JSON compatible object, into bytes.
+
+    Args:
+        obj: The dictionary returned by `Spec.serialize`
+
+    Returns:
+        The encoded bytes, that `decode` turns back into obj
+
+    >>> from scanspec.specs import Line
+    >>> encoded = encode(Line("x", 0, 1.5, 5).serialize())
+    >>> len(encoded)
+    30
+    >>> decode(encoded)
+    {'axis': 'x', 'start': 0.0, 'stop': 1.5, 'num': 5, 'type': 'Line'}
+    """
+    strings = dict(_BUILTIN_INDEXES)
+    body = bytearray()
+    _encode_value(obj, body, strings)
+    out = bytearray(MAGIC)
+    out.append(ENCODING_VERSION)
+    _write_varint(len(strings) - len(_BUILTIN_STRINGS), out)
+    for string in list(strings)[len(_BUILTIN_STRINGS) :]:
+        data = string.encode()
+        _write_varint(len(data), out)
+        out += data
+    out += body
+    return bytes(out)
+
+
+def decode(data: bytes) -> Any:
+    """Decode bytes made by `encode`.
+
+    Args:
+        data: The encoded bytes
+
+    Returns:
+        The serialized spec, to be passed to `Spec.deserialize`
+
+    Raises:
+        ValueError: If data is not a whole encoded spec, or is a newer version
+    """
+    data = bytes(data)
+    if data[:4] != MAGIC:
+        raise ValueError("Not an encoded spec")
+    version = data[4] if len(data) > 4 else 0
+    if not 1 <= version <= ENCODING_VERSION:
+        raise ValueError(
+            f"Spec encoding version {version} is not supported, "
+            f"only up to {ENCODING_VERSION}"
+        )
+    try:
+        num_strings, pos = _read_varint(data, 5)
+        strings = list(_BUILTIN_STRINGS)
+        for _ in range(num_strings):
+            length, pos = _read_varint(data, pos)
+            strings.append(data[pos : pos + length].decode())
+            pos += length
+        obj, pos = _decode_value(data, pos, strings)
+    except (IndexError, struct.error, RecursionError) as e:
+        # RecursionError if values are nested deeper than encode could have made
+        raise ValueError("Truncated or corrupt encoded spec") from e
+    if pos != len(data):
+        raise ValueError(f"{len(data) - pos} unexpected bytes after encoded spec")
+    return obj
+
+
+def _write_varint(value: int, out: bytearray) -> None:
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _write_int(value: int, out: bytearray) -> None:
+    # Zigzag so small negative numbers are small too
+    _write_varint(value * 2 if value >= 0 else -value * 2 - 1, out)
+
+
+def _encode_value(value: Any, out: bytearray, strings: Dict[str, int]) -> None:
+    cls = type(value)
+    if cls is dict:
+        out.append(_DICT)
+        _write_varint(len(value), out)
+        for k, v in value.items():
+            if type(k) is not str:
+                raise TypeError(f"Can only encode str keys, not {k!r}")
+            _write_varint(strings.setdefault(k, len(strings)), out)
+            _encode_value(v, out, strings)
+    elif cls is str:
+        out.append(_STR)
+        _write_varint(strings.setdefault(value, len(strings)), out)
+    elif cls is bool:
+        out.append(_TRUE if value else _FALSE)
+    elif cls is int:
+        out.append(_INT)
+        _write_int(value, out)
+    elif isinstance(value, float):
+        # Including subclasses like np.float64, as JSON does
+        if value.is_integer() and abs(value) < 2**53 and math.copysign(1, value) > 0:
+            out.append(_WHOLE_FLOAT)
+            _write_int(int(value), out)
+        else:
+            out.append(_FLOAT)
+            out += _DOUBLE.pack(value)
+    elif cls is list or cls is tuple:
+        if value and all(isinstance(v, float) for v in value):
+            out.append(_FLOATS)
+            _write_varint(len(value), out)
+            out += np.array(value, dtype="<f8").tobytes()
+        else:
+            out.append(_LIST)
+            _write_varint(len(value), out)
+            for v in value:
+                _encode_value(v, out, strings)
+    elif value is None:
+        out.append(_NONE)
+    else:
+        raise TypeError(f"Can't encode {value!r}")
+
+
+def _decode_value(data: bytes, pos: int, strings: List[str]) -> Tuple[Any, int]:
+    # Tags and varints of most values are a single byte, so check for those
+    # first before calling _read_varint
+    tag = data[pos]
+    pos += 1
+    if tag == _DICT:
+        length = data[pos]
+        pos += 1
+        if length >= 0x80:
+            length, pos = _read_varint(data, pos - 1)
+        obj = {}
+        for _ in range(length):
+            index = data[pos]
+            pos += 1
+            if index >= 0x80:
+                index, pos = _read_varint(data, pos - 1)
+            obj[strings[index]], pos = _decode_value(data, pos, strings)
+        return obj, pos
+    elif tag == _STR:
+        index = data[pos]
+        if index >= 0x80:
+            index, pos = _read_varint(data, pos)
+            return strings[index], pos
+        return strings[index], pos + 1
+    elif tag == _INT or tag == _WHOLE_FLOAT:
+        zigzag = data[pos]
+        pos += 1
+        if zigzag >= 0x80:
+            zigzag, pos = _read_varint(data, pos - 1)
+        value = zigzag >> 1 if zigzag & 1 == 0 else -(zigzag >> 1) - 1
+        return (value if tag == _INT else float(value)), pos
+    elif tag == _FLOAT:
+        return _DOUBLE.unpack_from(data, pos)[0], pos + 8
+    elif tag == _FLOATS:
+        length, pos = _read_varint(data, pos)
+        end = pos + length * 8
+        if end > len(data):
+            raise IndexError(end)
+        return np.frombuffer(data, dtype="<f8", count=length, offset=pos).tolist(), end
+    elif tag == _LIST:
+        length, pos = _read_varint(data, pos)
+        values = []
+        for _ in range(length):
+            value, pos = _decode_value(data, pos, strings)
+            values.append(value)
+        return values, pos
+    elif tag == _NONE:
+        return None, pos
+    elif tag == _FALSE:
+        return False, pos
+    elif tag == _TRUE:
+        return True, pos
+    else:
+        raise ValueError(f"Unknown tag {tag} in encoded spec")
@@ -1,6 +1,23 @@
 from __future__ import annotations
 
-from typing import Generic, Iterator, List, Set
+import base64
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import (
+    Dict,
+    Generic,
+    Hashable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
 import numpy as np
 from pydantic import BaseModel, Field
@@ -9,6 +26,7 @@ from pydantic.dataclasses import dataclass
 from .core import (
     AxesPoints,
     Axis,
+    Frames,
     StrictConfig,
     discriminated_union_of_subclasses,
     if_instance_do,
@@ -17,6 +35,11 @@ from .core import (
 __all__ = [
     "Region",
     "get_mask",
+    "MASK_CHUNK_SIZE",
+    "set_mask_threads",
+    "MaskCache",
+    "set_mask_cache",
+    "PointIndex",
     "CombinationOf",
     "UnionOf",
     "IntersectionOf",
@@ -25,6 +48,7 @@ __all__ = [
     "Range",
     "Rectangle",
     "Polygon",
+    "EncodedPolygon",
     "Circle",
     "Ellipse",
     "find_regions",
@@ -51,6 +75,15 @@ class Region(Generic[Axis]):
         """Produce a mask of which points are in the region."""
         raise NotImplementedError(self)
 
+    def bounding_box(self) -> Dict[Axis, Tuple[float, float]]:
+        """Produce inclusive {axis: (min, max)} limits of points in the region.
+
+        Axes the region does not limit are omitted, so the default of an empty
+        dictionary is always correct, if unhelpful. Used by `PointIndex` to
+        avoid masking points that cannot be in the region.
+        """
+        return {}
+
     def __or__(self, other) -> UnionOf[Axis]:
         return if_instance_do(other, Region, lambda o: UnionOf(self, o))
 
@@ -64,18 +97,412 @@ class Region(Generic[Axis]):
         return if_instance_do(other, Region, lambda o: SymmetricDifferenceOf(self, o))
 
 
-def get_mask(region: Region[Axis], points: AxesPoints[Axis]) -> np.ndarray:
+#: Number of points masked in each chunk when masking on multiple threads. The
+#: float64 temporaries a Region creates for a chunk this size fit in L2 cache
+MASK_CHUNK_SIZE = 16384
+
+# Default number of threads used by get_mask, see set_mask_threads
+_mask_threads = 1
+
+# Pool of _mask_threads threads shared by get_mask calls, made when first needed
+_mask_executor: Optional[ThreadPoolExecutor] = None
+_mask_executor_lock = threading.Lock()
+
+# The MaskCache get_mask consults, see set_mask_cache
+_mask_cache: Optional[MaskCache] = None
+
+# Set while a thread is masking a temporary subset of points, like a chunk for
+# _threaded_mask, as these will never be seen again so are not worth caching
+_subset_state = threading.local()
+
+
+@contextmanager
+def _masking_subset():
+    previous = getattr(_subset_state, "active", False)
+    _subset_state.active = True
+    try:
+        yield
+    finally:
+        _subset_state.active = previous
+
+
+def set_mask_threads(num_threads: int) -> None:
+    """Set the default number of threads `get_mask` uses to mask points.
+
+    With more than one thread, points are split into chunks of `MASK_CHUNK_SIZE`
+    that are masked concurrently. NumPy releases the GIL for the element-wise
+    operations of a mask, so this scales with the number of cores. The threads
+    are started when first needed and shared by all calls to get_mask.
+
+    Args:
+        num_threads: The number of threads to use, 1 means mask in the calling
+            thread without chunking
+    """
+    global _mask_threads, _mask_executor
+    assert num_threads >= 1, f"Need at least one thread, got {num_threads}"
+    with _mask_executor_lock:
+        if num_threads != _mask_threads and _mask_executor is not None:
+            # Masks already submitted to the old pool still finish
+            _mask_executor.shutdown(wait=False)
+            _mask_executor = None
+        _mask_threads = num_threads
+
+
+def get_mask(
+    region: Region[Axis],
+    points: AxesPoints[Axis],
+    num_threads: Optional[int] = None,
+) -> np.ndarray:
     """Return a mask of the points inside the region.
 
     If there is an overlap of axes of region and points return a
     mask of the points in the region, otherwise return all ones
+
+    Args:
+        region: The Region to mask with
+        points: The points to mask
+        num_threads: If more than 1, mask chunks of points on this many threads.
+            Defaults to the value passed to `set_mask_threads`
+
+    >>> r = Range("x", 1, 2)
+    >>> get_mask(r, {"x": np.array([0, 1, 2, 3, 4])}, num_threads=2)
+    array([False,  True,  True, False, False])
     """
     axes = set(points)
     needs_mask = any(ks & axes for ks in region.axis_sets())
-    if needs_mask:
-        return region.mask(points)
-    else:
+    if not needs_mask:
         return np.ones(len(list(points.values())[0]))
+    cache = None if getattr(_subset_state, "active", False) else _mask_cache
+    if cache is not None:
+        mask = cache.lookup(region, points)
+        if mask is not None:
+            return mask
+    if num_threads is None:
+        num_threads = _mask_threads
+    num_points = len(next(iter(points.values())))
+    if num_threads > 1 and num_points > MASK_CHUNK_SIZE:
+        mask = _threaded_mask(region, points, num_points, num_threads)
+    else:
+        mask = region.mask(points)
+    if cache is not None:
+        mask = cache.store(region, points, mask)
+    return mask
+
+
+def _threaded_mask(
+    region: Region[Axis],
+    points: AxesPoints[Axis],
+    num_points: int,
+    num_threads: int,
+) -> np.ndarray:
+    global _mask_executor
+
+    # Each chunk is no bigger than MASK_CHUNK_SIZE, so the get_mask calls that
+    # CombinationOf makes on them will not spawn threads of their own
+    def mask_chunk(start: int) -> np.ndarray:
+        end = start + MASK_CHUNK_SIZE
+        with _masking_subset():
+            return region.mask({axis: v[start:end] for axis, v in points.items()})
+
+    starts = range(0, num_points, MASK_CHUNK_SIZE)
+    if num_threads != _mask_threads:
+        # Only the default number of threads has a shared pool
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            return np.concatenate(list(executor.map(mask_chunk, starts)))
+    # Submit while holding the lock so set_mask_threads can't shut the pool down
+    with _mask_executor_lock:
+        if _mask_executor is None:
+            _mask_executor = ThreadPoolExecutor(
+                max_workers=_mask_threads, thread_name_prefix="mask"
+            )
+        chunks = _mask_executor.map(mask_chunk, starts)
+    return np.concatenate(list(chunks))
+
+
+# Weakrefs to the points a mask was calculated from, and the mask
+_CacheEntry = Tuple[Optional[List[weakref.ref]], np.ndarray]
+
+
+class MaskCache:
+    """Least recently used cache of the masks `get_mask` produces.
+
+    Masks are keyed on the repr of the Region, which includes all its
+    parameters and those of its children, and on the point arrays that were
+    masked. As `get_mask` is called on each child of a `CombinationOf`,
+    changing one child of a large combination only re-evaluates that child
+    and the combinations that contain it.
+
+    Args:
+        max_bytes: Evict the least recently used masks when the masks held
+            take up more than this many bytes
+        hash_points: If False, point arrays are matched by identity, so masks
+            are only reused for the very same array objects, which should not
+            be modified in place. If True, they are matched by a hash of their
+            contents, so masks are reused across recalculations of the same
+            points at the cost of hashing each array once
+
+    Cached masks are returned read-only.
+
+    >>> cache = MaskCache()
+    >>> set_mask_cache(cache)
+    >>> points = {"x": np.array([0, 1, 2, 3, 4])}
+    >>> get_mask(Range("x", 1, 2) | Range("x", 3, 3), points)
+    array([False,  True,  True,  True, False])
+    >>> get_mask(Range("x", 1, 2) | Range("x", 4, 4), points)
+    array([False,  True,  True, False,  True])
+    >>> cache.hits, cache.misses
+    (1, 5)
+    >>> set_mask_cache(None)
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, hash_points=False):
+        #: The maximum number of bytes of masks to hold
+        self.max_bytes = max_bytes
+        #: Whether point arrays are matched by a hash of their contents
+        self.hash_points = hash_points
+        #: The number of lookups that found a mask
+        self.hits = 0
+        #: The number of lookups that did not find a mask
+        self.misses = 0
+        #: The number of bytes of masks currently held
+        self.nbytes = 0
+        # {(region_repr, points_key): (weakrefs to points if needed, mask)}
+        self._entries: OrderedDict[Hashable, _CacheEntry] = OrderedDict()
+        # {id(array): (weakref to array, hash of contents)}
+        self._digests: Dict[int, Tuple[weakref.ref, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """The number of masks held in the cache."""
+        return len(self._entries)
+
+    def lookup(
+        self, region: Region[Axis], points: AxesPoints[Axis]
+    ) -> Optional[np.ndarray]:
+        """Return the cached mask of points in region, or None if not present."""
+        key = self._key(region, points)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                refs, mask = entry
+                if refs is None or all(
+                    ref() is arr for ref, arr in zip(refs, points.values())
+                ):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return mask
+                # The points this mask was calculated for are gone
+                self._evict(key)
+            self.misses += 1
+            return None
+
+    def store(
+        self, region: Region[Axis], points: AxesPoints[Axis], mask: np.ndarray
+    ) -> np.ndarray:
+        """Add mask of points in region to the cache, returning it read-only."""
+        mask.flags.writeable = False
+        key = self._key(region, points)
+        refs = None
+        if not self.hash_points:
+            # Matched by id, so check the arrays are still alive on lookup
+            refs = [weakref.ref(arr) for arr in points.values()]
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = (refs, mask)
+            self.nbytes += mask.nbytes
+            while self.nbytes > self.max_bytes and self._entries:
+                self._evict(next(iter(self._entries)))
+        return mask
+
+    def clear(self) -> None:
+        """Remove all masks from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self._digests.clear()
+            self.nbytes = 0
+
+    def _evict(self, key: Hashable) -> None:
+        _, mask = self._entries.pop(key)
+        self.nbytes -= mask.nbytes
+
+    def _key(self, region: Region[Axis], points: AxesPoints[Axis]) -> Hashable:
+        if self.hash_points:
+            return repr(region), tuple((a, self._digest(v)) for a, v in points.items())
+        else:
+            return repr(region), tuple((a, id(v)) for a, v in points.items())
+
+    def _digest(self, arr: np.ndarray) -> bytes:
+        # Only hash each array once, remembering the hash while it is alive
+        with self._lock:
+            ref_digest = self._digests.get(id(arr))
+        if ref_digest is not None and ref_digest[0]() is arr:
+            return ref_digest[1]
+        h = hashlib.blake2b(f"{arr.dtype}{arr.shape}".encode(), digest_size=16)
+        h.update(np.ascontiguousarray(arr).data)
+        digest = h.digest()
+        key = id(arr)
+        with self._lock:
+            self._digests[key] = (
+                weakref.ref(arr, lambda _: self._digests.pop(key, None)),
+                digest,
+            )
+        return digest
+
+
+def set_mask_cache(cache: Optional[MaskCache]) -> None:
+    """Set the `MaskCache` that `get_mask` will look up masks in.
+
+    Args:
+        cache: The cache to use, or None to stop caching masks
+    """
+    global _mask_cache
+    _mask_cache = cache
+
+
+class PointIndex(Generic[Axis]):
+    """A spatial index of points over two of their axes for fast masking.
+
+    Points are hashed into a uniform grid of cells over their x and y extent,
+    so `get_mask` only needs to mask the points in cells that overlap the
+    `Region.bounding_box`. Building the index is a sort of the points, so it
+    pays for itself when the same points are masked by many Regions that are
+    small compared to the scan area.
+
+    Args:
+        points: The points to index, all axes are kept for masking
+        x_axis: The first axis to index on
+        y_axis: The second axis to index on
+        points_per_cell: The average number of points in each cell
+
+    >>> index = PointIndex({"x": np.arange(5.0), "y": np.zeros(5)}, "x", "y")
+    >>> index.get_mask(Range("x", 1, 2))
+    array([False,  True,  True, False, False])
+    """
+
+    def __init__(
+        self,
+        points: AxesPoints[Axis],
+        x_axis: Axis,
+        y_axis: Axis,
+        points_per_cell: int = 16,
+    ):
+        #: The points that are indexed
+        self.points = points
+        #: The axes the points are indexed on
+        self.axes = [x_axis, y_axis]
+        num_points = len(points[x_axis])
+        cells_per_axis = max(int(np.sqrt(num_points / points_per_cell)), 1)
+        self._cells_per_axis = cells_per_axis
+        self._origins, self._cell_sizes, cell_indexes = [], [], []
+        for axis in self.axes:
+            v = points[axis]
+            origin = v.min() if num_points else 0.0
+            extent = v.max() - origin if num_points else 0.0
+            cell_size = extent / cells_per_axis or 1.0
+            self._origins.append(origin)
+            self._cell_sizes.append(cell_size)
+            cell_indexes.append(self._cell_index(v, origin, cell_size))
+        cells = cell_indexes[1] * cells_per_axis + cell_indexes[0]
+        # Points sorted by cell, and where each cell starts in that order
+        self._order = np.argsort(cells, kind="stable")
+        self._starts = np.searchsorted(
+            cells[self._order], np.arange(cells_per_axis * cells_per_axis + 1)
+        )
+
+    @classmethod
+    def from_frames(
+        cls, frames: Frames[Axis], x_axis: Axis, y_axis: Axis, points_per_cell=16
+    ) -> PointIndex[Axis]:
+        """Index the midpoints of a `Frames` object."""
+        return cls(frames.midpoints, x_axis, y_axis, points_per_cell)
+
+    def _cell_index(self, v, origin: float, cell_size: float) -> np.ndarray:
+        cell_index = np.floor((v - origin) / cell_size).astype(np.intp)
+        return np.clip(cell_index, 0, self._cells_per_axis - 1)
+
+    def candidates(self, bounding_box: Dict[Axis, Tuple[float, float]]) -> np.ndarray:
+        """Return sorted indices of the points that could be in bounding_box.
+
+        Args:
+            bounding_box: {axis: (min, max)} limits, as returned by
+                `Region.bounding_box`. Missing axes are not limited
+        """
+        ranges = []
+        for axis, origin, cell_size in zip(self.axes, self._origins, self._cell_sizes):
+            if axis in bounding_box:
+                lo, hi = bounding_box[axis]
+                if lo > hi:
+                    return np.array([], dtype=np.intp)
+                # Pad by a fraction of a cell so rounding can't lose points on
+                # the edge of the box
+                first, last = np.floor(
+                    (np.array([lo, hi]) - origin) / cell_size + [-1e-6, 1e-6]
+                )
+                first, last = max(int(first), 0), int(last)
+                last = min(last, self._cells_per_axis - 1)
+                if first > last:
+                    return np.array([], dtype=np.intp)
+                ranges.append((first, last))
+            else:
+                ranges.append((0, self._cells_per_axis - 1))
+        (x_first, x_last), (y_first, y_last) = ranges
+        # Cells are numbered along x, so each row of cells is contiguous
+        rows = np.arange(y_first, y_last + 1) * self._cells_per_axis
+        slices = [
+            self._order[self._starts[row + x_first] : self._starts[row + x_last + 1]]
+            for row in rows
+        ]
+        return np.sort(np.concatenate(slices)) if slices else np.array([], np.intp)
+
+    def get_mask(self, region: Region[Axis]) -> np.ndarray:
+        """Return a mask of the indexed points inside the region.
+
+        Equivalent to ``get_mask(region, index.points)``, but only masks the
+        points in cells that overlap the bounding box of the region.
+        """
+        bounding_box = region.bounding_box()
+        if not any(axis in bounding_box for axis in self.axes):
+            return get_mask(region, self.points)
+        cache = None if getattr(_subset_state, "active", False) else _mask_cache
+        if cache is not None:
+            mask = cache.lookup(region, self.points)
+            if mask is not None:
+                return mask
+        indices = self.candidates(bounding_box)
+        with _masking_subset():
+            subset = {axis: v[indices] for axis, v in self.points.items()}
+            inside = get_mask(region, subset)
+        mask = np.zeros(len(self.points[self.axes[0]]), dtype=inside.dtype)
+        mask[indices] = inside
+        if cache is not None:
+            mask = cache.store(region, self.points, mask)
+        return mask
+
+
+def _union_boxes(
+    *boxes: Dict[Axis, Tuple[float, float]],
+) -> Dict[Axis, Tuple[float, float]]:
+    # Only axes limited in all boxes are limited in the union
+    axes = set.intersection(*(set(box) for box in boxes))
+    return {
+        axis: (min(box[axis][0] for box in boxes), max(box[axis][1] for box in boxes))
+        for axis in axes
+    }
+
+
+def _intersect_boxes(
+    *boxes: Dict[Axis, Tuple[float, float]],
+) -> Dict[Axis, Tuple[float, float]]:
+    # Axes limited in any box are limited in the intersection
+    axes = set.union(*(set(box) for box in boxes))
+    return {
+        axis: (
+            max(box[axis][0] for box in boxes if axis in box),
+            min(box[axis][1] for box in boxes if axis in box),
+        )
+        for axis in axes
+    }
 
 
 def _merge_axis_sets(axis_sets: List[Set[Axis]]) -> Iterator[Set[Axis]]:
@@ -123,6 +550,9 @@ class UnionOf(CombinationOf[Axis]):
         mask = get_mask(self.left, points) | get_mask(self.right, points)
         return mask
 
+    def bounding_box(self) -> Dict[Axis, Tuple[float, float]]:
+        return _union_boxes(self.left.bounding_box(), self.right.bounding_box())
+
 
 @dataclass(config=StrictConfig)
 class IntersectionOf(CombinationOf[Axis]):
@@ -139,6 +569,9 @@ class IntersectionOf(CombinationOf[Axis]):
         mask = get_mask(self.left, points) & get_mask(self.right, points)
         return mask
 
+    def bounding_box(self) -> Dict[Axis, Tuple[float, float]]:
+        return _intersect_boxes(self.left.bounding_box(), self.right.bounding_box())
+
 
 @dataclass(config=StrictConfig)
 class DifferenceOf(CombinationOf[Axis]):
@@ -157,6 +590,9 @@ class DifferenceOf(CombinationOf[Axis]):
         mask = left_mask ^ get_mask(self.right, points) & left_mask
         return mask
 
+    def bounding_box(self) -> Dict[Axis, Tuple[float, float]]:
+        return self.left.bounding_box()
+
 
 @dataclass(config=StrictConfig)
 class SymmetricDifferenceOf(CombinationOf[Axis]):
@@ -173,6 +609,9 @@ class SymmetricDifferenceOf(CombinationOf[Axis]):
         mask = get_mask(self.left, points) ^ get_mask(self.right, points)
         return mask
 
+    def bounding_box(self) -> Dict[Axis, Tuple[float, float]]:
+        return _union_boxes(self.left.bounding_box(), self.right.bounding_box())
+
 
 @dataclass(config=StrictConfig)
 class Range(Region[Axis]):
@@ -195,6 +634,9 @@ class Range(Region[Axis]):
         mask = np.bitwise_and(v >= self.min, v <= self.max)
         return mask
 
+    def bounding_box(self) -> Dict[Axis, Tuple[float, float]]:
+        return {self.axis: (self.min, self.max)}
+
 
 @dataclass(config=StrictConfig)
 class Rectangle(Region[Axis]):
@@ -223,18 +665,34 @@ class Rectangle(Region[Axis]):
         return [{self.x_axis, self.y_axis}]
 
     def mask(self, points: AxesPoints[Axis]) -> np.ndarray:
-        x = points[self.x_axis] - self.x_min
-        y = points[self.y_axis] - self.y_min
-        if self.angle != 0:
-            # Rotate src points by -angle
-            phi = np.radians(-self.angle)
-            rx = x * np.cos(phi) - y * np.sin(phi)
-            ry = x * np.sin(phi) + y * np.cos(phi)
-            x = rx
-            y = ry
-        mask_x = np.bitwise_and(x >= 0, x <= (self.x_max - self.x_min))
-        mask_y = np.bitwise_and(y >= 0, y <= (self.y_max - self.y_min))
-        return mask_x & mask_y
+        x, y = points[self.x_axis], points[self.y_axis]
+        width, height = self.x_max - self.x_min, self.y_max - self.y_min
+        mask = np.empty(len(x), dtype=np.bool_)
+        inside = np.empty(MASK_CHUNK_SIZE, dtype=np.bool_)
+        chunks = _rotated_chunks(x, y, self.x_min, self.y_min, self.angle)
+        for chunk, rx, ry in chunks:
+            out, flag = mask[chunk], inside[: len(rx)]
+            # out = (rx >= 0) & (rx <= width) & (ry >= 0) & (ry <= height)
+            np.greater_equal(rx, 0, out=out)
+            np.less_equal(rx, width, out=flag)
+            out &= flag
+            np.greater_equal(ry, 0, out=flag)
+            out &= flag
+            np.less_equal(ry, height, out=flag)
+            out &= flag
+        return mask
+
+    def bounding_box(self) -> Dict[Axis, Tuple[float, float]]:
+        # Rotate the corners by angle about (x_min, y_min)
+        phi = np.radians(self.angle)
+        x = np.array([0, 1, 0, 1]) * (self.x_max - self.x_min)
+        y = np.array([0, 0, 1, 1]) * (self.y_max - self.y_min)
+        rx = self.x_min + x * np.cos(phi) - y * np.sin(phi)
+        ry = self.y_min + x * np.sin(phi) + y * np.cos(phi)
+        return {
+            self.x_axis: (float(rx.min()), float(rx.max())),
+            self.y_axis: (float(ry.min()), float(ry.max())),
+        }
 
 
 @dataclass(config=StrictConfig)
@@ -263,21 +721,118 @@ class Polygon(Region[Axis]):
         return [{self.x_axis, self.y_axis}]
 
     def mask(self, points: AxesPoints[Axis]) -> np.ndarray:
-        x = points[self.x_axis]
-        y = points[self.y_axis]
-        v1x, v1y = self.x_verts[-1], self.y_verts[-1]
-        mask = np.full(len(x), False, dtype=np.int8)
-        for v2x, v2y in zip(self.x_verts, self.y_verts):
-            # skip horizontal edges
-            if v2y != v1y:
-                vmask = np.full(len(x), False, dtype=np.int8)
-                vmask |= (y < v2y) & (y >= v1y)
-                vmask |= (y < v1y) & (y >= v2y)
-                t = (y - v1y) / (v2y - v1y)
-                vmask &= x < v1x + t * (v2x - v1x)
-                mask ^= vmask
-            v1x, v1y = v2x, v2y
-        return mask
+        return _polygon_mask(
+            points[self.x_axis], points[self.y_axis], self.x_verts, self.y_verts
+        )
+
+    def bounding_box(self) -> Dict[Axis, Tuple[float, float]]:
+        return {
+            self.x_axis: (min(self.x_verts), max(self.x_verts)),
+            self.y_axis: (min(self.y_verts), max(self.y_verts)),
+        }
+
+
+@dataclass(config=StrictConfig)
+class EncodedPolygon(Region[Axis]):
+    """A `Polygon` with its vertices packed into base64 strings.
+
+    Each vertex array is the base64 encoding of its coordinates as little-endian
+    float64. This is much more compact than a JSON list for polygons with
+    thousands of vertices, and is decoded straight into NumPy arrays rather
+    than being validated element by element. Typically created with
+    `EncodedPolygon.from_verts`.
+
+    >>> r = EncodedPolygon.from_verts("x", "y", [0, 2, 2, 0], [0, 0, 2, 2])
+    >>> r.x_verts
+    'AAAAAAAAAAAAAAAAAAAAQAAAAAAAAABAAAAAAAAAAAA='
+    >>> r.mask({"x": np.array([1, 3]), "y": np.array([1, 1])})
+    array([1, 0], dtype=int8)
+    """
+
+    x_axis: Axis = Field(description="The name matching the x axis of the spec")
+    y_axis: Axis = Field(description="The name matching the y axis of the spec")
+    x_verts: str = Field(
+        description="Base64 encoded little-endian float64 x coordinates of the "
+        "polygons vertices"
+    )
+    y_verts: str = Field(
+        description="Base64 encoded little-endian float64 y coordinates of the "
+        "polygons vertices"
+    )
+
+    def __post_init_post_parse__(self):
+        # Decode once on creation so masking does not need to
+        self._x_verts = _decode_verts(self.x_verts)
+        self._y_verts = _decode_verts(self.y_verts)
+        if len(self._x_verts) != len(self._y_verts):
+            raise ValueError(
+                f"Mismatching vertex lengths "
+                f"{len(self._x_verts)} != {len(self._y_verts)}"
+            )
+
+    @classmethod
+    def from_verts(
+        cls,
+        x_axis: Axis = Field(description="The name matching the x axis of the spec"),
+        y_axis: Axis = Field(description="The name matching the y axis of the spec"),
+        x_verts: Sequence[float] = Field(
+            description="The Nx1 x coordinates of the polygons vertices"
+        ),
+        y_verts: Sequence[float] = Field(
+            description="The Nx1 y coordinates of the polygons vertices"
+        ),
+    ) -> EncodedPolygon[Axis]:
+        """Encode vertex coordinates into an EncodedPolygon."""
+        return cls(x_axis, y_axis, _encode_verts(x_verts), _encode_verts(y_verts))
+
+    def axis_sets(self) -> List[Set[Axis]]:
+        return [{self.x_axis, self.y_axis}]
+
+    def mask(self, points: AxesPoints[Axis]) -> np.ndarray:
+        return _polygon_mask(
+            points[self.x_axis], points[self.y_axis], self._x_verts, self._y_verts
+        )
+
+    def bounding_box(self) -> Dict[Axis, Tuple[float, float]]:
+        return {
+            self.x_axis: (float(self._x_verts.min()), float(self._x_verts.max())),
+            self.y_axis: (float(self._y_verts.min()), float(self._y_verts.max())),
+        }
+
+
+def _encode_verts(verts: Sequence[float]) -> str:
+    return base64.b64encode(np.asarray(verts, dtype="<f8").tobytes()).decode()
+
+
+def _decode_verts(encoded: str) -> np.ndarray:
+    data = base64.b64decode(encoded, validate=True)
+    if len(data) % 8:
+        raise ValueError(f"{len(data)} bytes is not a whole number of float64")
+    verts = np.frombuffer(data, dtype="<f8")
+    if len(verts) < 3:
+        raise ValueError(f"A polygon needs at least 3 vertices, got {len(verts)}")
+    return verts
+
+
+def _polygon_mask(
+    x: np.ndarray,
+    y: np.ndarray,
+    x_verts: Sequence[float],
+    y_verts: Sequence[float],
+) -> np.ndarray:
+    v1x, v1y = x_verts[-1], y_verts[-1]
+    mask = np.full(len(x), False, dtype=np.int8)
+    for v2x, v2y in zip(x_verts, y_verts):
+        # skip horizontal edges
+        if v2y != v1y:
+            vmask = np.full(len(x), False, dtype=np.int8)
+            vmask |= (y < v2y) & (y >= v1y)
+            vmask |= (y < v1y) & (y >= v2y)
+            t = (y - v1y) / (v2y - v1y)
+            vmask &= x < v1x + t * (v2x - v1x)
+            mask ^= vmask
+        v1x, v1y = v2x, v2y
+    return mask
 
 
 @dataclass(config=StrictConfig)
@@ -308,6 +863,12 @@ class Circle(Region[Axis]):
         mask = x * x + y * y <= (self.radius * self.radius)
         return mask
 
+    def bounding_box(self) -> Dict[Axis, Tuple[float, float]]:
+        return {
+            self.x_axis: (self.x_middle - self.radius, self.x_middle + self.radius),
+            self.y_axis: (self.y_middle - self.radius, self.y_middle + self.radius),
+        }
+
 
 @dataclass(config=StrictConfig)
 class Ellipse(Region[Axis]):
@@ -338,18 +899,66 @@ class Ellipse(Region[Axis]):
         return [{self.x_axis, self.y_axis}]
 
     def mask(self, points: AxesPoints[Axis]) -> np.ndarray:
-        x = points[self.x_axis] - self.x_middle
-        y = points[self.y_axis] - self.y_middle
-        if self.angle != 0:
-            # Rotate src points by -angle
-            phi = np.radians(-self.angle)
-            tx = x * np.cos(phi) - y * np.sin(phi)
-            ty = x * np.sin(phi) + y * np.cos(phi)
-            x = tx
-            y = ty
-        mask = (x / self.x_radius) ** 2 + (y / self.y_radius) ** 2 <= 1
+        x, y = points[self.x_axis], points[self.y_axis]
+        mask = np.empty(len(x), dtype=np.bool_)
+        chunks = _rotated_chunks(x, y, self.x_middle, self.y_middle, self.angle)
+        for chunk, rx, ry in chunks:
+            # mask = (rx / x_radius) ** 2 + (ry / y_radius) ** 2 <= 1
+            np.divide(rx, self.x_radius, out=rx)
+            np.square(rx, out=rx)
+            np.divide(ry, self.y_radius, out=ry)
+            np.square(ry, out=ry)
+            np.add(rx, ry, out=rx)
+            np.less_equal(rx, 1, out=mask[chunk])
         return mask
 
+    def bounding_box(self) -> Dict[Axis, Tuple[float, float]]:
+        # Half widths of the box around an ellipse rotated by angle
+        phi = np.radians(self.angle)
+        half_x = np.hypot(self.x_radius * np.cos(phi), self.y_radius * np.sin(phi))
+        half_y = np.hypot(self.x_radius * np.sin(phi), self.y_radius * np.cos(phi))
+        return {
+            self.x_axis: (self.x_middle - half_x, self.x_middle + half_x),
+            self.y_axis: (self.y_middle - half_y, self.y_middle + half_y),
+        }
+
+
+def _rotated_chunks(
+    x: np.ndarray, y: np.ndarray, x_origin: float, y_origin: float, angle: float
+) -> Iterator[Tuple[slice, np.ndarray, np.ndarray]]:
+    """Yield chunks of points relative to an origin, rotated by -angle degrees.
+
+    The rotated x and y arrays are work buffers no larger than `MASK_CHUNK_SIZE`
+    that are reused for every chunk, so the caller is free to overwrite them,
+    but must not keep a reference to them between chunks.
+    """
+    size = max(min(len(x), MASK_CHUNK_SIZE), 1)
+    dx, dy = np.empty(size), np.empty(size)
+    if angle != 0:
+        phi = np.radians(-angle)
+        cos, sin = np.cos(phi), np.sin(phi)
+        rx, ry = np.empty(size), np.empty(size)
+    for start in range(0, len(x), size):
+        chunk = slice(start, start + size)
+        cx, cy = x[chunk], y[chunk]
+        tx, ty = dx[: len(cx)], dy[: len(cx)]
+        np.subtract(cx, x_origin, out=tx)
+        np.subtract(cy, y_origin, out=ty)
+        if angle != 0:
+            # Rotate src points by -angle:
+            # rx = tx * cos - ty * sin
+            # ry = tx * sin + ty * cos
+            ox, oy = rx[: len(cx)], ry[: len(cx)]
+            np.multiply(tx, cos, out=ox)
+            np.multiply(ty, sin, out=oy)
+            np.subtract(ox, oy, out=ox)
+            np.multiply(tx, sin, out=oy)
+            np.multiply(ty, cos, out=tx)
+            np.add(oy, tx, out=oy)
+            yield chunk, ox, oy
+        else:
+            yield chunk, tx, ty
+
 
 def find_regions(obj) -> Iterator[Region[Axis]]:
     """Recursively yield Regions from obj and its children."""
@@ -1,19 +1,83 @@
+import asyncio
 import base64
+import hashlib
 import json
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+from contextvars import ContextVar
+from dataclasses import asdict, fields, replace
 from enum import Enum
-from typing import List, Mapping, Optional, Tuple, Union
+from functools import partial
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+    cast,
+)
 
+import anyio.to_thread
 import numpy as np
-from fastapi import Body, FastAPI
+import orjson
+from fastapi import (
+    Body,
+    FastAPI,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
-from fastapi.responses import JSONResponse
-from pydantic import Field
+from fastapi.responses import (
+    ORJSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
+from pydantic import Field, PositiveInt, ValidationError, parse_obj_as
 from pydantic.dataclasses import dataclass
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from scanspec.core import AxesPoints, Frames, Path, SnakedFrames
 
-from scanspec.core import AxesPoints, Frames, Path
+from ._version import __version__
+from .specs import DURATION, DimSize, Line, Spec, Static
 
-from .specs import Line, Spec
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # Not available on Windows
+    fcntl = None  # type: ignore
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    # zstd is only offered if it is installed, gzip is always available
+    zstandard = None  # type: ignore
 
 app = FastAPI()
 
@@ -25,6 +89,22 @@ app = FastAPI()
 #: A set of points, that can be returned in various formats
 Points = Union[str, List[float]]
 
+#: Media type to put in the Accept header to get points in binary, see
+#: `decode_binary_points` for the layout
+BINARY_MEDIA_TYPE = "application/octet-stream"
+
+_BINARY_RESPONSES: Dict[Union[int, str], Dict[str, Any]] = {
+    200: {
+        "content": {BINARY_MEDIA_TYPE: {}},
+        "description": "Points in binary if requested in the Accept header",
+    }
+}
+
+_ACCEPT_HEADER = Header(
+    None,
+    description=f"Send {BINARY_MEDIA_TYPE} to get points as raw float64 arrays",
+)
+
 
 @dataclass
 class ValidResponse:
@@ -32,6 +112,16 @@ class ValidResponse:
 
     input_spec: Spec = Field(description="The input scanspec")
     valid_spec: Spec = Field(description="The validated version of the spec")
+    shape: Optional[List[int]] = Field(
+        description="Number of frames in each dimension, or the most there could "
+        "be if the spec has a Region, if details were requested",
+        default=None,
+    )
+    duration: Optional[float] = Field(
+        description="The duration of every frame, if details were requested and "
+        "it is the same for all of them",
+        default=None,
+    )
 
 
 class PointsFormat(str, Enum):
@@ -56,6 +146,30 @@ class PointsRequest:
         description="The format in which to output the points data",
         default=PointsFormat.FLOAT_LIST,
     )
+    start: Optional[int] = Field(
+        description="Index of the first frame to return. If start or num are "
+        "given then a page of the full resolution scan is returned rather than "
+        "a downsampled scan, capped by max_frames",
+        default=None,
+        ge=0,
+    )
+    num: Optional[int] = Field(
+        description="The number of frames in the page, if None will return up "
+        "to the end of the scan",
+        default=None,
+        ge=0,
+    )
+
+
+@dataclass
+class StreamRequest(PointsRequest):
+    """A request for generated scan points, streamed in chunks."""
+
+    chunk_frames: int = Field(
+        description="The maximum number of frames in each chunk of the stream",
+        default=10000,
+        gt=0,
+    )
 
 
 @dataclass
@@ -65,7 +179,7 @@ class GeneratedPointsResponse:
     total_frames: int = Field(description="Total number of frames in spec")
     returned_frames: int = Field(
         description="Total of number of frames in this response, may be "
-        "less than total_frames due to downsampling etc."
+        "less than total_frames due to downsampling, paging etc."
     )
     format: PointsFormat = Field(description="Format of returned point data")
 
@@ -91,6 +205,14 @@ class BoundsResponse(GeneratedPointsResponse):
     )
 
 
+class GapFormat(str, Enum):
+    """Formats in which we can return gaps."""
+
+    BOOL_LIST = "BOOL_LIST"
+    RUN_LENGTH = "RUN_LENGTH"
+    GAP_INDICES = "GAP_INDICES"
+
+
 @dataclass
 class GapResponse:
     """Presence of gaps in a generated scan."""
@@ -100,6 +222,125 @@ class GapResponse:
     )
 
 
+@dataclass
+class GapRunLengthResponse:
+    """Presence of gaps in a generated scan, run length encoded."""
+
+    total_frames: int = Field(description="Total number of frames in spec")
+    runs: List[int] = Field(
+        description="Lengths of runs of frames, alternating between runs without "
+        "and runs with a gap before each frame, starting without. The first "
+        "run is 0 if the first frame has a gap"
+    )
+
+
+@dataclass
+class GapIndicesResponse:
+    """Presence of gaps in a generated scan, as the frames that have them."""
+
+    total_frames: int = Field(description="Total number of frames in spec")
+    indices: List[int] = Field(
+        description="Indices of the frames that have a gap before them"
+    )
+
+
+class BatchOperation(str, Enum):
+    """Operations that can be done on a spec in a batch."""
+
+    VALID = "valid"
+    SHAPE = "shape"
+    MIDPOINTS = "midpoints"
+    BOUNDS = "bounds"
+    GAP = "gap"
+    SMALLEST_STEP = "smalleststep"
+
+
+@dataclass
+class BatchItem(PointsRequest):
+    """One operation on one spec in a batch request."""
+
+    operation: BatchOperation = Field(
+        description="The operation to do, named after the equivalent route",
+        default=BatchOperation.MIDPOINTS,
+    )
+
+
+@dataclass
+class BatchRequest:
+    """A request for many operations on many specs."""
+
+    items: List[BatchItem] = Field(
+        description="The operations to do, max_frames, format, start and num "
+        "are ignored except by midpoints and bounds"
+    )
+
+
+@dataclass
+class BatchResult:
+    """The result of one operation in a batch request."""
+
+    index: int = Field(description="Index of the operation in the request")
+    operation: BatchOperation = Field(description="The operation that was done")
+    status: int = Field(
+        description="The status code the equivalent route would have returned"
+    )
+    result: Optional[Dict[str, Any]] = Field(
+        description="The response the equivalent route would have returned if "
+        "status is 200. For shape it is {'shape': [len(dim), ...]}",
+        default=None,
+    )
+    detail: Optional[str] = Field(
+        description="What went wrong if status is not 200", default=None
+    )
+
+
+@dataclass
+class CacheStats:
+    """Size and effectiveness of a server-side cache."""
+
+    entries: int = Field(description="Number of entries in the cache")
+    nbytes: int = Field(description="Bytes used by the entries in the cache")
+    max_bytes: int = Field(description="Bytes the entries may use before eviction")
+    hits: int = Field(description="Number of lookups that found an entry")
+    misses: int = Field(description="Number of lookups that didn't find an entry")
+    hit_rate: float = Field(description="Fraction of lookups that found an entry")
+
+
+@dataclass
+class CacheStatsResponse:
+    """Statistics for each of the server-side caches."""
+
+    dims: CacheStats = Field(
+        description="Cache of calculated dims, shared between requests for the "
+        "same spec"
+    )
+    responses: CacheStats = Field(
+        description="Cache of whole responses, for requests that are repeated"
+    )
+
+
+@dataclass
+class EstimateResponse:
+    """What it would cost to calculate a spec, worked out without calculating it."""
+
+    shape: List[int] = Field(
+        description="Number of frames in each dimension, or the most there could "
+        "be if exact is False"
+    )
+    exact: bool = Field(description="False if a Region may remove some frames")
+    total_frames: int = Field(
+        description="Number of frames in the scan, or the most there could be"
+    )
+    dims_bytes: int = Field(
+        description="Bytes needed to hold the calculated dimensions, which is "
+        "checked against the calculate budget"
+    )
+    path_bytes: int = Field(
+        description="Bytes needed to generate every frame of the scan with its "
+        "bounds at once"
+    )
+
+
 @dataclass
 class SmallestStepResponse:
     """Information about the smallest steps between points in a spec."""
@@ -112,6 +353,597 @@ class SmallestStepResponse:
     )
 
 
+#
+# Worker Pool
+#
+
+
+@dataclass
+class ServiceSettings:
+    """Limits on how the service uses its worker pool, caches and bandwidth.
+
+    /midpoints, /midpoints/stream, /bounds, /gap and /smalleststep calculate on
+    a pool of worker threads, separate from the one FastAPI uses for the other
+    routes, so a few huge specs cannot hold up /valid.
+    """
+
+    workers: int = Field(
+        description="The number of worker threads for the heavy routes",
+        default=4,
+        gt=0,
+    )
+    max_queued: int = Field(
+        description="The number of requests that can wait for a worker, any "
+        "more get a 503 response",
+        default=16,
+        ge=0,
+    )
+    timeout: Optional[float] = Field(
+        description="The seconds a request can take before it is cancelled "
+        "with a 504 response, if None there is no limit",
+        default=None,
+        gt=0,
+    )
+    frame_budget: Optional[int] = Field(
+        description="The frames a request can generate before it is rejected "
+        "with a 413 response, if None there is no limit",
+        default=None,
+        gt=0,
+    )
+    calculate_budget: Optional[int] = Field(
+        description="The bytes of dims a spec can calculate before it is "
+        "rejected with a 413 response, checked against an estimate before "
+        "calculating, if None there is no limit",
+        default=None,
+        gt=0,
+    )
+    dims_cache_bytes: int = Field(
+        description="The bytes of calculated dims to keep for reuse by later "
+        "requests for the same spec, a quarter as much again is used for "
+        "the edges of downsampled dims",
+        default=512 * 1024 * 1024,
+        ge=0,
+    )
+    response_cache_bytes: int = Field(
+        description="The bytes of responses to keep for identical requests",
+        default=256 * 1024 * 1024,
+        ge=0,
+    )
+    compress_min_bytes: Optional[int] = Field(
+        description="The smallest response in bytes to compress for clients "
+        "that accept gzip or zstd, if None responses are never compressed",
+        default=1024,
+        ge=0,
+    )
+    compress_level: int = Field(
+        description="The gzip or zstd level to compress with, higher levels "
+        "are smaller but slower",
+        default=1,
+        ge=1,
+        le=9,
+    )
+    dims_store: Optional[str] = Field(
+        description="A directory to store calculated dims in as memory-mapped "
+        "files, so service processes sharing it only calculate each spec once, "
+        "if None dims are only shared within this process",
+        default=None,
+    )
+    dims_store_bytes: int = Field(
+        description="The bytes of files to keep in dims_store, the least "
+        "recently used are deleted to make room for new ones",
+        default=2 * 1024 * 1024 * 1024,
+        ge=0,
+    )
+
+
+_settings = ServiceSettings()
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+#: The store of dims shared with other processes, if settings.dims_store is set
+_dims_store: Optional["_DimsStore"] = None
+#: Requests that have been given to the pool and not finished
+_in_pool = 0
+
+# How often to check whether the client has gone while waiting for a worker
+_POLL_INTERVAL = 0.05
+
+T = TypeVar("T")
+V = TypeVar("V")
+
+
+def set_service_settings(settings: ServiceSettings) -> None:
+    """Use these settings for subsequent requests to the heavy routes.
+
+    The worker pool is replaced, requests already in the old pool are allowed
+    to finish. The caches are resized, evicting entries that no longer fit.
+
+    Args:
+        settings: The limits to apply
+    """
+    global _settings, _executor, _dims_store
+    with _executor_lock:
+        _settings = settings
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False)
+    if settings.dims_store is None:
+        _dims_store = None
+    else:
+        _dims_store = _DimsStore(settings.dims_store, settings.dims_store_bytes)
+    _dims_cache.resize(settings.dims_cache_bytes)
+    _edges_cache.resize(settings.dims_cache_bytes // 4)
+    _response_cache.resize(settings.response_cache_bytes)
+
+
+class _Cancelled(Exception):
+    """Raised in a worker when the request it is working on has gone away."""
+
+
+class _Job:
+    """Cancellation and budget shared between a route and its worker.
+
+    The worker calls check() between stages of its calculation, so it stops
+    soon after the route gives up on it.
+    """
+
+    def __init__(self, frame_budget: Optional[int]):
+        self.frame_budget = frame_budget
+        self.cancelled = threading.Event()
+
+    def check(self) -> None:
+        if self.cancelled.is_set():
+            raise _Cancelled()
+
+    def check_frames(self, num_frames: int) -> None:
+        self.check()
+        if self.frame_budget is not None and num_frames > self.frame_budget:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Request would generate {num_frames} frames, more than "
+                f"the budget of {self.frame_budget}",
+            )
+
+
+async def _run_heavy(http_request: Optional[Request], func: Callable[[_Job], T]) -> T:
+    """Run func in the worker pool, cancelling it if the request goes away.
+
+    Args:
+        http_request: The request that is waiting for the result, None if the
+            caller notices disconnection itself
+        func: The calculation to run, taking a _Job to check
+
+    Raises:
+        HTTPException: 503 if the pool is full, 504 if the timeout is reached
+
+    Returns:
+        T: The result of func
+    """
+    global _executor, _in_pool
+    with _executor_lock:
+        settings = _settings
+        if _in_pool >= settings.workers + settings.max_queued:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many requests in progress, try again later",
+                headers={"Retry-After": "1"},
+            )
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                settings.workers, thread_name_prefix="scanspec-worker"
+            )
+        _in_pool += 1
+        job = _Job(settings.frame_budget)
+        future = asyncio.wrap_future(_executor.submit(_run_job, func, job))
+    loop = asyncio.get_running_loop()
+    if settings.timeout is None:
+        deadline = None
+    else:
+        deadline = loop.time() + settings.timeout
+    try:
+        while True:
+            done, _ = await asyncio.wait({future}, timeout=_POLL_INTERVAL)
+            if done:
+                return future.result()
+            if deadline is not None and loop.time() > deadline:
+                raise HTTPException(
+                    status_code=504,
+                    detail=f"Request took longer than {settings.timeout}s",
+                )
+            if http_request and await http_request.is_disconnected():
+                # Nobody will see this, but it stops us waiting
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        job.cancelled.set()
+        # If we stopped waiting, nobody will see the result, so don't log it
+        future.add_done_callback(_discard_result)
+
+
+def _run_job(func: Callable[[_Job], T], job: _Job) -> T:
+    global _in_pool
+    try:
+        job.check()  # in case it was cancelled while queued
+        return func(job)
+    finally:
+        with _executor_lock:
+            _in_pool -= 1
+
+
+def _discard_result(future: asyncio.Future) -> None:
+    if not future.cancelled():
+        future.exception()
+
+
+#
+# Metrics
+#
+
+#: Upper bounds in seconds of the buckets of the latency histograms
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+#: The perf_counter time the current request reached the service
+_request_start: ContextVar[Optional[float]] = ContextVar("_request_start", default=None)
+
+
+class _Counter:
+    """A Prometheus counter with a value for each combination of labels."""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def exposition(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                labels = _format_labels(zip(self.labels, label_values))
+                lines.append(f"{self.name}{labels} {value}")
+        return lines
+
+
+class _Histogram:
+    """A Prometheus histogram of durations in each of LATENCY_BUCKETS, by label."""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        # For each combination of labels, the count in each bucket, then the
+        # count above the last bucket, then the sum of the durations
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, *label_values: str, seconds: float) -> None:
+        index = bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            values = self._values.get(label_values)
+            if values is None:
+                values = self._values[label_values] = [0] * (len(LATENCY_BUCKETS) + 2)
+            values[index] += 1
+            values[-1] += seconds
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def exposition(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for label_values, values in items:
+            pairs = list(zip(self.labels, label_values))
+            count = 0
+            for bound, bucket in zip(LATENCY_BUCKETS + (float("inf"),), values):
+                count += int(bucket)
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = _format_labels(pairs + [("le", le)])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(pairs)
+            lines.append(f"{self.name}_sum{labels} {values[-1]}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def _format_labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    """Format labels for the Prometheus text exposition format.
+
+    >>> _format_labels([("route", "/gap"), ("le", "0.5")])
+    '{route="/gap",le="0.5"}'
+    >>> _format_labels([])
+    ''
+    """
+    labels = ",".join(
+        '{}="{}"'.format(
+            name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for name, value in pairs
+    )
+    return f"{{{labels}}}" if labels else ""
+
+
+_requests_total = _Counter(
+    "scanspec_requests_total",
+    "Requests handled, by route, method and status code",
+    ("route", "method", "status"),
+)
+_request_duration = _Histogram(
+    "scanspec_request_duration_seconds",
+    "Time from receiving a request to sending the end of its response, by route",
+    ("route",),
+)
+_response_bytes_total = _Counter(
+    "scanspec_response_bytes_total",
+    "Bytes of response bodies sent, by route",
+    ("route",),
+)
+_stage_duration = _Histogram(
+    "scanspec_stage_duration_seconds",
+    "Time spent in each stage of making responses: deserialize (reading and "
+    "validating the request), calculate, consume, downsample, encode and "
+    "compress",
+    ("stage",),
+)
+_frames_total = _Counter(
+    "scanspec_frames_generated_total", "Frames consumed from scan paths"
+)
+
+_METRICS: List[Union[_Counter, _Histogram]] = [
+    _requests_total,
+    _request_duration,
+    _response_bytes_total,
+    _stage_duration,
+    _frames_total,
+]
+
+
+@contextmanager
+def _stage(name: str) -> Iterator[None]:
+    """Time the enclosed code as a stage of making a response."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stage_duration.observe(name, seconds=time.perf_counter() - start)
+
+
+def _deserialized() -> None:
+    """Record the time from receiving the request to its body being validated."""
+    start = _request_start.get()
+    if start is not None:
+        _stage_duration.observe("deserialize", seconds=time.perf_counter() - start)
+
+
+def _consume(path: Path, num: Optional[int] = None) -> Frames[str]:
+    """Consume frames from path, timing it and counting the frames."""
+    with _stage("consume"):
+        frames = path.consume(num)
+    _frames_total.inc(amount=len(frames))
+    return frames
+
+
+class _MetricsMiddleware:
+    """ASGI middleware counting requests and timing them until their last byte."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        token = _request_start.set(start)
+        status, nbytes = 500, 0
+
+        async def send_counted(message: Message) -> None:
+            nonlocal status, nbytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                nbytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_counted)
+        finally:
+            _request_start.reset(token)
+            # Label by route template rather than path, to bound the label values
+            route = getattr(scope.get("route"), "path", "unmatched")
+            _requests_total.inc(route, scope["method"], str(status))
+            _request_duration.observe(route, seconds=time.perf_counter() - start)
+            _response_bytes_total.inc(route, amount=nbytes)
+
+
+#
+# Compression
+#
+
+#: Chunks of at least this many bytes are compressed off the event loop
+_COMPRESS_IN_THREAD_BYTES = 64 * 1024
+
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: Union[bytes, memoryview], flush: bool) -> bytes:
+        out = self._compressor.compress(data)
+        if flush:
+            out += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return out
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _ZstdEncoder:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: Union[bytes, memoryview], flush: bool) -> bytes:
+        out = self._compressor.compress(data)
+        if flush:
+            out += self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return out
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+#: Encoders for each supported Content-Encoding, in order of preference
+_ENCODERS: Dict[str, Callable[[int], Union[_GzipEncoder, _ZstdEncoder]]] = {}
+if zstandard is not None:
+    _ENCODERS["zstd"] = _ZstdEncoder
+_ENCODERS["gzip"] = _GzipEncoder
+
+
+def _choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the preferred encoding of _ENCODERS allowed by an Accept-Encoding.
+
+    >>> _choose_encoding("gzip, deflate")
+    'gzip'
+    >>> _choose_encoding("gzip;q=0.5, zstd;q=0")
+    'gzip'
+    >>> _choose_encoding("identity") is None
+    True
+    """
+    qualities = _qualities(accept_encoding)
+    best, best_quality = None, 0.0
+    for encoding in _ENCODERS:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class _CompressionMiddleware:
+    """ASGI middleware compressing responses in the encoding the client prefers.
+
+    Responses smaller than ServiceSettings.compress_min_bytes are sent as they
+    are. Streamed responses without a Content-Length are compressed a chunk at a
+    time, flushing each so the client can decode it as soon as it arrives.
+    Whatever their size, responses to clients that accept compression have weak
+    ETags, so a 304 has the same ETag as the response it confirms.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        min_bytes = _settings.compress_min_bytes
+        if scope["type"] != "http" or min_bytes is None:
+            await self.app(scope, receive, send)
+        else:
+            encoding = _choose_encoding(Headers(scope=scope).get("accept-encoding"))
+            sender = _CompressingSender(send, encoding, min_bytes)
+            await self.app(scope, receive, sender.send)
+
+
+class _CompressingSender:
+    """Compresses the response messages of one request before sending them.
+
+    If encoding is None the client doesn't accept any, so the messages are only
+    marked as varying with Accept-Encoding.
+    """
+
+    def __init__(self, send: Send, encoding: Optional[str], min_bytes: int):
+        self._send = send
+        self._encoding = encoding
+        self._min_bytes = min_bytes
+        self._start: Optional[Message] = None
+        self._encoder: Optional[Union[_GzipEncoder, _ZstdEncoder]] = None
+        self._flush = False
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # Wait for the first chunk of the body to decide whether to compress
+            self._start = message
+            return
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+        body, more_body = message.get("body", b""), message.get("more_body", False)
+        if self._start is not None:
+            start, self._start = self._start, None
+            headers = MutableHeaders(raw=start["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if self._encoding is not None and etag and not etag.startswith("W/"):
+                # The compressed bytes differ, but decode to the same content.
+                # Weaken it whether or not this response is compressed, so it
+                # matches the ETag of a 304 or of a bigger compressed response
+                headers["etag"] = f"W/{etag}"
+            length = int(headers.get("content-length", -1))
+            if length < 0 and not more_body:
+                length = len(body)
+            if (
+                self._encoding is not None
+                and "content-encoding" not in headers
+                and (length < 0 or length >= self._min_bytes)
+            ):
+                self._encoder = _ENCODERS[self._encoding](_settings.compress_level)
+                # Only flush each chunk if it is being streamed as it is made
+                self._flush = length < 0
+                del headers["content-length"]
+                headers["content-encoding"] = self._encoding
+                if not more_body:
+                    body = await self._compress(body, more_body)
+                    headers["content-length"] = str(len(body))
+                    await self._send(start)
+                    await self._send({**message, "body": body})
+                    return
+            await self._send(start)
+        if self._encoder is not None:
+            body = await self._compress(body, more_body)
+            message = {**message, "body": body}
+        await self._send(message)
+
+    async def _compress(self, data: Union[bytes, memoryview], more_body: bool) -> bytes:
+        encoder = self._encoder
+        assert encoder is not None, "Not compressing"
+
+        def compress() -> bytes:
+            with _stage("compress"):
+                out = encoder.compress(data, flush=self._flush and len(data) > 0)
+                if not more_body:
+                    out += encoder.finish()
+            return out
+
+        if len(data) >= _COMPRESS_IN_THREAD_BYTES:
+            # zlib and zstd release the GIL, so this doesn't hold up other requests
+            return await anyio.to_thread.run_sync(compress)
+        return compress()
+
+
+# Compression is inside the metrics, so they count the bytes actually sent
+app.add_middleware(_CompressionMiddleware)
+app.add_middleware(_MetricsMiddleware)
+
+
 #
 # API Routes
 #
@@ -123,29 +955,81 @@ _EXAMPLE_POINTS_REQUEST = PointsRequest(
 
 
 @app.post("/valid", response_model=ValidResponse)
-def valid(
+async def valid(
     spec: Spec = Body(..., examples=[_EXAMPLE_SPEC]),
-) -> Union[ValidResponse, JSONResponse]:
+    details: bool = Query(
+        default=False,
+        description="Also return the shape of the scan and the duration of its "
+        "frames, worked out without calculating it",
+    ),
+) -> Response:
     """Validate wether a ScanSpec can produce a viable scan.
 
     Args:
         spec: The scanspec to validate
+        details: Whether to add the shape and duration
 
     Returns:
         ValidResponse: A canonical version of the spec if it is valid.
             An error otherwise.
     """
-    valid_spec = Spec.deserialize(spec.serialize())
-    return ValidResponse(spec, valid_spec)
+    _deserialized()
+    return ORJSONResponse(_valid_content(spec, details))
+
 
+def _valid_content(spec: Spec, details: bool) -> Dict[str, Any]:
+    """Make the JSON content of a ValidResponse.
+
+    FastAPI has already validated the spec while parsing the request, so its
+    serialized form is the canonical valid spec. It is returned directly rather
+    than being deserialized again and validated against the response model.
+    """
+    serialized = spec.serialize()
+    content: Dict[str, Any] = {"input_spec": serialized, "valid_spec": serialized}
+    if details:
+        try:
+            sizes = spec.dim_sizes()
+            duration = _constant_duration(spec, sizes)
+        except AssertionError as e:
+            # The spec would fail to calculate
+            raise HTTPException(status_code=422, detail=str(e)) from e
+        content["shape"] = [size.num for size in sizes]
+        content["duration"] = duration
+    return content
+
+
+@app.post("/estimate", response_model=EstimateResponse)
+def estimate(
+    spec: Spec = Body(..., examples=[_EXAMPLE_SPEC]),
+) -> EstimateResponse:
+    """Estimate the frames and memory a spec needs, without calculating it.
 
-@app.post("/midpoints", response_model=MidpointsResponse)
-def midpoints(
+    The heavy routes reject specs whose dims_bytes is more than the calculate
+    budget before calculating them.
+
+    Args:
+        spec: The spec to estimate
+
+    Returns:
+        EstimateResponse: The shape and sizes of the scan
+    """
+    _deserialized()
+    try:
+        return _estimate(spec)
+    except AssertionError as e:
+        # The spec would fail to calculate
+        raise HTTPException(status_code=422, detail=str(e)) from e
+
+
+@app.post("/midpoints", response_model=MidpointsResponse, responses=_BINARY_RESPONSES)
+async def midpoints(
+    http_request: Request,
     request: PointsRequest = Body(
         ...,
         examples=[_EXAMPLE_POINTS_REQUEST],
     ),
-) -> MidpointsResponse:
+    accept: Optional[str] = _ACCEPT_HEADER,
+) -> Response:
     """Generate midpoints from a scanspec.
 
     A scanspec can produce bounded points (i.e. a point is valid if an
@@ -153,96 +1037,395 @@ def midpoints(
     are the middle of each set of bounds.
 
     Args:
+        http_request: The HTTP request, used to check if the client disconnected
         request: Scanspec and formatting info.
+        accept: The Accept header, used to request binary points
 
     Returns:
         MidpointsResponse: Midpoints of the scan
     """
-    chunk, total_frames = _to_chunk(request)
-    return MidpointsResponse(
-        total_frames,
-        request.max_frames or total_frames,
-        request.format,
-        _format_axes_points(chunk.midpoints, request.format),
+    _deserialized()
+    binary = _wants_binary(accept)
+    return await _cached_response(
+        http_request,
+        _points_key("midpoints", request, binary),
+        lambda job: _midpoints_response(request, binary, job),
     )
 
 
-@app.post("/bounds", response_model=BoundsResponse)
-def bounds(
+def _midpoints_response(request: PointsRequest, binary: bool, job: _Job) -> Response:
+    chunk, total_frames = _to_chunk(request, job)
+    with _stage("encode"):
+        if binary:
+            return _binary_response(
+                _encode_binary_points(
+                    {"midpoints": chunk.midpoints},
+                    total_frames=total_frames,
+                    returned_frames=len(chunk),
+                )
+            )
+        return ORJSONResponse(
+            _points_content(
+                total_frames,
+                len(chunk),
+                request.format,
+                midpoints=chunk.midpoints,
+            )
+        )
+
+
+@app.post(
+    "/midpoints/stream",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {"application/x-ndjson": {}, BINARY_MEDIA_TYPE: {}},
+            "description": "One MidpointsResponse per line, each a chunk of the "
+            "scan, or one binary message per chunk if requested in the Accept header",
+        }
+    },
+)
+async def midpoints_stream(
+    http_request: Request,
+    request: StreamRequest = Body(
+        ...,
+        examples=[_EXAMPLE_POINTS_REQUEST],
+    ),
+    accept: Optional[str] = _ACCEPT_HEADER,
+) -> StreamingResponse:
+    """Stream midpoints from a scanspec as newline delimited JSON.
+
+    Like /midpoints, but the frames are produced and sent a chunk at a time, so
+    the first points arrive before the rest of the scan is calculated, and the
+    server only holds one chunk in memory at a time. Each chunk is calculated in
+    the worker pool, so a stream shares its limits with the other routes, and
+    may end early if the pool is full or the timeout is reached. Each line is a
+    MidpointsResponse where returned_frames is the number of frames in that
+    chunk. If binary is requested, each chunk is a binary message instead.
+
+    Args:
+        http_request: The HTTP request, used to check if the client disconnected
+        request: Scanspec, formatting and chunking info.
+        accept: The Accept header, used to request binary points
+
+    Returns:
+        StreamingResponse: Newline delimited MidpointsResponse chunks
+    """
+    _deserialized()
+    path, total_frames = await _run_heavy(
+        http_request, lambda job: _to_path(request, job, num_frames=None)
+    )
+    if _wants_binary(accept):
+        return _BinaryResponse(
+            _stream_binary_midpoints(path, total_frames, request.chunk_frames)
+        )
+    return StreamingResponse(
+        _stream_midpoints(path, total_frames, request),
+        media_type="application/x-ndjson",
+    )
+
+
+#: Most frames to send in each message on a /midpoints/ws WebSocket
+WEBSOCKET_CHUNK_FRAMES = 10000
+
+# Close codes for the errors that can happen while following a scan
+_WEBSOCKET_CLOSE_CODES = {413: 1009, 503: 1013}
+
+
+@app.websocket("/midpoints/ws")
+async def midpoints_websocket(websocket: WebSocket) -> None:
+    """Follow the midpoints of a scan, sending frames as the client asks for them.
+
+    The client sends a PointsRequest as JSON, and the server replies with
+    ``{"total_frames": int, "frames": int}``, where frames is the number of
+    frames it will send. The client then sends ``{"frames": int}`` whenever it
+    is ready for more frames, and the server replies with that many frames as
+    binary messages of at most WEBSOCKET_CHUNK_FRAMES frames each, in the layout
+    of `decode_binary_points`. When every frame has been sent, the server
+    closes the WebSocket.
+
+    The server keeps the Path between messages, so frames are only calculated
+    once and only one message worth of frames is held at a time.
+
+    Args:
+        websocket: The WebSocket to the client
+    """
+    await websocket.accept()
+    try:
+        await _follow_midpoints(websocket)
+    except WebSocketDisconnect:
+        pass
+    except (ValidationError, ValueError, KeyError, TypeError) as e:
+        # Client sent something other than the messages described above
+        await websocket.close(code=1008, reason=str(e)[:120])
+    except HTTPException as e:
+        code = _WEBSOCKET_CLOSE_CODES.get(e.status_code, 1011)
+        await websocket.close(code=code, reason=str(e.detail)[:120])
+
+
+async def _follow_midpoints(websocket: WebSocket) -> None:
+    request = parse_obj_as(PointsRequest, await websocket.receive_json())
+    path, total_frames = await _run_heavy(
+        None, lambda job: _to_path(request, job, num_frames=None)
+    )
+    await websocket.send_json({"total_frames": total_frames, "frames": len(path)})
+    while len(path):
+        credit = parse_obj_as(PositiveInt, (await websocket.receive_json())["frames"])
+        while credit and len(path):
+            num = min(credit, WEBSOCKET_CHUNK_FRAMES)
+            message = await _run_heavy(
+                None, partial(_consume_binary, path, num, total_frames)
+            )
+            await websocket.send_bytes(message)
+            credit -= num
+    await websocket.close()
+
+
+def _consume_binary(path: Path, num: int, total_frames: int, job: _Job) -> bytes:
+    return b"".join(_consume_buffers(path, num, total_frames, job))
+
+
+def _consume_buffers(
+    path: Path, num: int, total_frames: int, job: _Job
+) -> List[Union[bytes, memoryview]]:
+    chunk = _consume(path, num)
+    with _stage("encode"):
+        return _encode_binary_points(
+            {"midpoints": chunk.midpoints},
+            total_frames=total_frames,
+            returned_frames=len(chunk),
+        )
+
+
+@app.post("/bounds", response_model=BoundsResponse, responses=_BINARY_RESPONSES)
+async def bounds(
+    http_request: Request,
     request: PointsRequest = Body(
         ...,
         examples=[_EXAMPLE_POINTS_REQUEST],
     ),
-) -> BoundsResponse:
+    accept: Optional[str] = _ACCEPT_HEADER,
+) -> Response:
     """Generate bounds from a scanspec.
 
     A scanspec can produce points with lower and upper bounds.
 
     Args:
+        http_request: The HTTP request, used to check if the client disconnected
         request: Scanspec and formatting info.
+        accept: The Accept header, used to request binary points
 
     Returns:
         BoundsResponse: Bounds of the scan
     """
-    chunk, total_frames = _to_chunk(request)
-    return BoundsResponse(
-        total_frames,
-        request.max_frames or total_frames,
-        request.format,
-        _format_axes_points(chunk.lower, request.format),
-        _format_axes_points(chunk.upper, request.format),
+    _deserialized()
+    binary = _wants_binary(accept)
+    return await _cached_response(
+        http_request,
+        _points_key("bounds", request, binary),
+        lambda job: _bounds_response(request, binary, job),
     )
 
 
-@app.post("/gap", response_model=GapResponse)
-def gap(
+def _bounds_response(request: PointsRequest, binary: bool, job: _Job) -> Response:
+    chunk, total_frames = _to_chunk(request, job)
+    with _stage("encode"):
+        if binary:
+            return _binary_response(
+                _encode_binary_points(
+                    {"lower": chunk.lower, "upper": chunk.upper},
+                    total_frames=total_frames,
+                    returned_frames=len(chunk),
+                )
+            )
+        return ORJSONResponse(
+            _points_content(
+                total_frames,
+                len(chunk),
+                request.format,
+                lower=chunk.lower,
+                upper=chunk.upper,
+            )
+        )
+
+
+@app.post(
+    "/gap",
+    response_model=Union[GapResponse, GapRunLengthResponse, GapIndicesResponse],
+)
+async def gap(
+    http_request: Request,
     spec: Spec = Body(
         ...,
         examples=[_EXAMPLE_SPEC],
     ),
-) -> GapResponse:
+    format: GapFormat = Query(
+        GapFormat.BOOL_LIST,
+        description="BOOL_LIST for a GapResponse, RUN_LENGTH for a "
+        "GapRunLengthResponse, GAP_INDICES for a GapIndicesResponse",
+    ),
+) -> Response:
     """Generate gaps from a scanspec.
 
     A scanspec may indicate if there is a gap between two frames.
     The array returned corresponds to whether or not there is a gap
-    after each frame.
+    after each frame. For regular scans, gaps are rare, so the RUN_LENGTH and
+    GAP_INDICES formats are much smaller, and are made without generating
+    every frame of the scan.
 
     Args:
-        request: Scanspec and formatting info.
+        http_request: The HTTP request, used to check if the client disconnected
+        spec: Scanspec to calculate the gaps of.
+        format: The format in which to return the gaps
 
     Returns:
         GapResponse: Bounds of the scan
     """
-    dims = spec.calculate()  # Grab dimensions from spec
-    path = Path(dims)  # Convert to a path
-    gap = list(path.consume().gap)
-    return GapResponse(gap)
+    _deserialized()
+    return await _cached_response(
+        http_request,
+        _response_key("gap", spec, format.value),
+        lambda job: _gap_response(spec, format, job),
+    )
+
+
+def _gap_response(spec: Spec, format: GapFormat, job: _Job) -> Response:
+    dims = _calculate(spec)  # Grab dimensions from spec
+    total_frames = int(np.prod([len(frames) for frames in dims]))
+    if format is GapFormat.BOOL_LIST:
+        job.check_frames(total_frames)
+    indices = _gap_indices(dims)
+    job.check()
+    if format is GapFormat.BOOL_LIST:
+        gap = np.zeros(total_frames, dtype=np.bool_)
+        gap[indices] = True
+        return ORJSONResponse({"gap": gap})
+    elif format is GapFormat.RUN_LENGTH:
+        runs = _run_lengths(indices, total_frames)
+        return ORJSONResponse({"total_frames": total_frames, "runs": runs})
+    elif format is GapFormat.GAP_INDICES:
+        return ORJSONResponse({"total_frames": total_frames, "indices": indices})
+    else:
+        raise KeyError(f"Unknown format: {format}")
 
 
 @app.post("/smalleststep", response_model=SmallestStepResponse)
-def smallest_step(
+async def smallest_step(
+    http_request: Request,
     spec: Spec = Body(..., examples=[_EXAMPLE_SPEC]),
-) -> SmallestStepResponse:
+) -> Response:
     """Calculate the smallest step in a scan, both absolutely and per-axis.
 
     Ignore any steps of size 0.
 
     Args:
+        http_request: The HTTP request, used to check if the client disconnected
         spec: The spec of the scan
 
     Returns:
         SmallestStepResponse: A description of the smallest steps in the spec
     """
-    dims = spec.calculate()  # Grab dimensions from spec
-    path = Path(dims)  # Convert to a path
-    chunk = path.consume()
+    _deserialized()
+    return await _cached_response(
+        http_request,
+        _response_key("smalleststep", spec),
+        lambda job: _smallest_step_response(spec, job),
+    )
 
-    absolute = _calc_smallest_step(list(chunk.midpoints.values()))
-    per_axis = {
-        axis: _calc_smallest_step([chunk.midpoints[axis]]) for axis in chunk.axes()
-    }
 
-    return SmallestStepResponse(absolute, per_axis)
+def _smallest_step_response(spec: Spec, job: _Job) -> Response:
+    dims = _calculate(spec)  # Grab dimensions from spec
+    absolute, per_axis = _calc_smallest_steps(dims, job)
+    return ORJSONResponse(asdict(SmallestStepResponse(absolute, per_axis)))
+
+
+@app.post(
+    "/batch",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {"application/x-ndjson": {}},
+            "description": "One BatchResult per line, in the order of the items",
+        }
+    },
+)
+async def batch(
+    http_request: Request,
+    request: BatchRequest = Body(
+        ...,
+        examples=[
+            BatchRequest(
+                [
+                    BatchItem(_EXAMPLE_SPEC, operation=BatchOperation.VALID),
+                    BatchItem(_EXAMPLE_SPEC, operation=BatchOperation.SMALLEST_STEP),
+                ]
+            )
+        ],
+    ),
+) -> StreamingResponse:
+    """Do many operations on many specs, streaming the results as they are ready.
+
+    Saves a round trip per spec when evaluating lots of specs. The operations
+    are done concurrently on the worker pool, and share calculated dims and
+    cached responses with each other and with the other routes. The results are
+    streamed back as newline delimited BatchResults in the order of the items.
+
+    Args:
+        http_request: The HTTP request, used to check if the client disconnected
+        request: The operations to do
+
+    Returns:
+        StreamingResponse: Newline delimited BatchResults
+    """
+    _deserialized()
+    return StreamingResponse(
+        _stream_batch(http_request, request.items),
+        media_type="application/x-ndjson",
+    )
+
+
+@app.get("/cachestats", response_model=CacheStatsResponse)
+def cache_stats() -> CacheStatsResponse:
+    """Report how full the server-side caches are, and how often they are hit.
+
+    Returns:
+        CacheStatsResponse: Statistics for each cache
+    """
+    return CacheStatsResponse(_dims_cache.stats(), _response_cache.stats())
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    """Report request counts, latencies and cache statistics for Prometheus.
+
+    Returns:
+        PlainTextResponse: The metrics in the Prometheus text exposition format
+    """
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines += metric.exposition()
+    caches: Dict[str, _LRUCache] = {
+        "dims": _dims_cache,
+        "edges": _edges_cache,
+        "responses": _response_cache,
+    }
+    stats = {name: cache.stats() for name, cache in caches.items()}
+    for field, kind, help in [
+        ("entries", "gauge", "Number of entries in each cache"),
+        ("nbytes", "gauge", "Bytes used by the entries in each cache"),
+        ("max_bytes", "gauge", "Bytes each cache may use before eviction"),
+        ("hits", "counter", "Lookups that found an entry in each cache"),
+        ("misses", "counter", "Lookups that didn't find an entry in each cache"),
+        ("hit_rate", "gauge", "Fraction of lookups that found an entry in each cache"),
+    ]:
+        name = f"scanspec_cache_{field}" + ("_total" if kind == "counter" else "")
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        for cache, cache_stats in stats.items():
+            value = getattr(cache_stats, field)
+            lines.append(f"{name}{_format_labels([('cache', cache)])} {value}")
+    return PlainTextResponse(
+        "\n".join(lines) + "\n", media_type="text/plain; version=0.0.4"
+    )
 
 
 #
@@ -250,22 +1433,814 @@ def smallest_step(
 #
 
 
-def _to_chunk(request: PointsRequest) -> Tuple[Frames, int]:
-    spec = Spec.deserialize(request.spec)
-    dims = spec.calculate()  # Grab dimensions from spec
+def _to_chunk(request: PointsRequest, job: _Job) -> Tuple[Frames, int]:
+    path, total_frames = _to_path(request, job, num_frames=request.max_frames)
+    # WARNING: path object is consumed after this statement
+    chunk = _consume(path, request.max_frames)
+    job.check()
+    return chunk, total_frames
+
+
+def _to_path(
+    request: PointsRequest, job: _Job, num_frames: Optional[int]
+) -> Tuple[Path, int]:
+    spec = request.spec
+    dims = _calculate(spec)  # Grab dimensions from spec
     path = Path(dims)  # Convert to a path
 
     # TOTAL FRAMES
     total_frames = len(path)  # Capture the total length of the path
 
-    # MAX FRAMES
-    # Limit the consumed data by the max_frames argument
-    max_frames = request.max_frames
-    if max_frames and (max_frames < len(path)):
-        # Cap the frames by the max limit
-        path = _reduce_frames(dims, max_frames)
-    # WARNING: path object is consumed after this statement
-    return path.consume(max_frames), total_frames
+    if _is_paged(request):
+        # PAGING
+        # Return a page of the full resolution path, consume will cap it at
+        # max_frames
+        start = min(request.start or 0, total_frames)
+        path = Path(dims, start, request.num)
+    else:
+        # MAX FRAMES
+        # Limit the consumed data by the max_frames argument
+        max_frames = request.max_frames
+        if max_frames and (max_frames < len(path)):
+            # Cap the frames by the max limit
+            with _stage("downsample"):
+                path = _reduce_frames(dims, max_frames, _spec_fingerprint(spec))
+
+    # Check the frames that will be consumed from path, at most num_frames
+    job.check_frames(len(path) if num_frames is None else min(len(path), num_frames))
+    return path, total_frames
+
+
+def _points_key(route: str, request: PointsRequest, binary: bool) -> str:
+    return _response_key(
+        route,
+        request.spec,
+        request.max_frames,
+        request.format.value,
+        request.start,
+        request.num,
+        binary,
+    )
+
+
+def _is_paged(request: PointsRequest) -> bool:
+    return request.start is not None or request.num is not None
+
+
+def _spec_fingerprint(spec: Spec) -> str:
+    """Make a key that is the same for equal specs, but different otherwise.
+
+    Args:
+        spec: The spec to fingerprint
+
+    Returns:
+        str: The sha256 hex digest of the canonical JSON serialization of spec
+
+    >>> a = _spec_fingerprint(Line("x", 0, 1, 5))
+    >>> a == _spec_fingerprint(Line("x", 0.0, 1.0, 5))
+    True
+    >>> a == _spec_fingerprint(Line("x", 0, 1, 6))
+    False
+    """
+    serialized = json.dumps(spec.serialize(), sort_keys=True)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+class _LRUCache(Generic[V]):
+    """Thread safe LRU cache, limited by the number of bytes of its values.
+
+    Args:
+        max_bytes: Evict the least recently used values to keep the values in
+            the cache under this many bytes
+    """
+
+    def __init__(self, max_bytes: int):
+        #: Maximum number of bytes of values to hold
+        self.max_bytes = max_bytes
+        #: Number of bytes of values currently held
+        self.nbytes = 0
+        #: Number of lookups that found a value
+        self.hits = 0
+        #: Number of lookups that didn't find a value
+        self.misses = 0
+        self._values: OrderedDict[str, Tuple[V, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[V]:
+        """Return the value stored for key, or None if there isn't one."""
+        with self._lock:
+            if key in self._values:
+                self._values.move_to_end(key)
+                self.hits += 1
+                return self._values[key][0]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: V, nbytes: int) -> None:
+        """Store a value that uses nbytes, unless it would never fit."""
+        with self._lock:
+            if nbytes <= self.max_bytes and key not in self._values:
+                self._values[key] = (value, nbytes)
+                self.nbytes += nbytes
+                self._evict()
+
+    def resize(self, max_bytes: int) -> None:
+        """Change max_bytes, evicting values if they no longer fit."""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self) -> None:
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted) = self._values.popitem(last=False)
+            self.nbytes -= evicted
+
+    def clear(self) -> None:
+        """Remove all values from the cache and reset its statistics."""
+        with self._lock:
+            self._values.clear()
+            self.nbytes = self.hits = self.misses = 0
+
+    def stats(self) -> CacheStats:
+        """Return the current size and hit rate of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return CacheStats(
+                entries=len(self._values),
+                nbytes=self.nbytes,
+                max_bytes=self.max_bytes,
+                hits=self.hits,
+                misses=self.misses,
+                hit_rate=self.hits / lookups if lookups else 0.0,
+            )
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+def _freeze_dims(dims: List[Frames[str]]) -> int:
+    """Make the arrays of dims read only, returning the total bytes they use."""
+    arrays = {}
+    for frames in dims:
+        for axes_points in (frames.midpoints, frames.lower, frames.upper):
+            for points in axes_points.values():
+                arrays[id(points)] = points
+        arrays[id(frames.gap)] = frames.gap
+    for array in arrays.values():
+        array.flags.writeable = False
+    return sum(array.nbytes for array in arrays.values())
+
+
+class _DimsStore:
+    """Calculated dims shared between processes as files in a directory.
+
+    The dims of each spec are saved as .npy files in a subdirectory named by
+    _spec_fingerprint, which is renamed into place once complete. They are
+    loaded as copy-on-write memory maps, so processes share the memory of
+    dims they have all loaded.
+
+    Args:
+        directory: The directory to store dims in, created if needed
+        max_bytes: The bytes of files to keep before deleting the least
+            recently used
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def get_or_calculate(self, key: str, spec: Spec) -> List[Frames[str]]:
+        """Load the dims of spec, calculating and storing them if needed."""
+        # Only one process calculates each spec, the others wait and load it
+        with self._lock(key):
+            dims = self.get(key)
+            if dims is None:
+                with _stage("calculate"):
+                    dims = spec.calculate()
+                self.put(key, dims)
+        return dims
+
+    def get(self, key: str) -> Optional[List[Frames[str]]]:
+        """Load the dims stored under key, or None if they are not stored."""
+        path = os.path.join(self.directory, key)
+        try:
+            with open(os.path.join(path, "dims.json")) as f:
+                layout = json.load(f)
+            arrays: Dict[str, np.ndarray] = {}
+
+            def load(name: str) -> np.ndarray:
+                if name not in arrays:
+                    arrays[name] = np.load(os.path.join(path, name), mmap_mode="c")
+                return arrays[name]
+
+            dims: List[Frames[str]] = []
+            for dim in layout:
+                midpoints, lower, upper = (
+                    {axis: load(name) for axis, name in dim[field]}
+                    for field in ("midpoints", "lower", "upper")
+                )
+                cls = SnakedFrames if dim["snaked"] else Frames
+                dims.append(cls(midpoints, lower, upper, gap=load(dim["gap"])))
+            # Mark it as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return dims
+
+    def put(self, key: str, dims: List[Frames[str]]) -> None:
+        """Store dims under key, deleting old dims if the store is too big."""
+        tmp = tempfile.mkdtemp(prefix=f".{key}-", dir=self.directory)
+        names: Dict[int, str] = {}
+
+        def save(array: np.ndarray) -> str:
+            # Midpoints, lower and upper are often the same array
+            if id(array) not in names:
+                names[id(array)] = f"{len(names)}.npy"
+                np.save(os.path.join(tmp, names[id(array)]), array)
+            return names[id(array)]
+
+        layout = [
+            {
+                "snaked": isinstance(frames, SnakedFrames),
+                **{
+                    field: [(axis, save(points)) for axis, points in axes.items()]
+                    for field, axes in (
+                        ("midpoints", frames.midpoints),
+                        ("lower", frames.lower),
+                        ("upper", frames.upper),
+                    )
+                },
+                "gap": save(frames.gap),
+            }
+            for frames in dims
+        ]
+        with open(os.path.join(tmp, "dims.json"), "w") as f:
+            json.dump(layout, f)
+        try:
+            os.rename(tmp, os.path.join(self.directory, key))
+        except OSError:
+            # Another process stored it first
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.prune()
+
+    def prune(self) -> None:
+        """Delete the least recently used dims until the store fits max_bytes."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_dir() and not entry.name.startswith("."):
+                nbytes = sum(f.stat().st_size for f in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime, nbytes, entry.name))
+        total = sum(nbytes for _, nbytes, _ in entries)
+        for _, nbytes, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            # Processes that have already loaded it keep their memory maps
+            shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+            with suppress(FileNotFoundError):
+                os.remove(os.path.join(self.directory, f".{key}.lock"))
+            total -= nbytes
+
+    @contextmanager
+    def _lock(self, key: str) -> Iterator[None]:
+        if fcntl is None:  # pragma: no cover
+            # Without file locks, processes may both calculate the same spec
+            yield
+            return
+        with open(os.path.join(self.directory, f".{key}.lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+#: Dims calculated by specs, keyed by _spec_fingerprint. Requests for different
+#: pages of the same spec share the calculated dims, so only the first does
+#: spec.calculate(). The arrays of the dims are made read only so a request
+#: cannot modify the dims another request will use.
+_dims_cache: _LRUCache[List[Frames[str]]] = _LRUCache(_settings.dims_cache_bytes)
+
+#: Edges made by _frames_edges for each of the dims in _dims_cache, so previews
+#: of the same spec at different max_frames don't find them again
+_edges_cache: _LRUCache[List[np.ndarray]] = _LRUCache(_settings.dims_cache_bytes // 4)
+
+#: The media type and chunks of responses, keyed by _response_key
+_response_cache: _LRUCache[Tuple[str, List[Union[bytes, memoryview]]]] = _LRUCache(
+    _settings.response_cache_bytes
+)
+
+
+class _SpecLock:
+    """A lock held while calculating a spec, and how many workers want it."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0
+
+
+#: Locks held while calculating each spec, keyed by _spec_fingerprint
+_calculating: Dict[str, _SpecLock] = {}
+_calculating_lock = threading.Lock()
+
+
+def _calculate(spec: Spec) -> List[Frames[str]]:
+    key = _spec_fingerprint(spec)
+    # Only one worker calculates each spec, the others wait and use its dims.
+    # Calculate outside the cache lock so other specs aren't held up
+    with _calculating_lock:
+        spec_lock = _calculating.get(key)
+        if spec_lock is None:
+            spec_lock = _calculating[key] = _SpecLock()
+        spec_lock.users += 1
+    try:
+        with spec_lock.lock:
+            dims = _dims_cache.get(key)
+            if dims is None:
+                _check_calculate_budget(spec)
+                store = _dims_store
+                if store is None:
+                    with _stage("calculate"):
+                        dims = spec.calculate()
+                else:
+                    dims = store.get_or_calculate(key, spec)
+                _dims_cache.put(key, dims, _freeze_dims(dims))
+    finally:
+        # Only forget the lock when no other worker is waiting for it
+        with _calculating_lock:
+            spec_lock.users -= 1
+            if spec_lock.users == 0:
+                del _calculating[key]
+    return dims
+
+
+#: Bytes for each axis of a frame of calculated dims, its midpoint, lower and upper
+_AXIS_BYTES = 3 * 8
+#: Bytes for the gap of a frame of calculated dims
+_GAP_BYTES = 1
+
+
+def _estimate(spec: Spec) -> EstimateResponse:
+    """Estimate the cost of calculating spec from its `Spec.dim_sizes`.
+
+    >>> estimate = _estimate(Line("y", 0, 1, 10) * Line("x", 0, 1, 100))
+    >>> estimate.shape, estimate.total_frames, estimate.dims_bytes
+    ([10, 100], 1000, 2750)
+    """
+    sizes = spec.dim_sizes()
+    total_frames, dims_bytes, frame_bytes = 1, 0, _GAP_BYTES
+    for size in sizes:
+        total_frames *= size.num
+        dims_bytes += size.num * (len(size.axes) * _AXIS_BYTES + _GAP_BYTES)
+        frame_bytes += len(size.axes) * _AXIS_BYTES
+    return EstimateResponse(
+        shape=[size.num for size in sizes],
+        exact=all(size.exact for size in sizes),
+        total_frames=total_frames,
+        dims_bytes=dims_bytes,
+        path_bytes=total_frames * frame_bytes,
+    )
+
+
+def _constant_duration(spec: Spec, sizes: List[DimSize]) -> Optional[float]:
+    """Work out what `get_constant_duration` would return without calculating.
+
+    Only knows the duration if it comes from Static specs of the same value
+    that end up in one dimension, otherwise returns None.
+
+    >>> from scanspec.specs import step
+    >>> spec = step(Line("x", 0, 1, 5), 0.1)
+    >>> _constant_duration(spec, spec.dim_sizes())
+    0.1
+    """
+    if sum(DURATION in size.axes for size in sizes) != 1:
+        return None
+    values = set()
+    specs = [spec]
+    while specs:
+        child = specs.pop()
+        if isinstance(child, Static) and child.axis == DURATION:
+            values.add(child.value)
+        elif DURATION in child.axes():
+            children = [getattr(child, f.name) for f in fields(cast(Any, child))]
+            leaves = [c for c in children if isinstance(c, Spec)]
+            if not leaves:
+                # A spec that isn't Static makes DURATION, it may not be constant
+                return None
+            specs += leaves
+    return values.pop() if len(values) == 1 else None
+
+
+def _check_calculate_budget(spec: Spec) -> None:
+    """Reject spec with a 413 if it is estimated to need too much memory."""
+    budget = _settings.calculate_budget
+    if budget is None:
+        return
+    try:
+        estimate = _estimate(spec)
+    except AssertionError:
+        # Let calculate report what is wrong with the spec
+        return
+    if estimate.dims_bytes > budget:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Spec would need {estimate.dims_bytes} bytes to calculate "
+            f"dimensions of shape {tuple(estimate.shape)}, more than the budget "
+            f"of {budget} bytes. Reduce the number of frames, or see /estimate",
+        )
+
+
+def _response_key(route: str, spec: Spec, *params: Any) -> str:
+    """Make a key for a response, which is also used as its strong ETag.
+
+    Args:
+        route: The route that made the response
+        spec: The spec the response was made from
+        params: Any other request parameters that change the response
+
+    Returns:
+        str: A hex digest that changes if any of the arguments or the version of
+            scanspec change
+    """
+    parts = [__version__, route, _spec_fingerprint(spec), *params]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check whether an If-None-Match header matches the ETag of a response.
+
+    >>> _etag_matches('"abc"', '"abc"')
+    True
+    >>> _etag_matches('"xyz", W/"abc"', '"abc"')
+    True
+    >>> _etag_matches("*", '"abc"')
+    True
+    >>> _etag_matches('"xyz"', '"abc"')
+    False
+    >>> _etag_matches(None, '"abc"')
+    False
+    """
+    if if_none_match is None:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        # If-None-Match uses the weak comparison
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag in ("*", etag):
+            return True
+    return False
+
+
+async def _cached_response(
+    http_request: Request, key: str, func: Callable[[_Job], Response]
+) -> Response:
+    """Return the cached response for key, or make it with func on the pool.
+
+    Args:
+        http_request: The request that is waiting for the response
+        key: The _response_key of the response
+        func: Makes the response if it is not in the cache
+
+    Returns:
+        Response: The response with an ETag, or a 304 if the request has a
+            matching If-None-Match
+    """
+    etag = f'"{key}"'
+    if _etag_matches(http_request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    media_type, chunks = await _cached_chunks(http_request, key, func)
+    response: Response
+    if media_type == BINARY_MEDIA_TYPE:
+        response = _binary_response(chunks)
+    else:
+        response = Response(chunks[0], media_type=media_type)
+    response.headers["ETag"] = etag
+    return response
+
+
+async def _cached_chunks(
+    http_request: Request, key: str, func: Callable[[_Job], Response]
+) -> Tuple[str, List[Union[bytes, memoryview]]]:
+    """Return the media type and body chunks of the response made by func."""
+    cached = _response_cache.get(key)
+    if cached is None:
+        response = await _run_heavy(http_request, func)
+        if isinstance(response, _BinaryResponse):
+            assert response.buffers is not None, "Cannot cache a binary stream"
+            cached = (BINARY_MEDIA_TYPE, response.buffers)
+        else:
+            cached = (str(response.media_type), [response.body])
+        _response_cache.put(key, cached, sum(len(c) for c in cached[1]))
+    return cached
+
+
+async def _stream_batch(
+    http_request: Request, items: List[BatchItem]
+) -> AsyncIterator[bytes]:
+    """Do the operations of a batch, yielding a line of JSON for each in order.
+
+    At most one operation per worker is in progress at a time, so a batch
+    shares the pool with other requests rather than filling its queue.
+    """
+    window = _settings.workers
+    tasks: Deque[asyncio.Task] = deque()
+    try:
+        for index, item in enumerate(items):
+            if len(tasks) >= window:
+                yield await tasks.popleft()
+            tasks.append(asyncio.create_task(_batch_line(http_request, index, item)))
+        while tasks:
+            yield await tasks.popleft()
+    finally:
+        # If the client went away, stop the operations still in progress
+        for task in tasks:
+            task.cancel()
+
+
+async def _batch_line(http_request: Request, index: int, item: BatchItem) -> bytes:
+    """Do the operation of a batch item, returning a BatchResult line."""
+    head = f'{{"index":{index},"operation":"{item.operation.value}",'.encode()
+    try:
+        body = await _batch_body(http_request, item)
+    except HTTPException as e:
+        error = {"status": e.status_code, "detail": e.detail}
+    except (ValueError, AssertionError) as e:
+        # Errors calculating the spec, the equivalent route would have responded
+        # 500
+        error = {"status": 500, "detail": f"{type(e).__name__}: {e}"}
+    except Exception as e:
+        # Anything else is a bug, log it, but don't cut the stream off partway
+        # as the client would get no error for this or the following items
+        logging.getLogger(__name__).exception("Batch item %d failed", index)
+        error = {"status": 500, "detail": f"{type(e).__name__}: {e}"}
+    else:
+        # Put the cached response in place rather than decoding and encoding it
+        return head + b'"status":200,"result":' + body + b"}\n"
+    return head + orjson.dumps(error)[1:] + b"\n"
+
+
+async def _batch_body(http_request: Request, item: BatchItem) -> bytes:
+    """Return the JSON response the equivalent route would have returned."""
+    operation, spec = item.operation, item.spec
+    func: Callable[[_Job], Response]
+    if operation is BatchOperation.VALID:
+        return orjson.dumps(_valid_content(spec, details=False))
+    elif operation is BatchOperation.SHAPE:
+        key = _response_key("shape", spec)
+        func = partial(_shape_response, spec)
+    elif operation is BatchOperation.MIDPOINTS:
+        key = _points_key("midpoints", item, False)
+        func = partial(_midpoints_response, item, False)
+    elif operation is BatchOperation.BOUNDS:
+        key = _points_key("bounds", item, False)
+        func = partial(_bounds_response, item, False)
+    elif operation is BatchOperation.GAP:
+        key = _response_key("gap", spec, GapFormat.BOOL_LIST.value)
+        func = partial(_gap_response, spec, GapFormat.BOOL_LIST)
+    elif operation is BatchOperation.SMALLEST_STEP:
+        key = _response_key("smalleststep", spec)
+        func = partial(_smallest_step_response, spec)
+    else:
+        raise KeyError(f"Unknown operation: {operation}")
+    _, chunks = await _cached_chunks(http_request, key, func)
+    return bytes(chunks[0])
+
+
+def _shape_response(spec: Spec, job: _Job) -> Response:
+    dims = _calculate(spec)
+    return ORJSONResponse({"shape": [len(frames) for frames in dims]})
+
+
+async def _stream_midpoints(
+    path: Path, total_frames: int, request: StreamRequest
+) -> AsyncIterator[bytes]:
+    """Consume path a chunk at a time in the worker pool, yielding JSON lines.
+
+    Args:
+        path: The path to consume
+        total_frames: The number of frames in the unreduced path
+        request: The request holding the chunk size and format
+    """
+    while len(path):
+        # The StreamingResponse notices disconnection, and cancels us
+        yield await _run_heavy(
+            None, partial(_consume_line, path, total_frames, request)
+        )
+
+
+def _consume_line(
+    path: Path, total_frames: int, request: StreamRequest, job: _Job
+) -> bytes:
+    chunk = _consume(path, request.chunk_frames)
+    with _stage("encode"):
+        content = _points_content(
+            total_frames, len(chunk), request.format, midpoints=chunk.midpoints
+        )
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n"
+
+
+async def _stream_binary_midpoints(
+    path: Path, total_frames: int, chunk_frames: int
+) -> AsyncIterator[Union[bytes, memoryview]]:
+    """Consume path a chunk at a time in the worker pool, yielding binary messages."""
+    while len(path):
+        buffers = await _run_heavy(
+            None, partial(_consume_buffers, path, chunk_frames, total_frames)
+        )
+        for buffer in buffers:
+            yield buffer
+
+
+def _wants_binary(accept: Optional[str]) -> bool:
+    """Whether an Accept header prefers BINARY_MEDIA_TYPE to JSON.
+
+    >>> _wants_binary("application/octet-stream")
+    True
+    >>> _wants_binary("application/json, application/octet-stream;q=0.5")
+    False
+    >>> _wants_binary("*/*")
+    False
+    """
+    qualities = _qualities(accept)
+    binary = qualities.get(BINARY_MEDIA_TYPE, 0.0)
+    # Only an explicit binary request gets binary, wildcards get JSON
+    return binary > 0 and binary >= qualities.get("application/json", 0.0)
+
+
+def _qualities(header: Optional[str]) -> Dict[str, float]:
+    """Parse an Accept or Accept-Encoding header into {value: quality}.
+
+    >>> _qualities("application/json;q=0.5, application/octet-stream")
+    {'application/json': 0.5, 'application/octet-stream': 1.0}
+    """
+    qualities: Dict[str, float] = {}
+    for item in (header or "").split(","):
+        value, *params = (p.strip() for p in item.split(";"))
+        quality = 1.0
+        for param in params:
+            key, _, q = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(q)
+                except ValueError:
+                    quality = 0.0
+        if value:
+            qualities[value.lower()] = quality
+    return qualities
+
+
+def _encode_binary_points(
+    fields: Mapping[str, AxesPoints[str]], **header: Any
+) -> List[Union[bytes, memoryview]]:
+    """Encode points as a binary message, without copying the arrays.
+
+    Args:
+        fields: {field_name: {axis: points}} to encode
+        header: Extra JSON serializable items to put in the header
+
+    Returns:
+        The header followed by a zero-copy view of each array
+    """
+    buffers: List[Union[bytes, memoryview]] = []
+    layout: Dict[str, Dict[str, Any]] = {}
+    offset = 0
+    for name, axes_points in fields.items():
+        layout[name] = {}
+        for axis, points in axes_points.items():
+            # A no-op for the contiguous float64 arrays Path.consume produces
+            array = np.ascontiguousarray(points, dtype="<f8")
+            layout[name][axis] = {
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "offset": offset,
+            }
+            buffers.append(array.data.cast("B"))
+            offset += array.nbytes
+    header_bytes = json.dumps({**header, "nbytes": offset, "fields": layout}).encode()
+    # Pad with spaces so the arrays start on an 8 byte boundary
+    header_bytes += b" " * (-(len(header_bytes) + 4) % 8)
+    return [struct.pack("<I", len(header_bytes)) + header_bytes] + buffers
+
+
+class _BinaryResponse(StreamingResponse):
+    """A StreamingResponse that can send memoryviews without copying them."""
+
+    media_type = BINARY_MEDIA_TYPE
+
+    def __init__(
+        self,
+        buffers: Union[
+            List[Union[bytes, memoryview]], AsyncIterator[Union[bytes, memoryview]]
+        ],
+        headers: Optional[Mapping[str, str]] = None,
+    ):
+        if isinstance(buffers, list):
+            #: All the buffers if they were given as a list, so it can be cached
+            self.buffers: Optional[List[Union[bytes, memoryview]]] = buffers
+            content: Any = iter(buffers)
+        else:
+            self.buffers, content = None, buffers
+        # StreamingResponse only declares str and bytes, but passes them through
+        super().__init__(content, headers=headers)
+
+    async def stream_response(self, send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        async for chunk in self.body_iterator:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def _binary_response(buffers: List[Union[bytes, memoryview]]) -> StreamingResponse:
+    return _BinaryResponse(
+        buffers,
+        headers={"content-length": str(sum(len(b) for b in buffers))},
+    )
+
+
+def decode_binary_points(data: bytes) -> List[Dict[str, Any]]:
+    """Decode a response containing one or more binary points messages.
+
+    Each message is a little-endian uint32 header length, followed by a JSON
+    header padded with spaces to a multiple of 8 bytes, followed by nbytes of
+    array data. The header has the same items as the JSON response, like
+    total_frames, except the points, which are in the arrays. Their layout is
+    given by the fields item of the header::
+
+        {"fields": {field_name: {axis: {"dtype", "shape", "offset"}}}}
+
+    Where offset is the byte offset of the array from the end of the header.
+
+    Args:
+        data: The binary response from /midpoints, /midpoints/stream or /bounds
+
+    Returns:
+        A dictionary for each message, like the JSON response, but with the
+        points as NumPy arrays that share memory with data
+    """
+    messages = []
+    start = 0
+    view = memoryview(data)
+    while start < len(data):
+        (header_length,) = struct.unpack_from("<I", data, start)
+        start += 4
+        header = json.loads(bytes(view[start : start + header_length]))
+        start += header_length
+        fields = header.pop("fields")
+        for name, axes_layout in fields.items():
+            header[name] = {
+                axis: np.frombuffer(
+                    view,
+                    dtype=layout["dtype"],
+                    count=int(np.prod(layout["shape"])),
+                    offset=start + layout["offset"],
+                ).reshape(layout["shape"])
+                for axis, layout in axes_layout.items()
+            }
+        start += header.pop("nbytes")
+        messages.append(header)
+    return messages
+
+
+def _points_content(
+    total_frames: int,
+    returned_frames: int,
+    format: PointsFormat,
+    **fields: AxesPoints[str],
+) -> Dict[str, Any]:
+    """Make the JSON content of a GeneratedPointsResponse subclass.
+
+    Building the MidpointsResponse or BoundsResponse dataclass would validate
+    every point, and returning it would make FastAPI encode every point one by
+    one, so make the equivalent dictionary instead. FLOAT_LIST points are left
+    as numpy arrays for orjson to encode in bulk.
+
+    Args:
+        total_frames: Total number of frames in spec
+        returned_frames: Number of frames being returned
+        format: The format to return the points in
+        fields: {field_name: axes_points} of the points to return
+    """
+    content: Dict[str, Any] = {
+        "total_frames": total_frames,
+        "returned_frames": returned_frames,
+        "format": format.value,
+    }
+    for name, axes_points in fields.items():
+        if format is PointsFormat.FLOAT_LIST:
+            content[name] = {
+                axis: np.ascontiguousarray(points, dtype=np.float64)
+                for axis, points in axes_points.items()
+            }
+        else:
+            content[name] = _format_axes_points(axes_points, format)
+    return content
 
 
 def _format_axes_points(
@@ -296,12 +2271,85 @@ def _format_axes_points(
         raise KeyError(f"Unknown format: {format}")
 
 
-def _reduce_frames(stack: List[Frames[str]], max_frames: int) -> Path:
+def _gap_indices(stack: List[Frames[str]]) -> np.ndarray:
+    """Find the frames of the Path through a stack that have a gap before them.
+
+    Equivalent to ``Path(stack).consume().gap.nonzero()[0]``, but only works on
+    the frames of each level of the stack that have a gap, so is much quicker
+    for regular scans.
+
+    Args:
+        stack: A stack of Frames created by a spec
+
+    Returns:
+        np.ndarray: Sorted indices into the Path
+
+    >>> spec = Line.bounded("y", 0, 1, 2) * Line.bounded("x", 0, 1, 3)
+    >>> _gap_indices(spec.calculate())
+    array([0, 3])
+    """
+    lengths = [len(frames) for frames in stack]
+    if 0 in lengths:
+        # Any empty dim means the Path has no frames
+        return np.zeros(0, dtype=np.int64)
+    gaps = []
+    for i, frames in enumerate(stack):
+        # Number of times each frame will repeat, and the number of times the
+        # whole of frames will be repeated, e.g. for a 2x3x4 ZxYxX scan:
+        # Z:12,1 Y:4,2 X:1,6
+        repeats = int(np.prod(lengths[i + 1 :]))
+        runs = int(np.prod(lengths[:i]))
+        # Indices of the frames with a gap, in order, within each run of frames
+        forward = frames.gap.nonzero()[0]
+        if isinstance(frames, SnakedFrames):
+            # On odd runs, index t maps to gap index (-t) % len
+            backward = np.sort((-forward) % len(frames))
+            run = np.arange(runs)
+            within = np.where((run % 2)[:, np.newaxis], backward, forward)
+        else:
+            within = np.broadcast_to(forward, (runs, len(forward)))
+        starts = np.arange(runs)[:, np.newaxis] * len(frames)
+        # Only the first of each repeated frame can have this level's gap
+        gaps.append(((starts + within) * repeats).ravel())
+    if not gaps:
+        return np.zeros(0, dtype=np.int64)
+    return np.unique(np.concatenate(gaps))
+
+
+def _run_lengths(indices: np.ndarray, total_frames: int) -> np.ndarray:
+    """Run length encode the gaps at indices, starting with a run without gaps.
+
+    >>> _run_lengths(np.array([0, 4, 5]), 8)
+    array([0, 1, 3, 2, 2])
+    >>> _run_lengths(np.array([2]), 3)
+    array([2, 1, 0])
+    >>> _run_lengths(np.array([], dtype=np.int64), 3)
+    array([3])
+    """
+    if len(indices) == 0:
+        return np.array([total_frames])
+    # Starts and ends of runs of consecutive indices
+    breaks = np.diff(indices) != 1
+    starts = indices[np.concatenate([[True], breaks])]
+    ends = indices[np.concatenate([breaks, [True]])] + 1
+    edges = np.empty(len(starts) * 2 + 2, dtype=np.int64)
+    edges[0], edges[1:-1:2], edges[2:-1:2], edges[-1] = 0, starts, ends, total_frames
+    return np.diff(edges)
+
+
+def _reduce_frames(
+    stack: List[Frames[str]], max_frames: int, key: Optional[str] = None
+) -> Path:
     """Removes frames from a spec so len(path) < max_frames.
 
+    Each dim is reduced by the same ratio, keeping its `_frames_edges` and
+    spreading the rest of the frames evenly between them, falling back to
+    evenly spaced frames if there are too many edges to keep.
+
     Args:
         stack: A stack of Frames created by a spec
         max_frames: The maximum number of frames the user wishes to be returned
+        key: The _spec_fingerprint of the spec, to cache the edges under
     """
     # Calculate the total number of frames
     num_frames = 1
@@ -311,30 +2359,167 @@ def _reduce_frames(stack: List[Frames[str]], max_frames: int) -> Path:
     # Need each dim to be this much smaller
     ratio = 1 / np.power(max_frames / num_frames, 1 / len(stack))
 
-    sub_frames = [_sub_sample(f, ratio) for f in stack]
-    return Path(sub_frames)
+    edges = None if key is None else _edges_cache.get(key)
+    if edges is None:
+        edges = [_frames_edges(f) for f in stack]
+        if key is not None:
+            _edges_cache.put(key, edges, sum(e.nbytes for e in edges))
+    sub_frames = [_sub_sample(f, ratio, e) for f, e in zip(stack, edges)]
+    return Path(sub_frames, num=max_frames)
+
+
+def _frames_edges(frames: Frames[str]) -> np.ndarray:
+    """Find the frames that a sub-sample should always keep.
+
+    These are the first and last frames, and the frames either side of every
+    gap, so the turnarounds of the scan and the edges of any regions it has
+    been masked by are in every sub-sample.
+
+    Args:
+        frames: The Frames object to find the edges of
+
+    Returns:
+        np.ndarray: Sorted indices into frames
+
+    >>> frames = Line.bounded("x", 0, 1, 9).calculate()[0]
+    >>> _frames_edges(frames)
+    array([0, 8])
+    >>> frames.gap[5] = True
+    >>> _frames_edges(frames)
+    array([0, 4, 5, 8])
+    """
+    num = len(frames)
+    gap = frames.gap.nonzero()[0]
+    edges = np.concatenate([[0, num - 1], gap, gap - 1])
+    return np.unique(edges[(edges >= 0) & (edges < num)])
 
 
-def _sub_sample(frames: Frames[str], ratio: float) -> Frames:
+def _sub_sample(
+    frames: Frames[str], ratio: float, edges: Optional[np.ndarray] = None
+) -> Frames:
     """Provides a sub-sample Frames object whilst preserving its core structure.
 
     Args:
         frames: the Frames object to be reduced
         ratio: the reduction ratio of the dimension
+        edges: the indices from `_frames_edges` to keep if there is room
+
+    >>> frames = Line("x", 0, 9, 10).calculate()[0]
+    >>> _sub_sample(frames, 10 / 3).midpoints
+    {'x': array([0., 4., 9.])}
+    >>> _sub_sample(frames, 10 / 4, np.array([0, 1, 2, 9])).midpoints
+    {'x': array([0., 1., 2., 9.])}
     """
-    num_indexes = int(len(frames) / ratio)
-    indexes = np.linspace(0, len(frames) - 1, num_indexes, dtype=np.int32)
+    # Allow for rounding errors in ratio, so a single dim gives max_frames
+    num_indexes = int(len(frames) / ratio + 1e-9)
+    if edges is None or len(edges) > num_indexes:
+        indexes = np.linspace(0, len(frames) - 1, num_indexes, dtype=np.int64)
+    else:
+        indexes = _spread_between(edges, num_indexes)
     return frames.extract(indexes, calculate_gap=False)
 
 
-def _calc_smallest_step(points: List[np.ndarray]) -> float:
-    # Calc abs diffs of all axes, ignoring any zero values
-    absolute_diffs = [_abs_diffs(axis_midpoints) for axis_midpoints in points]
+def _spread_between(edges: np.ndarray, num_indexes: int) -> np.ndarray:
+    """Add indices evenly spaced between the edges, to make num_indexes of them.
+
+    The indices are shared between the runs of frames between consecutive
+    edges in proportion to their lengths, then evenly spaced within each run.
+    This only looks at the edges and the indices it makes, not every frame.
+
+    >>> _spread_between(np.array([0, 99]), 9)
+    array([ 0, 12, 24, 37, 49, 61, 74, 86, 99])
+    >>> _spread_between(np.array([0, 9, 10, 19]), 8)
+    array([ 0,  3,  6,  9, 10, 13, 16, 19])
+    """
+    # The number of frames strictly between each pair of edges
+    between = np.diff(edges) - 1
+    total = between.sum()
+    if total == 0:
+        return edges
+    # Share the spare indices in proportion, giving the remainder to the runs
+    # with the largest fractional shares
+    shares = between * ((num_indexes - len(edges)) / total)
+    counts = np.floor(shares).astype(np.int64)
+    remainder = num_indexes - len(edges) - counts.sum()
+    counts[np.argsort(counts - shares, kind="stable")[:remainder]] += 1
+    # Like linspace, position j of the count in the run from edge a to edge b
+    # is at a + j * (b - a) / (count + 1), at least one frame apart so distinct
+    run = np.repeat(np.arange(len(counts)), counts)
+    j = np.arange(len(run)) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+    steps = np.diff(edges)[run] / (counts[run] + 1)
+    spread = (j * steps + edges[:-1][run]).astype(np.int64)
+    return np.union1d(edges, spread)
+
+
+#: Number of frames of a level of the stack to diff at a time
+STEP_CHUNK_SIZE = 1024 * 1024
+
+
+def _calc_smallest_steps(
+    stack: List[Frames[str]], job: _Job
+) -> Tuple[float, Dict[str, float]]:
+    """Find the smallest non-zero steps between frames of the Path through stack.
+
+    Rather than consuming the whole Path, look at each level of the stack in
+    turn. Between frames where that level moves on, slower levels don't move,
+    snaked faster levels don't move, and other faster levels jump from their
+    last frame back to their first. The steps are made from the same
+    differences in the same axis order as they would be from the Path, so the
+    results are identical.
+
+    Args:
+        stack: A stack of Frames created by a spec
+        job: Checked between chunks of frames
+
+    Raises:
+        ValueError: If there are no non-zero steps
+
+    Returns:
+        Tuple[float, Dict[str, float]]: The smallest step across all axes, and
+            the smallest step on each axis
+    """
+    axes = [axis for frames in stack for axis in frames.axes()]
+    absolute = np.inf
+    per_axis = dict.fromkeys(axes, np.inf)
+    if any(len(frames) == 0 for frames in stack):
+        stack = []
+    for i, frames in enumerate(stack):
+        if len(frames) < 2:
+            # This level never moves on
+            continue
+        seams = {
+            axis: np.absolute(points[:1] - points[-1:])
+            for faster in stack[i + 1 :]
+            if not isinstance(faster, SnakedFrames)
+            for axis, points in faster.midpoints.items()
+        }
+        for axis, seam in seams.items():
+            per_axis[axis] = min(per_axis[axis], _smallest_norm([seam]))
+        for start in range(0, len(frames) - 1, STEP_CHUNK_SIZE):
+            job.check()
+            end = min(start + STEP_CHUNK_SIZE, len(frames) - 1) + 1
+            diffs = {
+                axis: _abs_diffs(points[start:end])
+                for axis, points in frames.midpoints.items()
+            }
+            for axis, diff in diffs.items():
+                per_axis[axis] = min(per_axis[axis], _smallest_norm([diff]))
+            # Slower axes would add zero rows, which would not change the norm
+            rows = list(diffs.values()) + [
+                np.broadcast_to(seam, (end - start - 1,)) for seam in seams.values()
+            ]
+            absolute = min(absolute, _smallest_norm(rows))
+    if absolute == np.inf or np.inf in per_axis.values():
+        raise ValueError("Spec has no steps on some axes")
+    return absolute, per_axis
+
+
+def _smallest_norm(rows: List[np.ndarray]) -> float:
     # Normalize and remove zeros
-    norm_diffs = np.linalg.norm(absolute_diffs, axis=0)
+    norm_diffs = np.linalg.norm(rows, axis=0)
     norm_diffs = norm_diffs[norm_diffs > 0.0]
     # Return the smallest value (Aka. smallest step)
-    return np.amin(norm_diffs)
+    return np.amin(norm_diffs, initial=np.inf)
 
 
 def _abs_diffs(array: np.ndarray) -> np.ndarray:
@@ -351,20 +2536,66 @@ def _abs_diffs(array: np.ndarray) -> np.ndarray:
     return np.absolute(adjacent_diffs)
 
 
-def run_app(cors: bool = False, port: int = 8080) -> None:
-    """Run an application providing the scanspec service."""
-    if cors:
-        app.add_middleware(
-            CORSMiddleware,
-            allow_origins=["*"],
-            allow_credentials=True,
-            allow_methods=["*"],
-            allow_headers=["*"],
-        )
+#: Environment variable passing the run_app arguments to worker processes
+_WORKER_ENV = "SCANSPEC_SERVICE_WORKER"
+
+
+def run_app(
+    cors: bool = False,
+    port: int = 8080,
+    settings: Optional[ServiceSettings] = None,
+    workers: int = 1,
+) -> None:
+    """Run an application providing the scanspec service.
 
+    Args:
+        cors: Whether to allow cross-origin requests from anywhere
+        port: The port to serve on
+        settings: The limits to apply, the defaults if None
+        workers: The number of processes to serve from. If more than one and
+            settings.dims_store is None, a temporary directory is used so the
+            processes still share calculated dims
+    """
     import uvicorn
 
-    uvicorn.run(app, port=port)
+    if workers == 1:
+        if settings:
+            set_service_settings(settings)
+        if cors:
+            _allow_cors()
+        uvicorn.run(app, port=port)
+        return
+
+    settings = settings or ServiceSettings()
+    with tempfile.TemporaryDirectory(prefix="scanspec-dims-") as tmp:
+        if settings.dims_store is None:
+            settings = replace(settings, dims_store=tmp)
+        # Worker processes import this module afresh, so pass them the arguments
+        os.environ[_WORKER_ENV] = json.dumps(
+            {"cors": cors, "settings": asdict(settings)}
+        )
+        uvicorn.run(
+            "scanspec.service:_worker_app", factory=True, port=port, workers=workers
+        )
+
+
+def _worker_app() -> FastAPI:
+    """Make the app for a worker process started by run_app."""
+    arguments = json.loads(os.environ[_WORKER_ENV])
+    set_service_settings(ServiceSettings(**arguments["settings"]))
+    if arguments["cors"]:
+        _allow_cors()
+    return app
+
+
+def _allow_cors() -> None:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
 
 
 def scanspec_schema_text() -> str:
@@ -1,7 +1,19 @@
 from __future__ import annotations
 
-from dataclasses import asdict
-from typing import Any, Callable, Dict, Generic, List, Mapping, Optional, Tuple, Type
+import copy
+from dataclasses import fields, is_dataclass
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+)
 
 import numpy as np
 from pydantic import Field, parse_obj_as
@@ -19,10 +31,12 @@ from .core import (
     if_instance_do,
     squash_frames,
 )
+from .encoding import decode, encode
 from .regions import Region, get_mask
 
 __all__ = [
     "DURATION",
+    "DimSize",
     "Spec",
     "Product",
     "Repeat",
@@ -43,6 +57,58 @@ __all__ = [
 DURATION = "DURATION"
 
 
+class DimSize(NamedTuple):
+    """The size of one of the stack of `Frames` a `Spec` would calculate."""
+
+    #: The axes of the Frames
+    axes: List
+    #: The number of frames, or the most there could be if not exact
+    num: int
+    #: Whether num is exact, False if a `Region` may remove some of the frames
+    exact: bool = True
+
+
+#: Field names of each dataclass that has been serialized
+_FIELD_NAMES: Dict[type, Tuple[str, ...]] = {}
+
+#: Types that dataclasses.asdict returns without copying
+_ATOMIC_TYPES = (float, int, str, bool, type(None))
+
+
+def _serialize(value: Any) -> Any:
+    # Like dataclasses.asdict, but only copying lists, tuples and dicts
+    cls: Any = type(value)
+    if cls in _ATOMIC_TYPES:
+        return value
+    names = _FIELD_NAMES.get(cls)
+    if names is None and is_dataclass(value) and not isinstance(value, type):
+        names = _FIELD_NAMES.setdefault(cls, tuple(f.name for f in fields(value)))
+    if names is not None:
+        # Not a comprehension, which is an extra frame of recursion per spec
+        serialized = {}
+        for name in names:
+            serialized[name] = _serialize(getattr(value, name))
+        return serialized
+    elif cls is list:
+        return [_serialize(v) for v in value]
+    elif isinstance(value, tuple) and hasattr(value, "_fields"):
+        return cls(*[_serialize(v) for v in value])
+    elif isinstance(value, (list, tuple)):
+        return cls(_serialize(v) for v in value)
+    elif isinstance(value, dict):
+        return cls((_serialize(k), _serialize(v)) for k, v in value.items())
+    else:
+        return copy.deepcopy(value)
+
+
+def _squash_sizes(sizes: List[DimSize]) -> DimSize:
+    num = 1
+    for size in sizes:
+        num *= size.num
+    axes = [axis for size in sizes for axis in size.axes]
+    return DimSize(axes, num, all(size.exact for size in sizes))
+
+
 @discriminated_union_of_subclasses(config=StrictConfig)
 class Spec(Generic[Axis]):
     """A serializable representation of the type and parameters of a scan.
@@ -69,6 +135,18 @@ class Spec(Generic[Axis]):
         """
         raise NotImplementedError(self)
 
+    def dim_sizes(self) -> List[DimSize]:
+        """Return the sizes of the stack of `Frames` that `calculate` would produce.
+
+        Worked out from the parameters of the Spec without calculating any
+        frames, so it can be used to check a Spec is a sensible size first.
+
+        >>> spec = Line("y", 0, 1, 3) * ~Line("x", 0, 1, 100)
+        >>> [size.num for size in spec.dim_sizes()]
+        [3, 100]
+        """
+        raise NotImplementedError(self)
+
     def frames(self) -> Frames[Axis]:
         """Expand all the scan `Frames` and return them."""
         return Path(self.calculate()).consume()
@@ -102,14 +180,31 @@ class Spec(Generic[Axis]):
         return Concat(self, other)
 
     def serialize(self) -> Mapping[str, Any]:
-        """Serialize the spec to a dictionary."""
-        return asdict(self)  # type: ignore
+        """Serialize the spec to a dictionary.
+
+        The same as `dataclasses.asdict`, but quicker as it only copies lists,
+        tuples and dicts rather than deep-copying every field.
+
+        >>> spec = Line("x", 0, 1, 5)
+        >>> spec.serialize()
+        {'axis': 'x', 'start': 0.0, 'stop': 1.0, 'num': 5, 'type': 'Line'}
+        """
+        return _serialize(self)
 
     @classmethod
     def deserialize(cls, obj):
         """Deserialize the spec from a dictionary."""
         return parse_obj_as(cls, obj)
 
+    def to_bytes(self) -> bytes:
+        """Serialize the spec to the compact binary `scanspec.encoding`."""
+        return encode(self.serialize())
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        """Deserialize the spec from bytes made by `to_bytes`."""
+        return cls.deserialize(decode(data))
+
 
 @dataclass(config=StrictConfig)
 class Product(Spec[Axis]):
@@ -130,6 +225,9 @@ class Product(Spec[Axis]):
     def axes(self) -> List:
         return self.outer.axes() + self.inner.axes()
 
+    def dim_sizes(self) -> List[DimSize]:
+        return self.outer.dim_sizes() + self.inner.dim_sizes()
+
     def calculate(self, bounds=True, nested=False) -> List[Frames[Axis]]:
         frames_outer = self.outer.calculate(bounds=False, nested=nested)
         frames_inner = self.inner.calculate(bounds, nested=True)
@@ -169,6 +267,9 @@ class Repeat(Spec[Axis]):
     def axes(self) -> List:
         return []
 
+    def dim_sizes(self) -> List[DimSize]:
+        return [DimSize([], self.num)]
+
     def calculate(self, bounds=True, nested=False) -> List[Frames[Axis]]:
         return [Frames({}, gap=np.full(self.num, self.gap))]
 
@@ -206,6 +307,31 @@ class Zip(Spec[Axis]):
     def axes(self) -> List:
         return self.left.axes() + self.right.axes()
 
+    def dim_sizes(self) -> List[DimSize]:
+        sizes_left = self.left.dim_sizes()
+        sizes_right = self.right.dim_sizes()
+        assert len(sizes_left) >= len(
+            sizes_right
+        ), f"Zip requires len({self.left}) >= len({self.right})"
+        # A single frame on the right is expanded to the size of the left
+        if len(sizes_right) == 1 and sizes_right[0].num == 1:
+            axes, _, exact = sizes_right[0]
+            sizes_right = [DimSize(axes, sizes_left[-1].num, exact)]
+        npad = len(sizes_left) - len(sizes_right)
+        sizes = sizes_left[:npad]
+        for left, right in zip(sizes_left[npad:], sizes_right):
+            if left.exact and right.exact:
+                assert left.num == right.num, f"Zip sizes {left.num} != {right.num}"
+            # Only known if both are exact, otherwise the smaller is the most
+            sizes.append(
+                DimSize(
+                    left.axes + right.axes,
+                    min(left.num, right.num),
+                    left.exact and right.exact,
+                )
+            )
+        return sizes
+
     def calculate(self, bounds=True, nested=False) -> List[Frames[Axis]]:
         frames_left = self.left.calculate(bounds, nested)
         frames_right = self.right.calculate(bounds, nested)
@@ -274,6 +400,17 @@ class Mask(Spec[Axis]):
     def axes(self) -> List:
         return self.spec.axes()
 
+    def dim_sizes(self) -> List[DimSize]:
+        sizes = self.spec.dim_sizes()
+        for axis_set in self.region.axis_sets():
+            # Dims spanned by the region are squashed, then may lose frames
+            matches = [i for i, s in enumerate(sizes) if set(s.axes) & axis_set]
+            assert matches, f"No Specs match axes {list(axis_set)}"
+            si, ei = matches[0], matches[-1]
+            axes, num, _ = _squash_sizes(sizes[si : ei + 1])
+            sizes = sizes[:si] + [DimSize(axes, num, False)] + sizes[ei + 1 :]
+        return sizes
+
     def calculate(self, bounds=True, nested=False) -> List[Frames[Axis]]:
         frames = self.spec.calculate(bounds, nested)
         for axis_set in self.region.axis_sets():
@@ -332,6 +469,9 @@ class Snake(Spec[Axis]):
     def axes(self) -> List:
         return self.spec.axes()
 
+    def dim_sizes(self) -> List[DimSize]:
+        return self.spec.dim_sizes()
+
     def calculate(self, bounds=True, nested=False) -> List[Frames[Axis]]:
         return [
             SnakedFrames.from_frames(segment)
@@ -375,6 +515,12 @@ class Concat(Spec[Axis]):
         assert set(left_axes) == set(right_axes), f"axes {left_axes} != {right_axes}"
         return left_axes
 
+    def dim_sizes(self) -> List[DimSize]:
+        left = _squash_sizes(self.left.dim_sizes())
+        right = _squash_sizes(self.right.dim_sizes())
+        assert set(left.axes) == set(right.axes), f"axes {left.axes} != {right.axes}"
+        return [DimSize(left.axes, left.num + right.num, left.exact and right.exact)]
+
     def calculate(self, bounds=True, nested=False) -> List[Frames[Axis]]:
         dim_left = squash_frames(
             self.left.calculate(bounds, nested), nested and self.check_path_changes
@@ -409,6 +555,9 @@ class Squash(Spec[Axis]):
     def axes(self) -> List:
         return self.spec.axes()
 
+    def dim_sizes(self) -> List[DimSize]:
+        return [_squash_sizes(self.spec.dim_sizes())]
+
     def calculate(self, bounds=True, nested=False) -> List[Frames[Axis]]:
         dims = self.spec.calculate(bounds, nested)
         dim = squash_frames(dims, nested and self.check_path_changes)
@@ -461,6 +610,9 @@ class Line(Spec[Axis]):
     def axes(self) -> List:
         return [self.axis]
 
+    def dim_sizes(self) -> List[DimSize]:
+        return [DimSize(self.axes(), self.num)]
+
     def _line_from_indexes(self, indexes: np.ndarray) -> Dict[Axis, np.ndarray]:
         if self.num == 1:
             # Only one point, stop-start gives length of one point
@@ -541,6 +693,9 @@ class Static(Spec[Axis]):
     def axes(self) -> List:
         return [self.axis]
 
+    def dim_sizes(self) -> List[DimSize]:
+        return [DimSize(self.axes(), self.num)]
+
     def _repeats_from_indexes(self, indexes: np.ndarray) -> Dict[Axis, np.ndarray]:
         return {self.axis: np.full(len(indexes), self.value)}
 
@@ -581,6 +736,9 @@ class Spiral(Spec[Axis]):
         # TODO: reversed from __init__ args, a good idea?
         return [self.y_axis, self.x_axis]
 
+    def dim_sizes(self) -> List[DimSize]:
+        return [DimSize(self.axes(), self.num)]
+
     def _spiral_from_indexes(self, indexes: np.ndarray) -> Dict[Axis, np.ndarray]:
         # simplest spiral equation: r = phi
         # we want point spacing across area to be the same as between rings
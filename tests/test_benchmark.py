@@ -0,0 +1,31 @@
+from scanspec.benchmark import (
+    BenchmarkCase,
+    benchmark_cases,
+    format_results,
+    run_benchmark,
+)
+from scanspec.specs import Line
+
+
+def test_benchmark_in_process() -> None:
+    cases = benchmark_cases({"grid": Line("y", 0, 1, 3) * Line("x", 0, 1, 4)})
+    results = run_benchmark(cases, requests=6, concurrency=2, warmup=1)
+    assert [result.name for result in results] == [case.name for case in cases]
+    for result in results:
+        assert result.requests == 6
+        assert result.errors == 0
+        assert 0 < result.p50 <= result.p90 <= result.p99
+        assert result.throughput > 0
+
+
+def test_benchmark_counts_errors() -> None:
+    case = BenchmarkCase("bad", "/valid", {"type": "Line", "axis": "x"})
+    (result,) = run_benchmark([case], requests=3, warmup=0)
+    assert result.errors == 3
+
+
+def test_format_results_without_rss() -> None:
+    case = BenchmarkCase("line", "/valid", Line("x", 0, 1, 5).serialize())
+    (result,) = run_benchmark([case], requests=2, warmup=0, pid=-1)
+    assert result.peak_rss is None
+    assert format_results([result]).splitlines()[1].endswith("  -")
@@ -230,6 +230,69 @@ def test_plot_3D_line() -> None:
     assert_3d_arrow(arrow_artists[3], 2.5, 2, 6)
 
 
+def test_benchmark() -> None:
+    runner = CliRunner()
+    spec = 'Line("x", 1, 2, 2)'
+    result = runner.invoke(
+        cli.cli, ["benchmark", "--spec", spec, "--requests", "2", "--warmup", "0"]
+    )
+    assert result.exit_code == 0, result.output
+    lines = result.stdout.splitlines()
+    assert lines[0].split() == [
+        "case",
+        "requests",
+        "errors",
+        "req/s",
+        "p50",
+        "ms",
+        "p90",
+        "ms",
+        "p99",
+        "ms",
+        "rss",
+        "MiB",
+    ]
+    assert len(lines) == 8
+    assert lines[1].startswith(f"{spec} /valid ")
+
+
+def test_service_settings() -> None:
+    runner = CliRunner()
+    with patch("scanspec.service.run_app") as run_app:
+        result = runner.invoke(
+            cli.cli,
+            [
+                "service",
+                "--threads=2",
+                "--max-queued=3",
+                "--timeout=4.5",
+                "--frame-budget=5",
+                "--calculate-budget-mb=6",
+                "--dims-cache-mb=7",
+                "--response-cache-mb=8",
+                "--no-compress",
+                "--compress-level=9",
+                "--dims-store=/tmp/dims",
+                "--dims-store-mb=10",
+            ],
+        )
+    assert result.exit_code == 0, result.output
+    (cors, port, settings, workers), _ = run_app.call_args
+    assert (cors, port, workers) == (False, 8080, 1)
+    mb = 1024 * 1024
+    assert settings.workers == 2
+    assert settings.max_queued == 3
+    assert settings.timeout == 4.5
+    assert settings.frame_budget == 5
+    assert settings.calculate_budget == 6 * mb
+    assert settings.dims_cache_bytes == 7 * mb
+    assert settings.response_cache_bytes == 8 * mb
+    assert settings.compress_min_bytes is None
+    assert settings.compress_level == 9
+    assert settings.dims_store == "/tmp/dims"
+    assert settings.dims_store_bytes == 10 * mb
+
+
 def test_schema() -> None:
     # If this test fails, regenerate the schema by running
     # scanspec schema > schema.json
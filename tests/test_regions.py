@@ -0,0 +1,261 @@
+import numpy as np
+import pytest
+
+from scanspec import regions
+from scanspec.regions import (
+    MASK_CHUNK_SIZE,
+    Circle,
+    Ellipse,
+    EncodedPolygon,
+    MaskCache,
+    PointIndex,
+    Polygon,
+    Range,
+    Rectangle,
+    get_mask,
+    set_mask_cache,
+    set_mask_threads,
+)
+from scanspec.specs import Line, Spiral, Squash
+
+x, y, z = "x", "y", "z"
+
+
+@pytest.fixture
+def points():
+    # Enough points to need several chunks, with a partial one at the end
+    num = MASK_CHUNK_SIZE * 3 + 17
+    rng = np.random.default_rng(42)
+    return {x: rng.uniform(0, 10, num), y: rng.uniform(0, 10, num)}
+
+
+@pytest.mark.parametrize(
+    "region",
+    [
+        Range(x, 2, 5),
+        Circle(x, y, 5, 5, 3),
+        Rectangle(x, y, 1, 2, 6, 7, 30),
+        Ellipse(x, y, 5, 5, 2, 3, 75),
+        Polygon(x, y, [1.0, 6.0, 8.0, 2.0], [4.0, 10.0, 6.0, 1.0]),
+        (Circle(x, y, 3, 3, 2) | Range(x, 7, 8)) - Rectangle(x, y, 2, 2, 4, 4),
+    ],
+    ids=["range", "circle", "rectangle", "ellipse", "polygon", "combination"],
+)
+def test_threaded_mask_matches_serial(region, points) -> None:
+    expected = get_mask(region, points, num_threads=1)
+    actual = get_mask(region, points, num_threads=4)
+    assert actual.dtype == expected.dtype
+    assert np.array_equal(actual, expected)
+
+
+def test_set_mask_threads() -> None:
+    spec = Line(y, 0, 10, 300) * ~Line(x, 0, 10, 300) & Circle(x, y, 5, 5, 4)
+    expected = spec.frames().midpoints
+    set_mask_threads(8)
+    try:
+        actual = spec.frames().midpoints
+    finally:
+        set_mask_threads(1)
+    assert list(actual) == list(expected)
+    for axis in expected:
+        assert np.array_equal(actual[axis], expected[axis])
+
+
+def test_set_mask_threads_shares_a_pool(points) -> None:
+    region = Circle(x, y, 5, 5, 3)
+    set_mask_threads(4)
+    try:
+        get_mask(region, points)
+        executor = regions._mask_executor
+        assert executor is not None
+        get_mask(region, points)
+        assert regions._mask_executor is executor
+        set_mask_threads(2)
+        get_mask(region, points)
+        assert regions._mask_executor not in (None, executor)
+    finally:
+        set_mask_threads(1)
+
+
+def test_set_mask_threads_needs_a_thread() -> None:
+    with pytest.raises(AssertionError):
+        set_mask_threads(0)
+
+
+def _rotate(x, y, angle):
+    phi = np.radians(-angle)
+    return (
+        x * np.cos(phi) - y * np.sin(phi),
+        x * np.sin(phi) + y * np.cos(phi),
+    )
+
+
+@pytest.mark.parametrize("angle", [0, 30, -110])
+def test_rectangle_mask_matches_formula(points, angle) -> None:
+    region = Rectangle(x, y, 1, 2, 6, 7, angle)
+    rx, ry = _rotate(points[x] - 1, points[y] - 2, angle)
+    expected = (rx >= 0) & (rx <= 5) & (ry >= 0) & (ry <= 5)
+    assert np.array_equal(region.mask(points), expected)
+
+
+@pytest.mark.parametrize("angle", [0, 75, -20])
+def test_ellipse_mask_matches_formula(points, angle) -> None:
+    region = Ellipse(x, y, 5, 5, 2, 3, angle)
+    rx, ry = _rotate(points[x] - 5, points[y] - 5, angle)
+    expected = (rx / 2) ** 2 + (ry / 3) ** 2 <= 1
+    assert np.array_equal(region.mask(points), expected)
+
+
+@pytest.mark.parametrize(
+    "region", [Rectangle(x, y, 1, 2, 6, 7, 30), Ellipse(x, y, 5, 5, 2, 3, 75)]
+)
+def test_mask_no_points(region) -> None:
+    mask = region.mask({x: np.array([]), y: np.array([])})
+    assert mask.shape == (0,)
+
+
+@pytest.fixture
+def cache():
+    cache = MaskCache()
+    set_mask_cache(cache)
+    yield cache
+    set_mask_cache(None)
+
+
+def test_mask_cache_reuses_unchanged_children(cache: MaskCache, points) -> None:
+    rectangle = Rectangle(x, y, 1, 2, 6, 7, 30)
+    first = get_mask(Circle(x, y, 3, 3, 2) | rectangle, points)
+    assert (cache.hits, cache.misses) == (0, 3)
+    # Nudge the circle, only the rectangle should be reused
+    second = get_mask(Circle(x, y, 3.1, 3, 2) | rectangle, points)
+    assert (cache.hits, cache.misses) == (1, 5)
+    assert not np.array_equal(first, second)
+    assert np.array_equal(second, (Circle(x, y, 3.1, 3, 2) | rectangle).mask(points))
+    assert not second.flags.writeable
+
+
+def test_mask_cache_matches_points_by_identity(cache: MaskCache, points) -> None:
+    region = Circle(x, y, 3, 3, 2)
+    get_mask(region, points)
+    get_mask(region, {k: v.copy() for k, v in points.items()})
+    assert (cache.hits, cache.misses) == (0, 2)
+    get_mask(region, points)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_mask_cache_matches_points_by_hash(cache: MaskCache, points) -> None:
+    cache.hash_points = True
+    region = Circle(x, y, 3, 3, 2)
+    get_mask(region, points)
+    get_mask(region, {k: v.copy() for k, v in points.items()})
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_mask_cache_evicts_least_recently_used(cache: MaskCache, points) -> None:
+    num_points = len(points[x])
+    cache.max_bytes = 2 * num_points
+    regions = [Circle(x, y, 3, 3, r) for r in (1, 2, 3)]
+    for region in regions:
+        get_mask(region, points)
+    assert len(cache) == 2
+    assert cache.nbytes == 2 * num_points
+    assert cache.lookup(regions[0], points) is None
+    assert cache.lookup(regions[2], points) is not None
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.nbytes == 0
+
+
+def test_mask_cache_skips_threaded_chunks(cache: MaskCache, points) -> None:
+    region = Circle(x, y, 3, 3, 2) | Range(x, 7, 8)
+    get_mask(region, points, num_threads=4)
+    # Only the whole mask was cached, not the masks of each chunk
+    assert len(cache) == 1
+    assert get_mask(region, points, num_threads=4) is cache.lookup(region, points)
+
+
+def test_encoded_polygon_matches_polygon(points) -> None:
+    angles = np.linspace(0, 2 * np.pi, 5000, endpoint=False)
+    radii = 3 + np.sin(7 * angles)
+    x_verts = list(5 + radii * np.cos(angles))
+    y_verts = list(5 + radii * np.sin(angles))
+    polygon = Polygon(x, y, x_verts, y_verts)
+    encoded = EncodedPolygon.from_verts(x, y, x_verts, y_verts)
+    small = {k: v[:1000] for k, v in points.items()}
+    assert np.array_equal(encoded.mask(small), polygon.mask(small))
+
+
+def test_encoded_polygon_needs_matching_vertices() -> None:
+    with pytest.raises(ValueError, match="Mismatching vertex lengths 4 != 3"):
+        EncodedPolygon.from_verts(x, y, [0, 1, 1, 0], [0, 0, 1])
+
+
+@pytest.fixture
+def spiral_index() -> PointIndex:
+    (frames,) = Spiral(x, y, 5, 5, 10, 10, 20000).calculate()
+    return PointIndex.from_frames(frames, x, y)
+
+
+@pytest.mark.parametrize(
+    "region",
+    [
+        Range(x, 2, 5),
+        Range(z, 2, 5),
+        Circle(x, y, 5, 5, 0.5),
+        Rectangle(x, y, 1, 2, 3, 3, 30),
+        Rectangle(x, y, 1, 2, 3, 3, 200),
+        Ellipse(x, y, 5, 5, 2, 1, 75),
+        Polygon(x, y, [1.0, 6.0, 8.0, 2.0], [4.0, 10.0, 6.0, 1.0]),
+        Circle(x, y, 3, 3, 1) | Circle(x, y, 7, 7, 1),
+        Circle(x, y, 3, 3, 1) & Range(y, 3, 5),
+        Circle(x, y, 3, 3, 1) & Circle(x, y, 8, 8, 1),
+        Circle(x, y, 3, 3, 1) - Range(y, 3, 5),
+        Circle(x, y, 3, 3, 1) ^ Range(y, 3, 5),
+        Circle(x, y, 30, 30, 1),
+    ],
+    ids=[
+        "range",
+        "unindexed range",
+        "circle",
+        "rectangle",
+        "backwards rectangle",
+        "ellipse",
+        "polygon",
+        "union",
+        "intersection",
+        "disjoint intersection",
+        "difference",
+        "symmetric difference",
+        "outside",
+    ],
+)
+def test_index_mask_matches_get_mask(spiral_index: PointIndex, region) -> None:
+    points = {**spiral_index.points, z: np.zeros(len(spiral_index.points[x]))}
+    spiral_index.points = points
+    expected = get_mask(region, points)
+    assert np.array_equal(spiral_index.get_mask(region), expected)
+
+
+def test_index_candidates_are_a_small_subset(spiral_index: PointIndex) -> None:
+    region = Circle(x, y, 5, 5, 0.5)
+    candidates = spiral_index.candidates(region.bounding_box())
+    inside = get_mask(region, spiral_index.points).nonzero()[0]
+    assert set(inside) <= set(candidates)
+    assert len(candidates) < len(spiral_index.points[x]) / 20
+
+
+def test_index_includes_points_on_edges() -> None:
+    (frames,) = Squash(Line(y, 0, 10, 11) * Line(x, 0, 10, 11)).calculate()
+    index = PointIndex.from_frames(frames, x, y, points_per_cell=1)
+    region = Rectangle(x, y, 2, 3, 5, 7)
+    mask = index.get_mask(region)
+    assert mask.sum() == 4 * 5
+    assert np.array_equal(mask, region.mask(frames.midpoints))
+
+
+def test_index_mask_is_cached(cache: MaskCache, spiral_index: PointIndex) -> None:
+    region = Circle(x, y, 3, 3, 1) | Circle(x, y, 7, 7, 1)
+    mask = spiral_index.get_mask(region)
+    # Only the whole mask was cached, not the masks of the candidates
+    assert len(cache) == 1
+    assert spiral_index.get_mask(region) is mask
@@ -1,10 +1,14 @@
+import json
+from dataclasses import asdict
 from typing import Any, Mapping
 
 import pytest
 from pydantic import ValidationError
 
-from scanspec.regions import Circle, Rectangle, UnionOf
-from scanspec.specs import Line, Mask, Spec, Spiral
+from scanspec import core
+from scanspec.encoding import ENCODING_VERSION, decode, encode
+from scanspec.regions import Circle, EncodedPolygon, Polygon, Rectangle, UnionOf
+from scanspec.specs import Concat, Line, Mask, Spec, Spiral, Static
 
 
 def test_line_serializes() -> None:
@@ -103,6 +107,31 @@ def test_complex_nested_serializes() -> None:
     assert Spec.deserialize(serialized) == ob
 
 
+def test_encoded_polygon_serializes() -> None:
+    ob = Mask(
+        Line("y", 0, 1, 4) * Line("x", 0, 1, 4),
+        EncodedPolygon.from_verts("x", "y", [0, 1, 1], [0, 0, 1]),
+    )
+    serialized = {
+        "type": "Mask",
+        "spec": {
+            "type": "Product",
+            "outer": {"type": "Line", "axis": "y", "start": 0, "stop": 1, "num": 4},
+            "inner": {"type": "Line", "axis": "x", "start": 0, "stop": 1, "num": 4},
+        },
+        "region": {
+            "x_axis": "x",
+            "y_axis": "y",
+            "x_verts": "AAAAAAAAAAAAAAAAAADwPwAAAAAAAPA/",
+            "y_verts": "AAAAAAAAAAAAAAAAAAAAAAAAAAAAAPA/",
+            "type": "EncodedPolygon",
+        },
+        "check_path_changes": True,
+    }
+    assert ob.serialize() == serialized
+    assert Spec.deserialize(serialized) == ob
+
+
 @pytest.mark.parametrize(
     "serialized",
     [
@@ -139,9 +168,232 @@ def test_complex_nested_serializes() -> None:
             "outer": None,
             "inner": {"type": "Line", "axis": "x", "start": 0.0, "stop": 1.0, "num": 4},
         },
+        {
+            "type": "Mask",
+            "spec": {"type": "Line", "axis": "x", "start": 0.0, "stop": 1.0, "num": 4},
+            "region": {
+                "type": "EncodedPolygon",
+                "x_axis": "x",
+                "y_axis": "y",
+                "x_verts": "AAAAAAAAAAAAAAAAAADwPw==",
+                "y_verts": "AAAAAAAAAAAAAAAAAAAAAA==",
+            },
+        },
+        {
+            "type": "Mask",
+            "spec": {"type": "Line", "axis": "x", "start": 0.0, "stop": 1.0, "num": 4},
+            "region": {
+                "type": "EncodedPolygon",
+                "x_axis": "x",
+                "y_axis": "y",
+                "x_verts": "not base64!",
+                "y_verts": "AAAAAAAAAAAAAAAAAAAAAAAAAAAAAPA/",
+            },
+        },
+    ],
+    ids=[
+        "extra arg",
+        "missing arg",
+        "wrong type",
+        "null value",
+        "null spec",
+        "too few vertices",
+        "invalid base64",
     ],
-    ids=["extra arg", "missing arg", "wrong type", "null value", "null spec"],
 )
 def test_detects_invalid_serialized(serialized: Mapping[str, Any]) -> None:
     with pytest.raises(ValidationError):
         Spec.deserialize(serialized)
+
+
+_LINE = {"type": "Line", "axis": "x", "start": 0.0, "stop": 1.0, "num": 4}
+
+
+@pytest.mark.parametrize(
+    "serialized",
+    [
+        _LINE,
+        {"type": "Line", "axis": "x", "start": 0, "stop": 1, "num": 4},
+        {"type": "Line", "axis": "x", "start": "0", "stop": True, "num": 4.5},
+        {"type": "Line", "start": 0, "stop": 1, "num": 4},
+        {"type": "Concat", "left": _LINE, "right": _LINE, "gap": 1},
+        {"type": "Concat", "left": _LINE, "right": _LINE, "gap": True},
+        {"type": "Product", "outer": _LINE, "inner": _LINE, "extra": 1},
+        {"type": "Product", "outer": _LINE, "inner": {**_LINE, "type": "Foo"}},
+        {"type": "Product", "outer": _LINE},
+        {"type": "Foo"},
+        {"spec": _LINE},
+        {**_LINE, "type": ["Line"]},
+        {**_LINE, "type": {"Line": 1}},
+        [_LINE],
+        {
+            "type": "Mask",
+            "spec": {"type": "Squash", "spec": _LINE},
+            "region": {
+                "type": "Polygon",
+                "x_axis": "x",
+                "y_axis": "y",
+                "x_verts": [0, 1.5, 2],
+                "y_verts": (0, 1, 2),
+            },
+        },
+        {
+            "type": "Mask",
+            "spec": _LINE,
+            "region": {
+                "type": "DifferenceOf",
+                "left": {"type": "Range", "axis": "x", "min": 0, "max": 1},
+                "right": {
+                    "type": "EncodedPolygon",
+                    "x_axis": "x",
+                    "y_axis": "y",
+                    "x_verts": "AAAAAAAAAAAAAAAAAADwPw==",
+                    "y_verts": "AAAAAAAAAAAAAAAAAAAAAA==",
+                },
+            },
+        },
+    ],
+    ids=[
+        "line",
+        "ints for floats",
+        "strings and bools for numbers",
+        "default axis",
+        "int for bool",
+        "bool",
+        "extra arg",
+        "unknown nested type",
+        "missing arg",
+        "unknown type",
+        "missing type",
+        "list type",
+        "dict type",
+        "not a dict",
+        "polygon",
+        "mismatched vertices",
+    ],
+)
+def test_fast_deserialize_matches_pydantic(
+    serialized: Any, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    def deserialize() -> Any:
+        try:
+            spec = Spec.deserialize(serialized)
+        except ValidationError as e:
+            return e.errors()
+        return spec, {k: (type(v), v) for k, v in vars(spec).items()}
+
+    fast = deserialize()
+
+    def parse_slowly(union_cls, v):
+        raise core._SlowPath()
+
+    monkeypatch.setattr(core, "_parse_fast", parse_slowly)
+    assert deserialize() == fast
+
+
+def test_fast_deserialize_of_large_polygon() -> None:
+    x_verts = [float(x) for x in range(5000)]
+    ob = Mask(Line("x", 0, 1, 4), Polygon("x", "y", x_verts, x_verts[::-1]))
+    deserialized = Spec.deserialize(ob.serialize())
+    assert deserialized == ob
+    assert deserialized.region.__pydantic_initialised__
+    # Parsed without falling back to pydantic
+    assert core._parse_fast(Spec, ob.serialize()) == ob
+
+
+@pytest.mark.parametrize(
+    "ob",
+    [
+        Line("x", 0, 1, 4),
+        Concat(Line("x", 0, 1, 4), Static("y", 2), gap=True) * ~Line("z", 0, 1, 3),
+        Mask(
+            Spiral("x", "y", 0, 0, 10, 10, 50),
+            Polygon("x", "y", [0, 1, 1], [0, 0, 1])
+            - Circle("x", "y", x_middle=0, y_middle=1, radius=4),
+        ),
+        Mask(
+            Line("x", 0, 1, 4),
+            EncodedPolygon.from_verts("x", "y", [0, 1, 1], [1, 0, 1]),
+        ),
+    ],
+    ids=["line", "product", "polygon", "encoded polygon"],
+)
+def test_serialize_matches_asdict(ob: Spec) -> None:
+    expected = asdict(ob)  # type: ignore
+    assert ob.serialize() == expected
+    assert Spec.deserialize(ob.serialize()) == ob
+
+
+def test_serialize_follows_changes_to_specs() -> None:
+    inner = Line("x", 0, 1, 4)
+    spec = Concat(Line("x", 1, 2, 3), inner)
+    serialized = spec.serialize()
+    serialized["right"]["num"] = 99
+    assert spec.serialize()["right"]["num"] == 4
+    inner.num = 10
+    assert spec.serialize()["right"]["num"] == 10
+
+
+@pytest.mark.parametrize(
+    "ob",
+    [
+        Line("x", 0, 1, 4),
+        Line("my axis", -1e300, 0.1, 2**40),
+        Concat(Line("x", 0, 1, 4), Static("y", -2.5), gap=True) * ~Line("z", 0, 1, 3),
+        Mask(
+            Spiral("x", "y", 0, 0, 10, 10, 50),
+            Polygon("x", "y", [0, 1.5, 1], [-0.0, 0, 1])
+            - Circle("x", "y", x_middle=0, y_middle=1, radius=4),
+        ),
+        Mask(
+            Line("x", 0, 1, 4),
+            EncodedPolygon.from_verts("x", "y", [0, 1, 1], [1, 0, 1]),
+        ),
+    ],
+    ids=["line", "unusual values", "product", "polygon", "encoded polygon"],
+)
+def test_encoding_round_trips(ob: Spec) -> None:
+    encoded = ob.to_bytes()
+    assert encoded[:5] == b"SCSP" + bytes([ENCODING_VERSION])
+    decoded = decode(encoded)
+    assert decoded == ob.serialize()
+    assert [type(v) for v in decoded.values()] == [
+        type(v) for v in ob.serialize().values()
+    ]
+    assert Spec.from_bytes(encoded) == ob
+
+
+def test_encoding_is_compact() -> None:
+    verts = [float(v) / 7 for v in range(1000)]
+    ob = Mask(Line("x", 0, 1, 4), Polygon("x", "y", verts, verts[::-1]))
+    # 8 bytes per vertex, with a few bytes for the rest
+    assert len(ob.to_bytes()) < 2000 * 8 + 100
+    assert len(ob.to_bytes()) < len(json.dumps(ob.serialize())) / 2
+
+
+def test_encoding_keeps_signed_zero() -> None:
+    decoded = decode(encode({"a": -0.0, "b": [-0.0, 1.0]}))
+    assert str(decoded) == "{'a': -0.0, 'b': [-0.0, 1.0]}"
+
+
+@pytest.mark.parametrize(
+    "data,message",
+    [
+        (b"{}", "Not an encoded spec"),
+        (b"SCSP\x02", "Spec encoding version 2 is not supported, only up to 1"),
+        (encode({"a": [1, 2]})[:-1], "Truncated or corrupt encoded spec"),
+        (encode({"a": [1.5, 2.5]})[:-1], "Truncated or corrupt encoded spec"),
+        (encode({"a": 1}) + b"\x00", "1 unexpected bytes after encoded spec"),
+        (b"SCSP\x01\x00\x10", "Unknown tag 16 in encoded spec"),
+        (b"SCSP\x01\x00" + b"\x07\x01" * 100000 + b"\x07\x00", "Truncated or corrupt"),
+    ],
+    ids=["magic", "version", "truncated", "truncated floats", "extra", "tag", "deep"],
+)
+def test_decode_invalid(data: bytes, message: str) -> None:
+    with pytest.raises(ValueError, match=message):
+        decode(data)
+
+
+def test_encode_invalid() -> None:
+    with pytest.raises(TypeError, match="Can't encode"):
+        encode({"a": object()})
@@ -1,11 +1,51 @@
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import asdict
-from typing import Any
+from typing import Any, Dict, Iterator, List, Optional, cast
 
+import numpy as np
 import pytest
+from fastapi import HTTPException, Request
 from fastapi.testclient import TestClient
 
-from scanspec.service import PointsFormat, PointsRequest, app
-from scanspec.specs import Line
+from scanspec import service
+from scanspec.core import Frames, Path
+from scanspec.regions import Circle, Range
+from scanspec.service import (
+    BINARY_MEDIA_TYPE,
+    STEP_CHUNK_SIZE,
+    BatchItem,
+    BatchOperation,
+    BatchRequest,
+    PointsFormat,
+    PointsRequest,
+    ServiceSettings,
+    StreamRequest,
+    _dims_cache,
+    _edges_cache,
+    _response_cache,
+    app,
+    decode_binary_points,
+    set_service_settings,
+)
+from scanspec.specs import (
+    DURATION,
+    Concat,
+    Line,
+    Repeat,
+    Spec,
+    Spiral,
+    Zip,
+    fly,
+    get_constant_duration,
+    step,
+)
 
 
 @pytest.fixture
@@ -13,6 +53,15 @@ def client() -> TestClient:
     return TestClient(app)
 
 
+@pytest.fixture(autouse=True)
+def clear_caches() -> None:
+    _dims_cache.clear()
+    _edges_cache.clear()
+    _response_cache.clear()
+    for metric in service._METRICS:
+        metric.clear()
+
+
 # MIDPOINTS TEST(S) #
 @pytest.mark.parametrize(
     "format,expected_midpoints",
@@ -40,6 +89,17 @@ def test_midpoints(
     }
 
 
+def test_float_list_roundtrips_exactly(client: TestClient) -> None:
+    spec = Spiral.spaced("x", "y", 0, 0, 10, 10, 0.3)
+    request = PointsRequest(spec, max_frames=None, format=PointsFormat.FLOAT_LIST)
+    response = client.post("/bounds", json=asdict(request))
+    assert response.status_code == 200
+    frames = spec.frames()
+    for axis in "xy":
+        assert response.json()["lower"][axis] == frames.lower[axis].tolist()
+        assert response.json()["upper"][axis] == frames.upper[axis].tolist()
+
+
 def test_subsampling(client: TestClient) -> None:
     spec = Line("x", 0, 10, 5) * Line("y", 0, 10, 5)
     request = PointsRequest(spec, max_frames=8, format=PointsFormat.FLOAT_LIST)
@@ -47,12 +107,279 @@ def test_subsampling(client: TestClient) -> None:
     assert response.status_code == 200
     assert response.json() == {
         "total_frames": 25,
-        "returned_frames": 8,
+        "returned_frames": 4,
         "format": "FLOAT_LIST",
         "midpoints": {"x": [0.0, 0.0, 10.0, 10.0], "y": [0.0, 10.0, 0.0, 10.0]},
     }
 
 
+@pytest.mark.parametrize(
+    "start,num,max_frames,expected",
+    [
+        (None, 4, 100, [0, 1, 2, 3]),
+        (4, 4, 100, [4, 5, 6, 7]),
+        (20, None, 100, [20, 21, 22, 23, 24]),
+        (20, 10, 100, [20, 21, 22, 23, 24]),
+        (4, 10, 3, [4, 5, 6]),
+        (30, 10, 100, []),
+    ],
+    ids=["first", "second", "to end", "past end", "capped", "empty"],
+)
+def test_paging(
+    client: TestClient,
+    start: Any,
+    num: Any,
+    max_frames: int,
+    expected: Any,
+) -> None:
+    spec = Line("y", 0, 10, 5) * ~Line("x", 0, 10, 5)
+    request = PointsRequest(spec, max_frames=max_frames, start=start, num=num)
+    response = client.post("/bounds", json=asdict(request))
+    assert response.status_code == 200
+    assert response.json()["total_frames"] == 25
+    assert response.json()["returned_frames"] == len(expected)
+    frames = spec.frames()
+    for axis in "xy":
+        assert response.json()["lower"][axis] == frames.lower[axis][expected].tolist()
+
+
+def test_pages_share_calculated_dims(client: TestClient) -> None:
+    hits, misses = _dims_cache.hits, _dims_cache.misses
+    spec = Line("y", 0, 10, 30) * ~Line("x", 0, 10, 40)
+    pages = []
+    for start in range(0, 1200, 500):
+        request = PointsRequest(spec, start=start, num=500)
+        response = client.post("/midpoints", json=asdict(request))
+        pages.append(response.json()["midpoints"])
+    assert _dims_cache.hits - hits == 2
+    assert _dims_cache.misses - misses == 1
+    assert len(_dims_cache) == 1
+    midpoints = spec.frames().midpoints
+    for axis in "xy":
+        joined = list(itertools.chain.from_iterable(p[axis] for p in pages))
+        assert joined == midpoints[axis].tolist()
+
+
+def test_subsampling_keeps_region_edges(client: TestClient) -> None:
+    spec = Line("y", 0, 10, 200) * ~Line("x", 0, 10, 200) & Circle("x", "y", 5, 5, 4)
+    (frames,) = spec.calculate()
+    gap = frames.gap.nonzero()[0]
+    edges = np.union1d(gap, gap - 1)[1:]
+    request = PointsRequest(spec, max_frames=len(frames) // 10)
+    response = client.post("/midpoints", json=asdict(request))
+    midpoints = response.json()["midpoints"]
+    assert len(edges) < len(midpoints["x"]) <= len(frames) // 10
+    returned = set(zip(midpoints["x"], midpoints["y"]))
+    for index in edges:
+        assert (frames.midpoints["x"][index], frames.midpoints["y"][index]) in returned
+
+
+@pytest.mark.parametrize("max_frames", [4, 5, 7, 100, 313])
+def test_subsampling_returns_max_frames(client: TestClient, max_frames: int) -> None:
+    spec = Spiral("x", "y", 0, 0, 10, 10, 314)
+    request = PointsRequest(spec, max_frames=max_frames)
+    response = client.post("/midpoints", json=asdict(request))
+    assert response.json()["returned_frames"] == max_frames
+    assert len(response.json()["midpoints"]["x"]) == max_frames
+
+
+@pytest.mark.parametrize("num,max_frames", [(10, 3), (100, 9), (1000, 37)])
+def test_subsampling_is_evenly_spaced(
+    client: TestClient, num: int, max_frames: int
+) -> None:
+    spec = Line("x", 0, num - 1, num)
+    request = PointsRequest(spec, max_frames=max_frames)
+    response = client.post("/midpoints", json=asdict(request))
+    expected = np.linspace(0, num - 1, max_frames, dtype=np.int64)
+    assert response.json()["midpoints"]["x"] == expected.tolist()
+
+
+def test_subsampling_is_evenly_spaced_between_gaps(client: TestClient) -> None:
+    spec = Concat(Line("x", 0, 59, 60), Line("x", 100, 139, 40), gap=True)
+    request = PointsRequest(spec, max_frames=20)
+    response = client.post("/midpoints", json=asdict(request))
+    x = np.array(response.json()["midpoints"]["x"])
+    assert len(x) == 20
+    # Both sides of the gap are kept, with frames shared between the runs
+    # either side of it in proportion to their lengths
+    first, second = x[x < 100], x[x >= 100]
+    assert [first[0], first[-1], second[0], second[-1]] == [0, 59, 100, 139]
+    assert (len(first), len(second)) == (12, 8)
+    for run in (first, second):
+        steps = np.diff(run)
+        assert steps.max() - steps.min() <= 1
+
+
+def test_subsampling_reuses_edges(client: TestClient) -> None:
+    spec = Line("y", 0, 10, 300) * ~Line("x", 0, 10, 400)
+    for max_frames in (1000, 10000, 3000):
+        request = PointsRequest(spec, max_frames=max_frames)
+        response = client.post("/midpoints", json=asdict(request))
+        assert len(response.json()["midpoints"]["x"]) <= max_frames
+    assert (_edges_cache.hits, _edges_cache.misses) == (2, 1)
+
+
+def test_midpoints_stream(client: TestClient) -> None:
+    spec = Line("y", 0, 10, 5) * Line("x", 0, 10, 5)
+    request = StreamRequest(spec, max_frames=None, chunk_frames=10)
+    with client.stream("POST", "/midpoints/stream", json=asdict(request)) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        chunks = [json.loads(line) for line in response.iter_lines()]
+    assert [c["returned_frames"] for c in chunks] == [10, 10, 5]
+    assert {c["total_frames"] for c in chunks} == {25}
+    x = [p for c in chunks for p in c["midpoints"]["x"]]
+    assert x == pytest.approx(spec.frames().midpoints["x"])
+
+
+def test_midpoints_stream_subsampled(client: TestClient) -> None:
+    spec = Line("x", 0, 10, 5) * Line("y", 0, 10, 5)
+    request = StreamRequest(spec, max_frames=8, chunk_frames=3)
+    response = client.post("/midpoints/stream", json=asdict(request))
+    assert response.status_code == 200
+    chunks = [json.loads(line) for line in response.text.splitlines()]
+    assert [c["returned_frames"] for c in chunks] == [3, 1]
+    assert chunks[-1]["midpoints"] == {"x": [10.0], "y": [10.0]}
+
+
+def test_midpoints_binary(client: TestClient) -> None:
+    spec = Line("y", 0, 10, 3) * Line("x", 0, 10, 4)
+    request = PointsRequest(spec, max_frames=None)
+    response = client.post(
+        "/midpoints", json=asdict(request), headers={"Accept": BINARY_MEDIA_TYPE}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == BINARY_MEDIA_TYPE
+    assert int(response.headers["content-length"]) == len(response.content)
+    (message,) = decode_binary_points(response.content)
+    assert message["total_frames"] == message["returned_frames"] == 12
+    expected = spec.frames().midpoints
+    assert list(message["midpoints"]) == ["y", "x"]
+    for axis, points in message["midpoints"].items():
+        assert points.dtype == np.dtype("<f8")
+        assert np.array_equal(points, expected[axis])
+
+
+def test_midpoints_stream_binary(client: TestClient) -> None:
+    spec = Line("y", 0, 10, 5) * Line("x", 0, 10, 5)
+    request = StreamRequest(spec, max_frames=None, chunk_frames=10)
+    response = client.post(
+        "/midpoints/stream",
+        json=asdict(request),
+        headers={"Accept": BINARY_MEDIA_TYPE},
+    )
+    assert response.status_code == 200
+    messages = decode_binary_points(response.content)
+    assert [m["returned_frames"] for m in messages] == [10, 10, 5]
+    x = np.concatenate([m["midpoints"]["x"] for m in messages])
+    assert np.array_equal(x, spec.frames().midpoints["x"])
+
+
+@pytest.mark.parametrize("accept", ["application/json", BINARY_MEDIA_TYPE])
+def test_midpoints_stream_is_consumed_in_pool(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch, accept: str
+) -> None:
+    threads = []
+
+    def consume(path: Path, num: Optional[int] = None) -> Frames[str]:
+        threads.append(threading.current_thread().name)
+        return path.consume(num)
+
+    monkeypatch.setattr(service, "_consume", consume)
+    spec = Line("y", 0, 10, 5) * Line("x", 0, 10, 5)
+    request = StreamRequest(spec, max_frames=None, chunk_frames=10)
+    response = client.post(
+        "/midpoints/stream", json=asdict(request), headers={"Accept": accept}
+    )
+    assert response.status_code == 200
+    assert len(threads) == 3
+    assert all(name.startswith("scanspec-worker") for name in threads)
+
+
+def test_midpoints_websocket(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(service, "WEBSOCKET_CHUNK_FRAMES", 4)
+    spec = Line("y", 0, 10, 5) * Line("x", 0, 10, 5)
+    request = PointsRequest(spec, max_frames=None)
+    messages = []
+    with client.websocket_connect("/midpoints/ws") as websocket:
+        websocket.send_json(asdict(request))
+        assert websocket.receive_json() == {"total_frames": 25, "frames": 25}
+        for credit, num_messages in [(10, 3), (1, 1), (20, 4)]:
+            websocket.send_json({"frames": credit})
+            for _ in range(num_messages):
+                messages += decode_binary_points(websocket.receive_bytes())
+        assert websocket.receive()["type"] == "websocket.close"
+    # Credit is split into messages of at most WEBSOCKET_CHUNK_FRAMES
+    assert [m["returned_frames"] for m in messages] == [4, 4, 2, 1, 4, 4, 4, 2]
+    assert {m["total_frames"] for m in messages} == {25}
+    x = np.concatenate([m["midpoints"]["x"] for m in messages])
+    assert np.array_equal(x, spec.frames().midpoints["x"])
+
+
+def test_midpoints_websocket_subsampled(client: TestClient) -> None:
+    spec = Line("x", 0, 10, 5) * Line("y", 0, 10, 5)
+    request = PointsRequest(spec, max_frames=8)
+    with client.websocket_connect("/midpoints/ws") as websocket:
+        websocket.send_json(asdict(request))
+        assert websocket.receive_json() == {"total_frames": 25, "frames": 4}
+        websocket.send_json({"frames": 100})
+        (message,) = decode_binary_points(websocket.receive_bytes())
+        assert websocket.receive()["type"] == "websocket.close"
+    assert message["returned_frames"] == 4
+    assert message["midpoints"]["x"][-1] == 10.0
+
+
+@pytest.mark.parametrize(
+    "credit", [{"frames": 0}, {"frames": "lots"}, {"more": 5}, ["frames"]]
+)
+def test_midpoints_websocket_bad_credit(client: TestClient, credit: Any) -> None:
+    request = PointsRequest(Line("x", 0, 1, 5), max_frames=None)
+    with client.websocket_connect("/midpoints/ws") as websocket:
+        websocket.send_json(asdict(request))
+        websocket.receive_json()
+        websocket.send_json(credit)
+        message = websocket.receive()
+    assert message["type"] == "websocket.close"
+    assert message["code"] == 1008
+
+
+def test_midpoints_websocket_frame_budget(client: TestClient) -> None:
+    set_service_settings(ServiceSettings(frame_budget=10))
+    try:
+        request = PointsRequest(Line("x", 0, 1, 50), max_frames=None)
+        with client.websocket_connect("/midpoints/ws") as websocket:
+            websocket.send_json(asdict(request))
+            message = websocket.receive()
+    finally:
+        set_service_settings(ServiceSettings())
+    assert message["type"] == "websocket.close"
+    assert message["code"] == 1009
+    assert "more than the budget of 10" in message["reason"]
+
+
+@pytest.mark.parametrize(
+    "accept,binary",
+    [
+        (None, False),
+        ("*/*", False),
+        ("application/json", False),
+        (BINARY_MEDIA_TYPE, True),
+        (f"application/json;q=0.9, {BINARY_MEDIA_TYPE}", True),
+        (f"application/json, {BINARY_MEDIA_TYPE};q=0.5", False),
+        (f"{BINARY_MEDIA_TYPE};q=0", False),
+    ],
+)
+def test_binary_negotiation(client: TestClient, accept: Any, binary: bool) -> None:
+    request = PointsRequest(Line("x", 0.0, 1.0, 5))
+    headers = {"Accept": accept} if accept else {}
+    response = client.post("/midpoints", json=asdict(request), headers=headers)
+    assert response.status_code == 200
+    content_type = BINARY_MEDIA_TYPE if binary else "application/json"
+    assert response.headers["content-type"] == content_type
+
+
 # BOUNDS TEST(S) #
 @pytest.mark.parametrize(
     "format,expected_lower,expected_upper",
@@ -90,6 +417,17 @@ def test_bounds(
     }
 
 
+def test_bounds_binary(client: TestClient) -> None:
+    request = PointsRequest(Line("x", 0.0, 1.0, 5), max_frames=5)
+    response = client.post(
+        "/bounds", json=asdict(request), headers={"Accept": BINARY_MEDIA_TYPE}
+    )
+    assert response.status_code == 200
+    (message,) = decode_binary_points(response.content)
+    assert message["lower"]["x"] == pytest.approx([-0.125, 0.125, 0.375, 0.625, 0.875])
+    assert message["upper"]["x"] == pytest.approx([0.125, 0.375, 0.625, 0.875, 1.125])
+
+
 # GAP TEST(S) #
 def test_gap(client: TestClient) -> None:
     spec = Line("y", 0.0, 10.0, 3) * Line("x", 0.0, 10.0, 3)
@@ -100,6 +438,65 @@ def test_gap(client: TestClient) -> None:
     }
 
 
+@pytest.mark.parametrize(
+    "spec",
+    [
+        Line.bounded("z", 0, 1, 2)
+        * Line.bounded("y", 0, 1, 3)
+        * Line.bounded("x", 0, 1, 4),
+        Line("z", 0, 1, 2) * ~Line.bounded("y", 0, 1, 3) * ~Line.bounded("x", 0, 1, 4),
+        Repeat(3, gap=False) * ~Line.bounded("x", 0, 1, 4),
+        Line("y", 0, 1, 5) * Concat(Line.bounded("x", 0, 1, 4), Line("x", 1, 2, 3)),
+        Line("y", 0, 10, 5) * ~Line("x", 0, 10, 5) & Circle("x", "y", 5, 5, 4),
+        step(Line("y", 0, 1, 3) * ~Line("x", 0, 1, 4), 0.1),
+        Spiral("x", "y", 0, 0, 10, 10, 50),
+        Line("x", 0, 1, 0) * Line("y", 0, 1, 3),
+        Line("z", 0, 1, 2) * (Line("x", 1, 2, 3) & Range("x", 5, 6)),
+    ],
+    ids=[
+        "raster",
+        "snake",
+        "repeat",
+        "concat",
+        "mask",
+        "step",
+        "spiral",
+        "empty",
+        "empty inner",
+    ],
+)
+def test_gap_formats_match_path(client: TestClient, spec: Spec) -> None:
+    gap = Path(spec.calculate()).consume().gap
+    json = spec.serialize()
+    response = client.post("/gap", json=json)
+    assert response.json() == {"gap": gap.tolist()}
+    response = client.post("/gap", json=json, params={"format": "GAP_INDICES"})
+    assert response.json() == {
+        "total_frames": len(gap),
+        "indices": gap.nonzero()[0].tolist(),
+    }
+    response = client.post("/gap", json=json, params={"format": "RUN_LENGTH"})
+    assert response.json()["total_frames"] == len(gap)
+    runs = response.json()["runs"]
+    assert sum(runs) == len(gap)
+    decoded = np.repeat(np.arange(len(runs)) % 2 == 1, runs)
+    assert decoded.tolist() == gap.tolist()
+
+
+def test_gap_indices_do_not_need_frame_budget(client: TestClient) -> None:
+    set_service_settings(ServiceSettings(frame_budget=1000))
+    try:
+        spec = Line.bounded("y", 0, 1, 1000) * Line.bounded("x", 0, 1, 10000)
+        response = client.post(
+            "/gap", json=spec.serialize(), params={"format": "RUN_LENGTH"}
+        )
+        assert response.status_code == 200
+        assert response.json()["runs"] == [0] + [1, 9999] * 1000
+        assert client.post("/gap", json=spec.serialize()).status_code == 413
+    finally:
+        set_service_settings(ServiceSettings())
+
+
 # SMALLEST STEP TEST(S) #
 def test_smallest_step(client: TestClient) -> None:
     spec = Line("y", 0.0, 10.0, 3) * Line("x", 0.0, 10.0, 5)
@@ -108,6 +505,474 @@ def test_smallest_step(client: TestClient) -> None:
     assert response.json() == {"absolute": 2.5, "per_axis": {"y": 5.0, "x": 2.5}}
 
 
+# WORKER POOL TEST(S) #
+@pytest.fixture
+def blocked_calculate(monkeypatch: pytest.MonkeyPatch) -> Iterator[threading.Event]:
+    # Make the heavy routes wait in the worker pool until the event is set
+    release = threading.Event()
+    calculate = service._calculate
+
+    def blocked(spec: Spec):
+        release.wait(timeout=5)
+        return calculate(spec)
+
+    monkeypatch.setattr(service, "_calculate", blocked)
+    yield release
+    release.set()
+    set_service_settings(ServiceSettings())
+
+
+def test_frame_budget(client: TestClient) -> None:
+    set_service_settings(ServiceSettings(frame_budget=10))
+    try:
+        spec = Line("y", 0, 10, 5) * Line("x", 0, 10, 5)
+        response = client.post("/midpoints", json=asdict(PointsRequest(spec)))
+        assert response.status_code == 413
+        assert response.json() == {
+            "detail": "Request would generate 25 frames, more than the budget of 10"
+        }
+        request = PointsRequest(spec, start=5, num=10)
+        assert client.post("/midpoints", json=asdict(request)).status_code == 200
+        request = PointsRequest(spec, max_frames=8)
+        assert client.post("/bounds", json=asdict(request)).status_code == 200
+        assert client.post("/gap", json=spec.serialize()).status_code == 413
+    finally:
+        set_service_settings(ServiceSettings())
+
+
+@pytest.mark.parametrize("route", ["/gap", "/smalleststep"])
+def test_calculate_budget(client: TestClient, route: str) -> None:
+    set_service_settings(ServiceSettings(calculate_budget=1024 * 1024))
+    try:
+        # 10^10 frames, but only 2 * 10^5 frames of dims
+        spec = Line("y", 0, 1, 100000) * Line("x", 0, 1, 100000)
+        assert client.post(route, json=spec.serialize()).status_code == 413
+        response = client.post(route, json=(Line("x", 0, 1, 100000)).serialize())
+        assert response.status_code == 413
+        assert response.json()["detail"] == (
+            "Spec would need 2500000 bytes to calculate dimensions of shape "
+            "(100000,), more than the budget of 1048576 bytes. Reduce the number "
+            "of frames, or see /estimate"
+        )
+        assert len(_dims_cache) == 0
+        spec = Line("y", 0, 1, 1000) * Line("x", 0, 1, 1000)
+        assert client.post(route, json=spec.serialize()).status_code == 200
+    finally:
+        set_service_settings(ServiceSettings())
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        Line("y", 0, 1, 300) * ~Line("x", 0, 1, 400),
+        Line("y", 0, 1, 300).zip(Line("x", 0, 1, 300)),
+        Spiral("x", "y", 0, 0, 1, 1, 1000) & Circle("x", "y", 0, 0, 0.3),
+    ],
+)
+def test_estimate(client: TestClient, spec: Spec) -> None:
+    response = client.post("/estimate", json=spec.serialize())
+    assert response.status_code == 200
+    estimate = response.json()
+    dims = spec.calculate()
+    assert len(_dims_cache) == 0
+    assert estimate["exact"] == (len(Path(dims)) == estimate["total_frames"])
+    assert len(Path(dims)) <= estimate["total_frames"]
+    # An upper bound, but not by much
+    nbytes = service._freeze_dims(dims)
+    assert nbytes <= estimate["dims_bytes"] <= nbytes * 3
+
+
+def test_estimate_invalid_spec(client: TestClient) -> None:
+    spec = Line("x", 0, 1, 3).zip(Line("y", 0, 1, 3) * Line("z", 0, 1, 3))
+    response = client.post("/estimate", json=spec.serialize())
+    assert response.status_code == 422
+    assert response.json()["detail"].startswith("Zip requires len(")
+
+
+def test_full_pool_responds_busy(
+    client: TestClient, blocked_calculate: threading.Event
+) -> None:
+    set_service_settings(ServiceSettings(workers=1, max_queued=1))
+    spec = Line("x", 0, 1, 5)
+    with ThreadPoolExecutor() as executor:
+        # One running and one queued
+        futures = [
+            executor.submit(client.post, "/gap", json=spec.serialize())
+            for _ in range(2)
+        ]
+        while service._in_pool < 2:
+            time.sleep(0.01)
+        response = client.post("/smalleststep", json=spec.serialize())
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+        # Light routes still respond
+        assert client.post("/valid", json=spec.serialize()).status_code == 200
+        blocked_calculate.set()
+        assert [f.result().status_code for f in futures] == [200, 200]
+    assert service._in_pool == 0
+
+
+def test_timeout_cancels_calculation(
+    client: TestClient, blocked_calculate: threading.Event
+) -> None:
+    set_service_settings(ServiceSettings(timeout=0.1))
+    spec = Line("x", 0, 1, 5)
+    response = client.post("/midpoints", json=asdict(PointsRequest(spec)))
+    assert response.status_code == 504
+    assert response.json() == {"detail": "Request took longer than 0.1s"}
+    blocked_calculate.set()
+    # Wait for the worker to notice it was cancelled
+    while service._in_pool:
+        time.sleep(0.01)
+
+
+def test_disconnect_cancels_calculation(blocked_calculate: threading.Event) -> None:
+    class Disconnected:
+        async def is_disconnected(self) -> bool:
+            return True
+
+    jobs = []
+
+    def func(job: Any) -> None:
+        jobs.append(job)
+        blocked_calculate.wait(timeout=5)
+        job.check()
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(service._run_heavy(cast(Request, Disconnected()), func))
+    assert excinfo.value.status_code == 499
+    assert jobs[0].cancelled.is_set()
+    blocked_calculate.set()
+    while service._in_pool:
+        time.sleep(0.01)
+
+
+def _brute_force_smallest_step(points: List[np.ndarray]) -> float:
+    diffs = [np.absolute(p[1:] - p[:-1]) for p in points]
+    norms = np.linalg.norm(diffs, axis=0)
+    return np.amin(norms[norms > 0.0])
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        Line("z", 0, 1.3, 3) * ~Line("y", 0.1, 7, 7) * Line("x", 3, 0.3, 11),
+        Line("z", 0.3, 0.7, 3) * ~Line("y", 0.1, 0.9, 7) * ~Line("x", 0.3, 1.7, 2),
+        Line("y", 0, 10, 30) * ~Line("x", 0, 10, 50) & Circle("x", "y", 5, 5, 4),
+        Spiral("x", "y", 0, 0, 10, 10, 500),
+        Line("y", 0, 1, 4) * Concat(Line("x", 0, 1, 4), Line("x", 1, 3, 3)),
+        Line("z", 0, 3, 4) * Zip(Line("y", 0, 1, 5), Line("x", 3, 1.1, 5)),
+    ],
+    ids=["raster", "snake", "mask", "spiral", "concat", "zip"],
+)
+@pytest.mark.parametrize("chunk_size", [3, STEP_CHUNK_SIZE])
+def test_smallest_step_matches_path(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch, spec: Spec, chunk_size: int
+) -> None:
+    monkeypatch.setattr(service, "STEP_CHUNK_SIZE", chunk_size)
+    midpoints = spec.frames().midpoints
+    response = client.post("/smalleststep", json=spec.serialize())
+    assert response.status_code == 200
+    # Exactly equal, and in the same order
+    assert list(response.json()["per_axis"].items()) == [
+        (axis, _brute_force_smallest_step([points]))
+        for axis, points in midpoints.items()
+    ]
+    assert response.json()["absolute"] == _brute_force_smallest_step(
+        list(midpoints.values())
+    )
+
+
+# DIMS STORE TEST(S) #
+@pytest.fixture
+def dims_store(tmp_path) -> Iterator[str]:
+    set_service_settings(ServiceSettings(dims_store=str(tmp_path)))
+    yield str(tmp_path)
+    set_service_settings(ServiceSettings())
+
+
+def test_dims_store_round_trip(tmp_path) -> None:
+    spec = Line("z", 0, 1, 2) * ~Line.bounded("x", 0, 1, 4) & Circle("x", "z", 0, 0, 1)
+    dims = spec.calculate()
+    store = service._DimsStore(str(tmp_path), max_bytes=1024 * 1024)
+    assert store.get("key") is None
+    store.put("key", dims)
+    loaded = store.get("key")
+    assert loaded is not None
+    assert [type(f) for f in loaded] == [type(f) for f in dims]
+    for actual, expected in zip(loaded, dims):
+        assert isinstance(actual.gap, np.memmap)
+        for field in ("midpoints", "lower", "upper"):
+            for axis, points in getattr(expected, field).items():
+                assert np.array_equal(getattr(actual, field)[axis], points)
+        assert np.array_equal(actual.gap, expected.gap)
+    expected_path = Path(dims).consume()
+    loaded_path = Path(loaded).consume()
+    assert np.array_equal(loaded_path.gap, expected_path.gap)
+    assert np.array_equal(loaded_path.lower["x"], expected_path.lower["x"])
+
+
+def test_dims_store_shared_between_processes(
+    client: TestClient, dims_store: str
+) -> None:
+    spec = Line("y", 0, 10, 30) * ~Line("x", 0, 10, 40)
+    request = asdict(PointsRequest(spec, max_frames=None))
+    expected = client.post("/midpoints", json=request).content
+    # Another process would have empty caches, but the same store
+    _dims_cache.clear()
+    _response_cache.clear()
+    assert client.post("/midpoints", json=request).content == expected
+    samples = _get_metrics(client)
+    assert samples['scanspec_stage_duration_seconds_count{stage="calculate"}'] == 1
+    assert len(os.listdir(dims_store)) == 2  # The dims and their lock file
+
+
+def test_dims_store_deletes_least_recently_used(tmp_path) -> None:
+    store = service._DimsStore(str(tmp_path), max_bytes=1024 * 1024)
+    dims = [Line("x", 0, 1, 10000).calculate() for _ in range(3)]
+    store.put("first", dims[0])
+    store.put("second", dims[1])
+    # Use the first so the second is least recently used
+    os.utime(os.path.join(tmp_path, "second"), (0, 0))
+    assert store.get("first") is not None
+    nbytes = sum(f.stat().st_size for f in os.scandir(tmp_path / "first"))
+    store.max_bytes = int(nbytes * 2.5)
+    store.put("third", dims[2])
+    assert store.get("first") is not None
+    assert store.get("second") is None
+    assert store.get("third") is not None
+
+
+def test_worker_app_uses_run_app_arguments(
+    monkeypatch: pytest.MonkeyPatch, tmp_path
+) -> None:
+    settings = ServiceSettings(workers=2, dims_store=str(tmp_path))
+    arguments = {"cors": False, "settings": asdict(settings)}
+    monkeypatch.setenv(service._WORKER_ENV, json.dumps(arguments))
+    try:
+        assert service._worker_app() is app
+        assert service._settings == settings
+        assert service._dims_store is not None
+        assert service._dims_store.directory == str(tmp_path)
+    finally:
+        set_service_settings(ServiceSettings())
+    assert service._dims_store is None
+
+
+# RESPONSE CACHE TEST(S) #
+def test_repeated_request_is_cached(client: TestClient) -> None:
+    request = asdict(PointsRequest(Line("x", 0, 1, 5) * Line("y", 0, 1, 5)))
+    headers = {"Accept-Encoding": "identity"}
+    first = client.post("/midpoints", json=request, headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert etag.startswith('"') and etag.endswith('"')
+    second = client.post("/midpoints", json=request, headers=headers)
+    assert second.headers["etag"] == etag
+    assert second.content == first.content
+    stats = client.get("/cachestats").json()
+    assert stats["responses"]["entries"] == 1
+    assert stats["responses"]["nbytes"] == len(first.content)
+    assert (stats["responses"]["hits"], stats["responses"]["misses"]) == (1, 1)
+    assert stats["responses"]["hit_rate"] == 0.5
+    # The dims were only calculated once
+    assert (stats["dims"]["hits"], stats["dims"]["misses"]) == (0, 1)
+
+
+@pytest.mark.parametrize("accept_encoding,weak", [("identity", False), ("gzip", True)])
+def test_if_none_match(client: TestClient, accept_encoding: str, weak: bool) -> None:
+    spec = Line("x", 0, 1, 5).serialize()
+    headers = {"Accept-Encoding": accept_encoding}
+    etag = client.post("/gap", json=spec, headers=headers).headers["etag"]
+    # Too small to compress, but with the same ETag as a 304 or compressed one
+    assert etag.startswith("W/") == weak
+    strong = etag[2:] if weak else etag
+    for if_none_match in (etag, f'"other", W/{strong}', "*"):
+        headers["If-None-Match"] = if_none_match
+        response = client.post("/gap", json=spec, headers=headers)
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.content == b""
+    response = client.post("/gap", json=spec, headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+    assert response.json() == {"gap": [True, False, False, False, False]}
+
+
+def test_etag_depends_on_request(client: TestClient) -> None:
+    spec = Line("x", 0, 1, 5)
+    requests = [
+        ("/midpoints", asdict(PointsRequest(spec)), {}),
+        ("/midpoints", asdict(PointsRequest(spec)), {"Accept": BINARY_MEDIA_TYPE}),
+        ("/midpoints", asdict(PointsRequest(spec, max_frames=3)), {}),
+        ("/midpoints", asdict(PointsRequest(spec, format=PointsFormat.STRING)), {}),
+        ("/midpoints", asdict(PointsRequest(spec, start=1)), {}),
+        ("/midpoints", asdict(PointsRequest(Line("x", 0, 1, 6))), {}),
+        ("/bounds", asdict(PointsRequest(spec)), {}),
+        ("/smalleststep", spec.serialize(), {}),
+    ]
+    etags = {client.post(r, json=j, headers=h).headers["etag"] for r, j, h in requests}
+    assert len(etags) == len(requests)
+
+
+def test_cached_binary_response(client: TestClient) -> None:
+    request = asdict(PointsRequest(Line("x", 0, 1, 5)))
+    headers = {"Accept": BINARY_MEDIA_TYPE}
+    first = client.post("/bounds", json=request, headers=headers)
+    second = client.post("/bounds", json=request, headers=headers)
+    assert _response_cache.hits == 1
+    assert second.content == first.content
+    assert second.headers["content-type"] == BINARY_MEDIA_TYPE
+    (message,) = decode_binary_points(second.content)
+    assert message["upper"]["x"] == pytest.approx([0.125, 0.375, 0.625, 0.875, 1.125])
+
+
+def test_response_cache_limit(client: TestClient) -> None:
+    set_service_settings(ServiceSettings(response_cache_bytes=100))
+    try:
+        for num in (5, 15, 100):
+            client.post("/gap", json=Line("x", 0, 1, num).serialize())
+        stats = client.get("/cachestats").json()["responses"]
+        # The largest response didn't fit, and one of the others was evicted
+        assert stats["entries"] == 1
+        assert stats["nbytes"] <= stats["max_bytes"] == 100
+    finally:
+        set_service_settings(ServiceSettings())
+
+
+# BATCH TEST(S) #
+def _post_batch(client: TestClient, items: List[BatchItem]) -> List[Any]:
+    request = asdict(BatchRequest(items))
+    with client.stream("POST", "/batch", json=request) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        return [json.loads(line) for line in response.iter_lines()]
+
+
+def test_batch_matches_routes(client: TestClient) -> None:
+    spec = Line("y", 0, 10, 3) * Line("x", 0, 10, 4)
+    items = [BatchItem(spec, operation=op) for op in BatchOperation] + [
+        BatchItem(spec, max_frames=5, format=PointsFormat.STRING),
+        BatchItem(spec, start=3, num=2, operation=BatchOperation.BOUNDS),
+    ]
+    results = _post_batch(client, items)
+    assert [r["index"] for r in results] == list(range(len(items)))
+    assert [r["operation"] for r in results] == [i.operation.value for i in items]
+    assert {r["status"] for r in results} == {200}
+    assert results[1]["result"] == {"shape": [3, 4]}
+    routes = {
+        0: ("/valid", spec.serialize()),
+        2: ("/midpoints", asdict(items[2])),
+        3: ("/bounds", asdict(items[3])),
+        4: ("/gap", spec.serialize()),
+        5: ("/smalleststep", spec.serialize()),
+        6: ("/midpoints", asdict(items[6])),
+        7: ("/bounds", asdict(items[7])),
+    }
+    for index, (route, json_) in routes.items():
+        assert results[index]["result"] == client.post(route, json=json_).json()
+
+
+def test_batch_reports_errors_in_place(client: TestClient) -> None:
+    set_service_settings(ServiceSettings(frame_budget=10))
+    try:
+        big, small = Line("x", 0, 1, 20), Line("x", 0, 1, 5)
+        ops = [BatchOperation.GAP, BatchOperation.VALID]
+        items = [BatchItem(spec, operation=op) for spec in (small, big) for op in ops]
+        results = _post_batch(client, items)
+    finally:
+        set_service_settings(ServiceSettings())
+    assert [r["status"] for r in results] == [200, 200, 413, 200]
+    assert results[2] == {
+        "index": 2,
+        "operation": "gap",
+        "status": 413,
+        "detail": "Request would generate 20 frames, more than the budget of 10",
+    }
+
+
+def test_batch_reports_calculation_errors_in_place(client: TestClient) -> None:
+    items = [
+        BatchItem(Line("x", 0, 1, 1), operation=BatchOperation.SMALLEST_STEP),
+        BatchItem(Line("x", 0, 1, 2), operation=BatchOperation.SMALLEST_STEP),
+    ]
+    results = _post_batch(client, items)
+    assert [r["status"] for r in results] == [500, 200]
+    assert results[0]["detail"] == "ValueError: Spec has no steps on some axes"
+
+
+def test_batch_reports_bugs(
+    client: TestClient,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    async def broken_body(http_request: Request, item: BatchItem) -> bytes:
+        if item.operation is BatchOperation.SHAPE:
+            raise TypeError("Bug")
+        return b"{}"
+
+    monkeypatch.setattr(service, "_batch_body", broken_body)
+    spec = Line("x", 0, 1, 2)
+    items = [
+        BatchItem(spec, operation=BatchOperation.SHAPE),
+        BatchItem(spec, operation=BatchOperation.VALID),
+    ]
+    results = _post_batch(client, items)
+    assert [r["status"] for r in results] == [500, 200]
+    assert results[0]["detail"] == "TypeError: Bug"
+    assert "Batch item 0 failed" in caplog.text
+
+
+def test_batch_calculates_repeated_specs_once(client: TestClient) -> None:
+    specs = [Line("x", 0, 1, num) for num in (5, 6, 7)]
+    ops = [
+        BatchOperation.SHAPE,
+        BatchOperation.MIDPOINTS,
+        BatchOperation.GAP,
+        BatchOperation.SMALLEST_STEP,
+    ]
+    items = [BatchItem(spec, operation=op) for op in ops for spec in specs] * 2
+    results = _post_batch(client, items)
+    assert len(results) == len(items)
+    assert results[: len(items) // 2] == [
+        {**r, "index": r["index"] - len(items) // 2} for r in results[len(items) // 2 :]
+    ]
+    assert _dims_cache.misses == len(specs)
+    assert _response_cache.misses == len(items) // 2
+
+
+def test_calculate_each_spec_once_across_threads(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    calls = []
+    calculate = Line.calculate
+
+    def slow_calculate(self, *args, **kwargs):
+        calls.append(self)
+        time.sleep(0.05)
+        return calculate(self, *args, **kwargs)
+
+    monkeypatch.setattr(Line, "calculate", slow_calculate)
+    spec = Line("x", 0, 1, 5)
+    with ThreadPoolExecutor(16) as executor:
+        stacks = list(executor.map(lambda _: service._calculate(spec), range(16)))
+    assert len(calls) == 1
+    assert all(stack is stacks[0] for stack in stacks)
+    assert service._calculating == {}
+
+
+def test_calculate_forgets_lock_of_failed_spec(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    def failed_calculate(self, *args, **kwargs):
+        raise ValueError("Failed")
+
+    monkeypatch.setattr(Line, "calculate", failed_calculate)
+    with pytest.raises(ValueError, match="Failed"):
+        service._calculate(Line("x", 0, 1, 5))
+    assert service._calculating == {}
+
+
 # VALIDATE SPEC TEST(S) #
 def test_validate_spec(client: TestClient) -> None:
     spec = Line.bounded("x", 0, 1, 5)
@@ -131,7 +996,251 @@ def test_validate_spec(client: TestClient) -> None:
     }
 
 
+@pytest.mark.parametrize(
+    "spec,detail",
+    [
+        (
+            Zip(Line("x", 0, 1, 4), Line("y", 0, 1, 3) * Line("z", 0, 1, 2)),
+            "Zip requires",
+        ),
+        (Zip(Line("x", 0, 1, 3), Line("y", 0, 1, 4)), "Zip sizes 3 != 4"),
+        (Concat(Line("x", 0, 1, 3), Line("y", 0, 1, 4)), "axes ['x'] != ['y']"),
+        (
+            step(Concat(Line("x", 0, 1, 3), Line("y", 0, 1, 4)), 0.1),
+            "axes ['x'] != ['y']",
+        ),
+    ],
+    ids=["zip dims", "zip sizes", "concat axes", "stepped concat axes"],
+)
+def test_validate_spec_details_of_spec_that_fails_to_calculate(
+    client: TestClient, spec: Spec, detail: str
+) -> None:
+    response = client.post("/valid", json=spec.serialize())
+    assert response.status_code == 200
+    response = client.post("/valid?details=true", json=spec.serialize())
+    assert response.status_code == 422
+    assert response.json()["detail"].startswith(detail)
+    response = client.post("/estimate", json=spec.serialize())
+    assert response.status_code == 422
+
+
 def test_validate_invalid_spec(client: TestClient) -> None:
     spec = {"type": "Line", "axis": "x", "start": 0.0, "num": 10}
     response = client.post("/valid", json=spec)
     assert response.status_code == 422
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        Line("y", 0, 10, 3) * ~Line("x", 0, 10, 4) & Circle("x", "y", 5, 5, 4),
+        Concat(Line("x", 0, 1, 2), Line("x", 5, 6, 3), gap=True),
+        step(Zip(Line("x", 0, 1, 5), Line("y", 2, 3, 5)), 0.1),
+    ],
+    ids=["masked snake", "concat", "zip"],
+)
+def test_validate_spec_is_canonical(client: TestClient, spec: Spec) -> None:
+    response = client.post("/valid", json=spec.serialize())
+    assert response.status_code == 200
+    canonical = Spec.deserialize(spec.serialize()).serialize()
+    assert response.json() == {"input_spec": canonical, "valid_spec": canonical}
+
+
+@pytest.mark.parametrize(
+    "spec,shape,duration",
+    [
+        (step(Line("y", 0, 1, 3) * Line("x", 0, 1, 4), 0.1), [3, 4, 1], 0.1),
+        (fly(Line("y", 0, 1, 3) * Line("x", 0, 1, 4), 0.2), [3, 4], 0.2),
+        (Repeat(2) * step(Line("x", 0, 1, 4), 0.5), [2, 4, 1], 0.5),
+        (Line("y", 0, 1, 3) * Line(DURATION, 0.1, 0.2, 4), [3, 4], None),
+        (
+            step(Line("x", 0, 1, 4), 0.1) * step(Line("y", 0, 1, 2), 0.1),
+            [4, 1, 2, 1],
+            None,
+        ),
+        (
+            Concat(step(Line("x", 0, 1, 2), 0.1), step(Line("x", 2, 3, 2), 0.1)),
+            [4],
+            0.1,
+        ),
+        (Line("x", 0, 1, 4), [4], None),
+    ],
+    ids=["step", "fly", "repeat", "line", "two durations", "concat", "no duration"],
+)
+def test_validate_spec_details(
+    client: TestClient, spec: Spec, shape: List[int], duration: Optional[float]
+) -> None:
+    response = client.post("/valid?details=true", json=spec.serialize())
+    assert response.status_code == 200
+    content = response.json()
+    assert content["shape"] == shape
+    assert content["duration"] == duration
+    dims = spec.calculate()
+    assert content["shape"] == [len(dim) for dim in dims]
+    assert content["duration"] == get_constant_duration(dims)
+
+
+# METRICS TEST(S) #
+def _get_metrics(client: TestClient) -> Dict[str, float]:
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    samples = {}
+    for line in response.text.splitlines():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_metrics_count_requests(client: TestClient) -> None:
+    spec = Line("y", 0, 10, 3) * Line("x", 0, 10, 4)
+    sizes = [
+        len(client.post("/midpoints", json=asdict(PointsRequest(spec))).content)
+        for _ in range(2)
+    ]
+    assert client.get("/nowhere").status_code == 404
+    samples = _get_metrics(client)
+    route = '{route="/midpoints",method="POST",status="200"}'
+    assert samples[f"scanspec_requests_total{route}"] == 2
+    assert (
+        samples['scanspec_requests_total{route="unmatched",method="GET",status="404"}']
+        == 1
+    )
+    assert samples['scanspec_response_bytes_total{route="/midpoints"}'] == sum(sizes)
+    # Buckets are cumulative, ending with every request
+    buckets = [
+        v
+        for k, v in samples.items()
+        if k.startswith('scanspec_request_duration_seconds_bucket{route="/midpoints"')
+    ]
+    assert len(buckets) == len(service.LATENCY_BUCKETS) + 1
+    assert buckets == sorted(buckets)
+    assert buckets[-1] == 2
+    assert samples['scanspec_request_duration_seconds_count{route="/midpoints"}'] == 2
+    assert samples['scanspec_request_duration_seconds_sum{route="/midpoints"}'] > 0
+
+
+def test_metrics_time_stages(client: TestClient) -> None:
+    spec = Line("y", 0, 10, 30) * Line("x", 0, 10, 40)
+    response = client.post(
+        "/midpoints", json=asdict(PointsRequest(spec, max_frames=100))
+    )
+    returned = len(response.json()["midpoints"]["x"])
+    # A repeated request is served from the response cache
+    client.post("/midpoints", json=asdict(PointsRequest(spec, max_frames=100)))
+    samples = _get_metrics(client)
+    counts = {
+        stage: samples[f'scanspec_stage_duration_seconds_count{{stage="{stage}"}}']
+        for stage in ("deserialize", "calculate", "downsample", "consume", "encode")
+    }
+    assert counts == {
+        "deserialize": 2,
+        "calculate": 1,
+        "downsample": 1,
+        "consume": 1,
+        "encode": 1,
+    }
+    assert samples["scanspec_frames_generated_total"] == returned
+
+
+def test_metrics_report_caches(client: TestClient) -> None:
+    for _ in range(3):
+        client.post("/gap", json=Line("x", 0, 1, 5).serialize())
+    samples = _get_metrics(client)
+    assert samples['scanspec_cache_hits_total{cache="responses"}'] == 2
+    assert samples['scanspec_cache_misses_total{cache="responses"}'] == 1
+    assert samples['scanspec_cache_hit_rate{cache="responses"}'] == pytest.approx(2 / 3)
+    assert samples['scanspec_cache_entries{cache="dims"}'] == 1
+    max_bytes = ServiceSettings().response_cache_bytes
+    assert samples['scanspec_cache_max_bytes{cache="responses"}'] == max_bytes
+
+
+# COMPRESSION TEST(S) #
+_GRID = Line("y", 0, 10, 30) * ~Line("x", 0, 10, 40)
+
+
+def test_large_response_is_compressed(client: TestClient) -> None:
+    request = asdict(PointsRequest(_GRID, max_frames=None))
+    plain = client.post("/midpoints", json=request, headers={"Accept-Encoding": ""})
+    assert "content-encoding" not in plain.headers
+    response = client.post("/midpoints", json=request)
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(plain.content) / 10
+    # Decoded by the client to the same bytes, with an equivalent ETag
+    assert response.content == plain.content
+    assert response.headers["etag"] == "W/" + plain.headers["etag"]
+    headers = {"If-None-Match": response.headers["etag"]}
+    assert client.post("/midpoints", json=request, headers=headers).status_code == 304
+
+
+@pytest.mark.parametrize(
+    "accept_encoding,settings",
+    [
+        ("identity", ServiceSettings()),
+        ("gzip;q=0", ServiceSettings()),
+        ("gzip", ServiceSettings(compress_min_bytes=None)),
+        ("gzip", ServiceSettings(compress_min_bytes=10 * 1024 * 1024)),
+    ],
+    ids=["identity", "refused", "disabled", "small"],
+)
+def test_response_not_compressed(
+    client: TestClient, accept_encoding: str, settings: ServiceSettings
+) -> None:
+    set_service_settings(settings)
+    try:
+        request = asdict(PointsRequest(_GRID, max_frames=None))
+        headers = {"Accept-Encoding": accept_encoding}
+        response = client.post("/midpoints", json=request, headers=headers)
+    finally:
+        set_service_settings(ServiceSettings())
+    assert "content-encoding" not in response.headers
+    assert int(response.headers["content-length"]) == len(response.content)
+
+
+def test_binary_response_is_compressed_with_zstd(client: TestClient) -> None:
+    zstandard = pytest.importorskip("zstandard")
+    request = asdict(PointsRequest(_GRID, max_frames=None))
+    response = client.post(
+        "/midpoints",
+        json=request,
+        headers={"Accept": BINARY_MEDIA_TYPE, "Accept-Encoding": "gzip, zstd"},
+    )
+    assert response.headers["content-encoding"] == "zstd"
+    data = zstandard.ZstdDecompressor().decompressobj().decompress(response.content)
+    (message,) = decode_binary_points(data)
+    assert np.array_equal(message["midpoints"]["x"], _GRID.frames().midpoints["x"])
+
+
+def test_streamed_chunks_are_compressed_separately() -> None:
+    sent: List[Any] = []
+
+    async def send(message: Any) -> None:
+        sent.append(message)
+
+    async def stream() -> None:
+        sender = service._CompressingSender(send, "gzip", min_bytes=1024)
+        await sender.send({"type": "http.response.start", "status": 200, "headers": []})
+        for line in (b"first\n", b"second\n"):
+            await sender.send(
+                {"type": "http.response.body", "body": line, "more_body": True}
+            )
+        await sender.send({"type": "http.response.body", "body": b""})
+
+    asyncio.run(stream())
+    assert (b"content-encoding", b"gzip") in sent[0]["headers"]
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    # Each chunk decodes to its line as soon as it arrives
+    lines = [decompressor.decompress(m["body"]) for m in sent[1:]]
+    assert lines == [b"first\n", b"second\n", b""]
+    assert decompressor.eof
+
+
+def test_compressed_stream(client: TestClient) -> None:
+    request = StreamRequest(_GRID, max_frames=None, chunk_frames=100)
+    response = client.post("/midpoints/stream", json=asdict(request))
+    assert response.headers["content-encoding"] == "gzip"
+    chunks = [json.loads(line) for line in response.text.splitlines()]
+    x = [p for c in chunks for p in c["midpoints"]["x"]]
+    assert x == pytest.approx(_GRID.frames().midpoints["x"])
@@ -4,10 +4,11 @@ from typing import Any, Tuple
 import pytest
 
 from scanspec.core import Path, SnakedFrames
-from scanspec.regions import Circle, Ellipse, Polygon, Rectangle
+from scanspec.regions import Circle, Ellipse, Polygon, Range, Rectangle
 from scanspec.specs import (
     DURATION,
     Concat,
+    DimSize,
     Line,
     Mask,
     Repeat,
@@ -618,3 +619,60 @@ def test_multiple_duration_frames():
     frames = spec.calculate()
     assert len(frames) == 2
     assert get_constant_duration(frames) is None
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        Line(x, 0, 1, 5),
+        Spiral(x, y, 0, 0, 1, 1, 20),
+        Line(z, 0, 1, 2) * ~Line(y, 0, 1, 3) * ~Line(x, 0, 1, 4),
+        3 * Repeat(2, gap=False) * ~Line(x, 0, 1, 4),
+        Line(y, 0, 1, 3) * Line(x, 0, 1, 4).zip(Static(z, 2)),
+        Line(y, 0, 1, 3).zip(Line(x, 0, 1, 3)),
+        fly(Line(y, 0, 1, 3) * Line(x, 0, 1, 4), 0.1),
+        step(Line(x, 0, 1, 4), 0.1, num=3),
+        Line(x, 0, 1, 3).concat(Line(x, 2, 4, 5)),
+        Squash(Line(y, 0, 1, 3) * ~Line(x, 0, 1, 4)),
+    ],
+)
+def test_exact_dim_sizes(spec: Spec) -> None:
+    expected = [DimSize(dim.axes(), len(dim)) for dim in spec.calculate()]
+    assert spec.dim_sizes() == expected
+
+
+@pytest.mark.parametrize(
+    "spec,message",
+    [
+        (Line(x, 0, 1, 3).zip(Line(y, 0, 1, 4)), "Zip sizes 3 != 4"),
+        (Line(x, 0, 1, 3).concat(Line(y, 0, 1, 4)), "axes ['x'] != ['y']"),
+    ],
+    ids=["zip", "concat"],
+)
+def test_dim_sizes_of_spec_that_fails_to_calculate(spec: Spec, message: str) -> None:
+    with pytest.raises(AssertionError, match=re.escape(message)):
+        spec.dim_sizes()
+
+
+@pytest.mark.parametrize(
+    "spec,exact",
+    [
+        (Line(y, 0, 1, 3) * Line(x, 0, 1, 5) & Circle(x, y, 0.5, 0.5, 0.4), [False]),
+        (
+            Line(z, 0, 1, 4) * Line(y, 0, 1, 3) * Line(x, 0, 1, 5)
+            & Rectangle(x, y, 0, 0, 0.5, 1),
+            [True, False],
+        ),
+        (Line(z, 0, 1, 4) * ~Line(x, 0, 1, 50) & Ellipse(x, z, 0, 0, 1, 1), [False]),
+        (Line(y, 0, 1, 6) * Line(x, 0, 1, 5) & Range(y, 0, 0.5), [False, True]),
+    ],
+)
+def test_masked_dim_sizes_are_most_frames(spec: Spec, exact: Any) -> None:
+    dims = spec.calculate()
+    sizes = spec.dim_sizes()
+    assert [s.axes for s in sizes] == [d.axes() for d in dims]
+    assert [s.exact for s in sizes] == exact
+    for size, dim in zip(sizes, dims):
+        assert size.num >= len(dim)
+        if size.exact:
+            assert size.num == len(dim)